@@ -177,7 +177,7 @@ export const analysisAdapter = {
             throw err;
         }
     },
-    getAnnotatedImageUrl(imageId) {
+    getAnnotatedImageUrl(imageId, sessionId) {
         if (APP_MODE === 'mock') {
             // Return a placeholder SVG with a red circle to simulate annotation
             const svg = `
@@ -188,6 +188,7 @@ export const analysisAdapter = {
 </svg>`;
             return `data:image/svg+xml;base64,${btoa(svg)}`;
         }
-        return `${RDK_API_BASE}/api/images/${imageId}/annotated`;
+        // Image ids are only unique within a session
+        return `${RDK_API_BASE}/api/images/${encodeURIComponent(imageId)}/annotated?session=${encodeURIComponent(sessionId)}`;
     }
 };
@@ -1,4 +1,5 @@
 import { RDK_API_BASE } from './config.js';
+import { hardwareAdapter } from './hardwareAdapter.js';
 
 const app = document.getElementById('app');
 
@@ -6,10 +7,11 @@ let uiState = {
     view: 'form',
     profile: { name: '', age: '', notes: '' },
     serverMode: 1,
-    lastImageTs: 0,
+    lastImageSeq: 0,
     currentImage: null,
     analysisResult: null,
-    processing: false
+    processing: false,
+    previewUrl: null
 };
 
 async function resetSession() {
@@ -31,16 +33,71 @@ async function uploadFile(file) {
     }
 }
 
+// Fallback when SSE is unavailable: conditional GET, 304 means nothing changed
+let stateEtag = null;
+
 async function pollState() {
     try {
-        const res = await fetch(`${RDK_API_BASE}/api/state`);
-        if (res.ok) {
+        const headers = stateEtag ? { 'If-None-Match': stateEtag } : {};
+        const res = await fetch(`${RDK_API_BASE}/api/state`, { headers });
+        if (res.status === 200) {
+            stateEtag = res.headers.get('ETag');
             handleServerUpdate(await res.json());
         }
     } catch (e) { console.error(e); }
     setTimeout(pollState, 1000);
 }
 
+// Server pushes a full snapshot on connect, then only the keys that changed
+let serverState = {};
+
+function subscribeState() {
+    if (!window.EventSource) {
+        pollState();
+        return;
+    }
+    const source = new EventSource(`${RDK_API_BASE}/api/events`);
+    source.addEventListener('state', (e) => {
+        const msg = JSON.parse(e.data);
+        serverState = { ...serverState, ...msg.changes };
+        handleServerUpdate(serverState);
+    });
+    source.onerror = () => {
+        // EventSource retries by itself; only fall back to polling once it gives up
+        if (source.readyState === EventSource.CLOSED) pollState();
+    };
+}
+
+// Mode 2 live overlay: tracked lesion boxes pushed by /api/live, open only while it is on screen
+let liveSource = null;
+
+function updateLive() {
+    const wanted = uiState.view === 'monitor' && uiState.serverMode === 2 && uiState.previewUrl && window.EventSource;
+    if (wanted && !liveSource) {
+        liveSource = new EventSource(`${RDK_API_BASE}/api/live`);
+        liveSource.addEventListener('tracks', (e) => drawLive(JSON.parse(e.data)));
+    } else if (!wanted && liveSource) {
+        liveSource.close();
+        liveSource = null;
+    }
+}
+
+function drawLive(msg) {
+    const overlay = document.getElementById('live-overlay');
+    if (!overlay) return;
+    // Boxes in frame pixels, placed in percent so they follow the scaled preview
+    overlay.innerHTML = msg.tracks.map(t => {
+        const [x1, y1, x2, y2] = t.bbox;
+        const label = t.class ? `${t.class} ${(t.confidence * 100).toFixed(0)}%` : '...';
+        return `<div style="position:absolute; left:${x1 / msg.width * 100}%; top:${y1 / msg.height * 100}%;
+                    width:${(x2 - x1) / msg.width * 100}%; height:${(y2 - y1) / msg.height * 100}%;
+                    border:2px solid #a855f7; border-radius:4px;">
+                    <span style="position:absolute; top:-1.4em; left:0; background:#a855f7; color:#fff;
+                        font-size:12px; padding:0 4px; border-radius:3px; white-space:nowrap;">${label}</span>
+                </div>`;
+    }).join('');
+}
+
 function handleServerUpdate(server) {
     let needsRender = false;
 
@@ -49,10 +106,11 @@ function handleServerUpdate(server) {
         needsRender = true;
     }
 
-    if (server.last_image_ts > uiState.lastImageTs) {
-        uiState.lastImageTs = server.last_image_ts;
+    // Capture sequence, not the timestamp: two captures can land in the same second
+    if (server.last_image_url && server.last_image_seq !== uiState.lastImageSeq) {
+        uiState.lastImageSeq = server.last_image_seq;
         const url = server.last_image_url.startsWith('http') ? server.last_image_url : `${RDK_API_BASE}/${server.last_image_url}`;
-        uiState.currentImage = `${url}?t=${server.last_image_ts}`;
+        uiState.currentImage = url;  // carries ?v=<content version>, no cache-busting needed
         if (uiState.serverMode === 2) uiState.analysisResult = null;
         needsRender = true;
     }
@@ -80,7 +138,8 @@ function handleFormSubmit(e) {
     e.preventDefault();
     const fd = new FormData(e.target);
     uiState.profile = { name: fd.get('name'), age: fd.get('age'), notes: fd.get('notes') };
-    resetSession().then(() => {
+    Promise.all([resetSession(), hardwareAdapter.getCameraPreviewStream()]).then(([, previewUrl]) => {
+        uiState.previewUrl = previewUrl;
         uiState.view = 'monitor';
         uiState.currentImage = null;
         uiState.analysisResult = null;
@@ -133,6 +192,14 @@ function renderMonitor() {
                     <button class="btn secondary" onclick="document.getElementById('file-upload').click()">Upload Photo</button>
                 </div>` : ''}
             </div>
+            ${uiState.previewUrl ? `
+            <div style="margin-top:15px;">
+                <h4>Live Preview</h4>
+                <div style="position:relative; max-width:640px;">
+                    <img src="${uiState.previewUrl}" alt="Camera preview" style="display:block; width:100%; border-radius:8px; background:#000;">
+                    ${!isMode1 ? `<div id="live-overlay" style="position:absolute; inset:0; pointer-events:none;"></div>` : ''}
+                </div>
+            </div>` : ''}
         </div>
     `;
 
@@ -162,7 +229,7 @@ function renderMonitor() {
         
         if (!isMode1 && uiState.analysisResult && uiState.analysisResult.annotatedUrl) {
             const annoUrl = uiState.analysisResult.annotatedUrl.startsWith('http') ? uiState.analysisResult.annotatedUrl : `${RDK_API_BASE}/${uiState.analysisResult.annotatedUrl}`;
-            html += `<div><h4>Analysis Result</h4><img src="${annoUrl}?t=${Date.now()}" style="width:100%; border-radius:8px;"></div>`;
+            html += `<div><h4>Analysis Result</h4><img src="${annoUrl}" style="width:100%; border-radius:8px;"></div>`;
         }
         
         html += `</div></div>`;
@@ -178,7 +245,8 @@ function renderMonitor() {
             if (e.target.files.length) uploadFile(e.target.files[0]);
         };
     }
+    updateLive();
 }
 
-pollState();
+subscribeState();
 renderForm();
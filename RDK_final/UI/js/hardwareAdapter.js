@@ -13,5 +13,6 @@ export const hardwareAdapter = {
     async deleteImage() {},
     onHardwareButtonPress() { return () => {}; },
     simulateButtonPress() {},
-    async getCameraPreviewStream() { return null; }
+    // MJPEG stream (use as an <img> src); the server only encodes while someone is watching
+    async getCameraPreviewStream() { return `${RDK_API_BASE}/api/preview.mjpg`; }
 };
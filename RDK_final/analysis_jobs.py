@@ -0,0 +1,290 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import quote, unquote, urlparse
+
+import cv2
+import numpy as np
+
+from image_writer import atomic_write
+from metrics import METRICS
+
+# Model labels -> classes used by the UI (analysisSummary.js CLASS_NAMES)
+UI_CLASSES = {'skin_cancer': 'skin_cancer', 'eczema': 'rash', 'unknown': 'normal'}
+SEVERITY = ['normal', 'rash', 'skin_cancer']
+LEVELS = {'normal': 'green', 'rash': 'yellow', 'skin_cancer': 'red'}
+SUMMARIES = {
+    'green': 'No concerning patterns identified.',
+    'yellow': 'Review recommended; patterns observed.',
+    'red': 'Priority follow-up suggested based on captured patterns.',
+}
+GUIDANCE = 'Consider professional review if concerns persist or changes are observed.'
+
+
+class AnalysisJobs:
+    """Session analysis jobs for /api/analysis/*, run on the shared InferenceExecutor.
+
+    Finished jobs (and the annotated images they index) are evicted ttl seconds
+    after their last update. With a CaptureStore, annotated images count against its
+    budget and are protected from eviction while their job is kept.
+    """
+
+    def __init__(self, engine, executor, static_dir='UI', output_dir='UI/captures', ttl=900, result_cache=None,
+                 store=None):
+        self.engine = engine
+        self.store = store
+        if store is not None:
+            store.add_references(self._referenced_files)
+        self.executor = executor
+        self.result_cache = result_cache
+        self.static_dir = os.path.realpath(static_dir)
+        self.output_dir = output_dir
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.annotated = {}  # (sessionId, imageId) -> annotated file path; clients pick their own ids
+
+    def submit(self, session_id, payload):
+        """Queue a session. Returns the job id, or None if the inference queue is full.
+
+        Raises ValueError for malformed payloads and ones without any analyzable image.
+        """
+        images_by_area = payload.get('images') if isinstance(payload, dict) else None
+        if not isinstance(images_by_area, dict):
+            raise ValueError("'images' must map areas to lists of images")
+        items = []
+        for area, images in images_by_area.items():
+            if not isinstance(images, (list, type(None))):
+                raise ValueError(f"images of '{area}' must be a list")
+            for img in images or []:
+                if not isinstance(img, dict):
+                    raise ValueError(f"images of '{area}' must be objects")
+                if not img.get('url'):
+                    continue
+                if not isinstance(img['url'], str):
+                    raise ValueError(f"image url must be a string: {img['url']!r}")
+                items.append({
+                    'id': str(img.get('id') or uuid.uuid4().hex[:8]),
+                    'area': area,
+                    'url': img['url'],
+                    'capturedAt': img.get('capturedAt'),
+                })
+        if not items:
+            raise ValueError('No images to analyze')
+
+        job_id = f"JOB-{uuid.uuid4().hex[:12]}"
+        record = {
+            'id': job_id,
+            'sessionId': session_id,
+            'status': 'queued',
+            'progress': 0.0,
+            'step': 'Queued',
+            'error': None,
+            'result': None,
+            'images': [item['id'] for item in items],
+            'updated': time.time(),
+        }
+        with self.lock:
+            self._evict()
+            self.jobs[job_id] = record
+
+        if self.executor.submit(self._run, job_id, session_id, items) is None:
+            with self.lock:
+                del self.jobs[job_id]
+            return None
+        return job_id
+
+    def status(self, job_id):
+        with self.lock:
+            self._evict()
+            record = self.jobs.get(job_id)
+            if record is None:
+                return None
+            return {k: record[k] for k in ('status', 'progress', 'step', 'error')}
+
+    def result(self, job_id):
+        with self.lock:
+            self._evict()
+            return self.jobs.get(job_id)
+
+    def annotated_path(self, session_id, image_id):
+        with self.lock:
+            return self.annotated.get((session_id, image_id))
+
+    def _referenced_files(self):
+        with self.lock:
+            return list(self.annotated.values())
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            record = self.jobs.get(job_id)
+            if record is not None:
+                record.update(fields, updated=time.time())
+
+    def _evict(self):
+        now = time.time()
+        expired = [jid for jid, r in self.jobs.items()
+                   if r['status'] in ('done', 'failed') and now - r['updated'] > self.ttl]
+        if not expired:
+            return
+        gone = set()
+        for jid in expired:
+            record = self.jobs.pop(jid)
+            gone.update((record['sessionId'], image_id) for image_id in record['images'])
+        # A newer job of the same session may have rewritten (and still index) the same image
+        kept = {(r['sessionId'], image_id) for r in self.jobs.values() for image_id in r['images']}
+        for key in gone - kept:
+            self.annotated.pop(key, None)
+
+    def load_bytes(self, url):
+        """Encoded payload image: data: URL, or a URL/path under the static folder"""
+        if url.startswith('data:'):
+            return base64.b64decode(url.split(',', 1)[1])
+
+        rel = unquote(urlparse(url).path).lstrip('/')
+        path = os.path.realpath(os.path.join(self.static_dir, rel))
+        if not path.startswith(self.static_dir + os.sep):
+            raise ValueError(f"Image outside static folder: {url}")
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _run(self, job_id, session_id, items):
+        engine = self.engine  # a model swap mid-job must not mix versions
+        try:
+            self._update(job_id, status='running', step='Loading images', progress=0.05)
+            version = engine.result_version() if self.result_cache is not None else None
+            # Re-submitted sessions mostly contain images analyzed before: only run the misses
+            loaded, cached, misses = [], {}, []
+            for item in items:
+                data = self.load_bytes(item['url'])
+                if data is None:
+                    print(f"[Analysis] Could not read {item['url']}")
+                    continue
+                key = self.result_cache.key(data, version) if version else None
+                entry = self.result_cache.get(key) if key else None
+                if entry is not None:
+                    cached[item['id']] = entry
+                else:
+                    with METRICS.time('decode'):
+                        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                    if img is None:
+                        print(f"[Analysis] Could not decode {item['url']}")
+                        continue
+                    misses.append((item, img, key))
+                loaded.append(item)
+            if not loaded:
+                raise ValueError('None of the images could be read')
+
+            def progress(step, fraction):
+                self._update(job_id, step=step, progress=fraction)
+
+            if misses:
+                results = engine.analyze([img for _, img, _ in misses], progress=progress)
+                for (item, img, key), preds in zip(misses, results):
+                    annotated = engine.annotate(img, preds)
+                    with METRICS.time('jpeg_write'):
+                        ok, buf = cv2.imencode('.jpg', annotated)
+                    if not ok:
+                        print(f"[Analysis] Could not encode the annotated image of {item['url']}")
+                        continue
+                    cached[item['id']] = entry = {'status': engine.image_status(preds),
+                                                  'predictions': preds, 'annotated': buf.tobytes()}
+                    if key:
+                        self.result_cache.put(key, entry)
+
+            loaded = [item for item in loaded if item['id'] in cached]
+            if not loaded:
+                raise ValueError('None of the images could be analyzed')
+
+            self._update(job_id, step='Aggregating results', progress=0.9)
+            predictions = []
+            for item in loaded:
+                entry = cached[item['id']]
+                annotated_path = os.path.join(self.output_dir, self._annotated_name(session_id, item['id']))
+                if self.store is not None:
+                    self.store.write(annotated_path, entry['annotated'])
+                else:
+                    atomic_write(annotated_path, entry['annotated'])
+                with self.lock:
+                    self.annotated[(session_id, item['id'])] = annotated_path
+                predictions.append(self._image_prediction(session_id, item, entry['predictions']))
+
+            result = self._build_result(predictions, engine)
+            self._update(job_id, status='done', step='Aggregating results', progress=1.0, result=result)
+            print(f"[Analysis] {job_id}: {len(loaded)} image(s) done, {len(loaded) - len(misses)} from cache")
+        except Exception as e:
+            print(f"[Analysis] {job_id} failed: {e}")
+            self._update(job_id, status='failed', error=str(e))
+
+    @staticmethod
+    def _annotated_name(session_id, image_id):
+        # Client ids are free-form: a digest of the key can't collide with another pair or a capture name
+        digest = hashlib.sha1(f"{session_id}\0{image_id}".encode()).hexdigest()[:20]
+        return f"analysis_{digest}_annotated.jpg"
+
+    @staticmethod
+    def _image_prediction(session_id, item, preds):
+        # The most severe lesion decides the image class
+        worst, confidence = 'normal', 1.0
+        if preds:
+            severity, confidence = max((SEVERITY.index(UI_CLASSES.get(p['class'], 'normal')), p['confidence'])
+                                       for p in preds)
+            worst = SEVERITY[severity]
+        return {
+            'imageId': item['id'],
+            'area': item['area'],
+            'predictedClass': worst,
+            'confidence': round(float(confidence), 4),
+            'capturedAt': item['capturedAt'],
+            'imageUrl': None if item['url'].startswith('data:') else item['url'],
+            'annotatedUrl': f"api/images/{quote(item['id'], safe='')}/annotated?session={quote(session_id, safe='')}",
+            'lesions': preds,
+        }
+
+    def _build_result(self, predictions, engine):
+        by_area = {}
+        for area in sorted({p['area'] for p in predictions} | {'face', 'arm'}):
+            area_preds = [p for p in predictions if p['area'] == area]
+            if not area_preds:
+                by_area[area] = {'consistency': None, 'confidence': None, 'features': [],
+                                 'guidance': GUIDANCE, 'text': 'No images captured.', 'thumbnailUrl': None}
+                continue
+            consistency = round(float(np.mean([p['confidence'] for p in area_preds])) * 100, 1)
+            lesions = Counter(l['class'] for p in area_preds for l in p['lesions'])
+            features = [f"{n} region(s) classified as {cls}" for cls, n in lesions.most_common()]
+            by_area[area] = {
+                'consistency': consistency,
+                'confidence': consistency,
+                'features': features or ['No lesion regions detected'],
+                'guidance': GUIDANCE,
+                'text': 'Patterns observed; consider professional review if concerns persist.'
+                        if features else 'No lesion regions detected.',
+                'thumbnailUrl': area_preds[0]['annotatedUrl'],
+            }
+
+        primary = max((p['predictedClass'] for p in predictions), key=SEVERITY.index, default='normal')
+        level = LEVELS[primary]
+        scored = [a['consistency'] for a in by_area.values() if a['consistency'] is not None]
+        return {
+            'overall': {
+                'level': level,
+                'summary': SUMMARIES[level],
+                'consistency': round(float(np.mean(scored))) if scored else None,
+                'primaryDetectedClass': primary,
+            },
+            'byArea': by_area,
+            'predictions': predictions,
+            'meta': {
+                'modelVersion': engine.version,
+                'modelVariant': engine.variant,
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+            },
+        }
@@ -1,40 +1,255 @@
 import os
-import glob
+import functools
+import hashlib
+import json
+import threading
 import time
-from flask import Flask, send_from_directory, jsonify, request
+import uuid
+from flask import Flask, Response, send_file, send_from_directory, jsonify, request
 from flask_cors import CORS
-from hardware_manager import HardwareManager
-from inference import ModelInference
+from werkzeug.utils import safe_join
+from capture_store import IMMUTABLE, CaptureStore, file_version
+from inference_executor import InferenceExecutor
+from metrics import METRICS
+from result_cache import ResultCache
+from startup import Startup
+
+# Staged startup: only cheap objects are built here, so the server answers right away.
+# Models, warm-up, camera/GPIO and the capture cleanup run on background threads
+# (OpenCV and ONNX Runtime are imported there too); /api/health reports progress and
+# endpoints answer 503 + Retry-After until what they need is ready.
+startup = Startup()
+started_at = time.time()
 
 app = Flask(__name__, static_folder='UI')
 CORS(app)
 
-# Clean up old captures on startup
-def clean_captures():
-    files = glob.glob('UI/captures/*')
-    for f in files:
-        try:
-            os.remove(f)
-        except:
-            pass
-    print("[App] Cleaned old captures.")
+# Captures stay within RDK_CAPTURE_MAX_MB / RDK_CAPTURE_MAX_AGE_H (0 = no age limit), oldest evicted first.
+# Old captures are removed on startup unless RDK_CAPTURE_KEEP=1.
+store = CaptureStore(
+    'UI/captures',
+    max_bytes=int(os.environ.get('RDK_CAPTURE_MAX_MB', 1024)) << 20,
+    max_age=float(os.environ.get('RDK_CAPTURE_MAX_AGE_H', 0)) * 3600,
+)
 
-clean_captures()
+# Inference workers: RDK_AI_QUEUE_POLICY=latest keeps only the newest pending capture, reject returns 503
+executor = InferenceExecutor(
+    workers=int(os.environ.get('RDK_AI_WORKERS', 1)),
+    max_queue=int(os.environ.get('RDK_AI_QUEUE', 2)),
+    policy=os.environ.get('RDK_AI_QUEUE_POLICY', 'latest'),
+)
+
+# Results keyed by image hash + model/threshold version; RDK_RESULT_CACHE_DIR= disables the disk tier.
+# Kept outside UI/ (the static folder): cached annotated images must not be downloadable by hash
+cache_dir = os.environ.get('RDK_RESULT_CACHE_DIR', 'cache/results')
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('RDK_RESULT_CACHE_ENTRIES', 256)),
+    max_bytes=int(os.environ.get('RDK_RESULT_CACHE_MB', 32)) << 20,
+    disk_dir=cache_dir or None,
+    disk_bytes=int(os.environ.get('RDK_RESULT_CACHE_DISK_MB', 200)) << 20,
+)
 
-# Load AI
 model_det = 'best_det.onnx'
 model_cls = 'best_cls.onnx'
+
+# Set by the startup steps below
+models = None
 inference_engine = None
-if os.path.exists(model_det) and os.path.exists(model_cls):
-    try:
-        inference_engine = ModelInference(model_det, model_cls)
-        print("[App] AI Models Loaded")
-    except Exception as e:
-        print(f"[App] AI Load Failed: {e}")
+hw = None
+preview = None
+live = None
+analysis_jobs = None
+thumbs = None
+engine_lock = threading.Lock()  # models may finish before or after their users exist
+
+def prepare_captures():
+    if os.environ.get('RDK_CAPTURE_KEEP') == '1':
+        print(f"[App] Keeping {store.scan()} capture(s).")
+    else:
+        # Only files from before this start: a capture taken meanwhile stays
+        print(f"[App] Cleaned {store.clear(before=started_at)} old capture(s).")
+    store.start()
+
+def use_engine(engine):
+    """Hand a (new) model version to its users; running jobs keep the engine they started with"""
+    global inference_engine
+    with engine_lock:
+        inference_engine = engine
+        if hw:
+            hw.inference_engine = engine
+        if analysis_jobs:
+            analysis_jobs.engine = engine
+        if live:
+            live.engine = engine
+
+def load_models():
+    # Versions under RDK_MODEL_DIR/<version>/ are picked up while running; the files here are 'default'.
+    # RDK_SHADOW_SAMPLE > 0 loads new versions as a shadow candidate run on that fraction of analyses.
+    global models
+    from model_registry import ModelRegistry  # pulls in ONNX Runtime
+
+    registry = ModelRegistry(os.environ.get('RDK_MODEL_DIR', 'models'), default=(model_det, model_cls),
+                             on_swap=use_engine, shadow=float(os.environ.get('RDK_SHADOW_SAMPLE', 0)),
+                             interval=float(os.environ.get('RDK_MODEL_POLL_S', 5)))
+    registry.load_initial(warmup=False)  # the warmup step follows
+    print("[App] AI Models Loaded")
+    models = registry
+    registry.start()
+
+def start_hardware():
+    # Init Hardware; RDK_CAMERA_SOURCE=synthetic (or an image folder / video) runs without a camera.
+    # The camera itself is opened (and probed) on the grabber thread, see wait_for_camera.
+    global hw, preview, live
+    from camera import camera_from_source
+    from hardware_manager import HardwareManager
+    from live_analysis import LiveAnalyzer
+    from preview import PreviewStreamer
+
+    camera = camera_from_source(os.environ.get('RDK_CAMERA_SOURCE', ''))
+    with engine_lock:
+        manager = HardwareManager(inference_engine=inference_engine, capture_dir='UI/captures', executor=executor,
+                                  result_cache=result_cache, camera=camera, store=store)
+        hw = manager
+    manager.start()
+
+    # Live preview from the grabber's frames, encoded once for all viewers
+    preview = PreviewStreamer(manager.camera,
+                              width=int(os.environ.get('RDK_PREVIEW_WIDTH', 640)),
+                              fps=float(os.environ.get('RDK_PREVIEW_FPS', 10)),
+                              quality=int(os.environ.get('RDK_PREVIEW_QUALITY', 70)))
+
+    # Tracked lesion boxes for the live overlay; model calls bounded by RDK_LIVE_MAX_CALLS per second
+    with engine_lock:
+        live = LiveAnalyzer(manager.camera, engine=inference_engine,
+                            fps=float(os.environ.get('RDK_LIVE_FPS', 10)),
+                            detect_every=int(os.environ.get('RDK_LIVE_DETECT_EVERY', 5)),
+                            max_calls_per_s=float(os.environ.get('RDK_LIVE_MAX_CALLS', 4)),
+                            busy=lambda: manager.state['is_processing'])
 
-# Init Hardware
-hw = HardwareManager(inference_engine=inference_engine, capture_dir='UI/captures')
-hw.start()
+def wait_for_camera():
+    # Ready with the first frame. Uploads and analysis work without a camera, so this step is optional:
+    # after RDK_CAMERA_WAIT_S it fails (health reports it as degraded) and turns ready if a camera shows up
+    deadline = time.monotonic() + float(os.environ.get('RDK_CAMERA_WAIT_S', 30))
+    while hw.camera.latest(wait=min(5.0, max(0.0, deadline - time.monotonic()))) is None:
+        if time.monotonic() >= deadline:
+            threading.Thread(target=camera_late, name="startup-camera-late", daemon=True).start()
+            raise RuntimeError("No camera frame yet, the grabber keeps retrying")
+
+def camera_late():
+    while hw.camera.latest(wait=5.0) is None:
+        pass
+    startup.mark('camera')
+    print("[Startup] camera ready")
+
+def start_analysis_jobs():
+    # Session analysis jobs (UI analysisAdapter.js contract)
+    global analysis_jobs
+    from analysis_jobs import AnalysisJobs
+
+    with engine_lock:
+        analysis_jobs = AnalysisJobs(inference_engine, executor, static_dir='UI', output_dir='UI/captures',
+                                     ttl=int(os.environ.get('RDK_JOB_TTL', 900)), result_cache=result_cache,
+                                     store=store)
+
+def start_thumbnails():
+    # Resized WebP/JPEG copies of captures for list views, LRU on disk
+    global thumbs
+    from thumbnails import ThumbnailCache
+
+    thumbs = ThumbnailCache('UI', os.environ.get('RDK_THUMB_DIR', 'UI/thumb_cache'),
+                            max_bytes=int(os.environ.get('RDK_THUMB_CACHE_MB', 64)) << 20)
+
+startup.run('captures', prepare_captures)
+startup.run('models', load_models)
+startup.run('warmup', lambda: inference_engine.warmup(), after=('models',))
+startup.run('hardware', start_hardware)
+startup.run('camera', wait_for_camera, after=('hardware',), required=False)
+startup.run('analysis', start_analysis_jobs)
+startup.run('thumbnails', start_thumbnails)
+
+def requires(*steps):
+    """503 with Retry-After until the given startup steps are ready"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            for step in steps:
+                status = startup.status(step)
+                if status != 'ready':
+                    res = jsonify({'error': f"Not available: {step} {status}", 'health': '/api/health'})
+                    return res, 503, {'Retry-After': '1'}
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def collect_metrics():
+    ex = executor.info()
+    cache = result_cache.info()
+    captures = store.info()
+    health = startup.info()
+    rows = [
+        ('startup_ready', 'gauge', '1 once a startup step has completed',
+         [({'step': name}, int(s['status'] == 'ready')) for name, s in health['steps'].items()]),
+        ('startup_step_seconds', 'gauge', 'Time a startup step took',
+         [({'step': name}, s['duration_ms'] / 1000) for name, s in health['steps'].items() if 'duration_ms' in s]),
+        ('executor_queue_depth', 'gauge', 'Inference jobs waiting', [({}, ex['queued'])]),
+        ('executor_running', 'gauge', 'Inference jobs running', [({}, ex['running'])]),
+        ('executor_jobs_total', 'counter', 'Inference jobs by outcome',
+         [({'status': k}, ex.get(k, 0)) for k in ('submitted', 'done', 'failed', 'dropped', 'rejected', 'stale')]),
+        ('capture_store_bytes', 'gauge', 'Bytes used by captures', [({}, captures['bytes'])]),
+        ('capture_store_files', 'gauge', 'Files in the capture folder', [({}, captures['files'])]),
+        ('capture_store_evicted_total', 'counter', 'Captures removed by the retention policy',
+         [({}, captures.get('evicted', 0))]),
+        ('result_cache_total', 'counter', 'Result cache lookups',
+         [({'result': k}, cache.get(k, 0)) for k in ('hits', 'misses', 'evictions')]),
+    ]
+    if startup.status('hardware') == 'ready':
+        cam = hw.camera.stats()
+        buttons = hw.buttons.info()
+        live_info = live.info()
+        with hw.lock:
+            processing = hw.state['is_processing']
+        rows += [
+            ('processing', 'gauge', '1 while a capture is being analyzed', [({}, int(processing))]),
+            ('camera_healthy', 'gauge', '1 while the camera delivers frames', [({}, int(cam['healthy']))]),
+            ('camera_fps', 'gauge', 'Camera frames per second', [({}, cam['fps'])]),
+            ('camera_frame_age_seconds', 'gauge', 'Age of the newest camera frame',
+             [({}, cam['last_frame_age_ms'] / 1000 if cam['last_frame_age_ms'] is not None else None)]),
+            ('camera_reconnects_total', 'counter', 'Camera reconnects', [({}, cam['reconnects'])]),
+            ('preview_clients', 'gauge', 'Connected preview viewers', [({}, preview.info()['clients'])]),
+            ('live_clients', 'gauge', 'Connected live analysis viewers', [({}, live_info['clients'])]),
+            ('live_model_calls_per_second', 'gauge', 'Live analysis ONNX calls per second (last 10 s)',
+             [({}, live_info['calls_per_s'])]),
+            ('live_model_calls_total', 'counter', 'Live analysis ONNX calls',
+             [({'model': 'detector'}, live_info.get('detector_calls', 0)),
+              ({'model': 'classifier'}, live_info.get('classifier_calls', 0))]),
+            ('image_writer_pending', 'gauge', 'JPEG writes waiting', [({}, hw.writer.pending())]),
+            ('button_presses_total', 'counter', 'Button presses by GPIO pin',
+             [({'pin': pin}, n) for pin, n in buttons['presses'].items()]),
+            ('button_events_dropped_total', 'counter', 'Presses dropped on a full event queue',
+             [({}, buttons['dropped'])]),
+        ]
+    if startup.status('thumbnails') == 'ready':
+        thumb = thumbs.info()
+        rows += [
+            ('thumbnail_total', 'counter', 'Thumbnail requests',
+             [({'result': k}, thumb.get(k, 0)) for k in ('hits', 'generated', 'evictions')]),
+            ('thumbnail_cache_bytes', 'gauge', 'Thumbnail cache size on disk', [({}, thumb['bytes'])]),
+        ]
+    if startup.status('models') == 'ready':
+        shadow = models.shadow_info() or {}
+        rows += [
+            ('model_active', 'gauge', 'Model version in use (1) and shadow candidate (0)',
+             [({'version': e.version, 'variant': e.variant}, int(e is models.current))
+              for e in (models.current, models.candidate) if e is not None]),
+            ('model_swaps_total', 'counter', 'Model versions swapped in while running', [({}, models.stats['swaps'])]),
+            ('shadow_runs_total', 'counter', 'Analyses re-run on the shadow candidate',
+             [({'result': k}, shadow.get(k, 0)) for k in ('runs', 'dropped', 'failed')]),
+            ('shadow_agreement', 'gauge', 'Shadow candidate agreement with the current model',
+             [({'metric': k}, shadow.get(k)) for k in ('detection_f1', 'class_agreement', 'status_agreement')]),
+        ]
+    return rows
+
+METRICS.register(collect_metrics)
 
 @app.route('/')
 def index():
@@ -42,18 +257,155 @@ def index():
 
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory('UI', path)
+    res = send_from_directory('UI', path)
+    # ?v= from a versioned URL (last_image_url, annotatedUrl) that still matches the file: never changes
+    v = request.args.get('v')
+    if v and v == file_version(safe_join('UI', path)):
+        res.headers['Cache-Control'] = IMMUTABLE
+    return res
+
+@app.route('/api/thumb/<path:path>')
+@requires('thumbnails')
+def thumbnail(path):
+    """Resized copy of UI/<path>: ?w= width (rounded up to a cached size), ?fmt=webp|jpeg.
+
+    The ETag is the derivative's hashed name. Passing it, or the source's file_version
+    (the ?v= of a versioned capture URL), back as ?v= gets a response that may be cached
+    as immutable: both change whenever the source does.
+    """
+    width = thumbs.bucket(request.args.get('w', 320, type=int))
+    fmt = thumbs.pick_format(request.args.get('fmt'), request.headers.get('Accept', ''))
+    found = thumbs.get(path, width, fmt)
+    if found is None:
+        return jsonify({'error': 'Image not found'}), 404
+
+    file_path, name, mimetype = found
+    res = send_file(os.path.abspath(file_path), mimetype=mimetype, etag=name, conditional=True)
+    if request.args.get('v') in (name, thumbs.source_version(path)):
+        res.headers['Cache-Control'] = IMMUTABLE
+    else:
+        res.headers['Cache-Control'] = 'no-cache'
+    if 'fmt' not in request.args:
+        res.vary.add('Accept')
+    return res
+
+# Keys pushed over /api/events; anything else is only in /api/state
+EVENT_KEYS = ('mode', 'last_image_url', 'last_image_ts', 'last_image_seq', 'is_processing', 'analysis_result', 'session_active')
+EVENT_HEARTBEAT = 15
 
 @app.route('/api/state')
+@requires('hardware')
 def get_state():
-    return jsonify(hw.get_state())
+    version, state = hw.get_versioned_state()
+    ex = executor.info()
+    cache = result_cache.info()
+    # Cheap validator: no need to serialize the (possibly large) result to answer a 304
+    etag = hashlib.md5(repr((version, sorted(ex.items()), sorted(cache.items()))).encode()).hexdigest()[:16]
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+    state['version'] = version
+    state['inference'] = inference_engine.session_info() if inference_engine else None
+    state['executor'] = ex
+    state['result_cache'] = cache
+    res = jsonify(state)
+    res.set_etag(etag)
+    res.headers['Cache-Control'] = 'no-cache'
+    return res
+
+@app.route('/api/events')
+def state_events():
+    """Server-Sent Events: a full snapshot first, then only the keys that changed"""
+    def stream():
+        # Opened during startup: hold the connection (an EventSource gives up on a 503)
+        while not startup.wait('hardware', timeout=EVENT_HEARTBEAT):
+            if startup.status('hardware') == 'failed':
+                return
+            yield ": keepalive\n\n"
+        sent = {}
+        version = None
+        while True:
+            version, state = hw.wait_for_change(version, timeout=EVENT_HEARTBEAT)
+            changes = {k: state[k] for k in EVENT_KEYS if k not in sent or sent[k] != state[k]}
+            if changes:
+                sent.update(changes)
+                data = json.dumps({'version': version, 'changes': changes})
+                yield f"id: {version}\nevent: state\ndata: {data}\n\n"
+            else:
+                yield ": keepalive\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/camera')
+@requires('hardware')
+def camera_status():
+    return jsonify({**hw.camera.stats(), 'preview': preview.info(), 'live': live.info()})
+
+@app.route('/api/preview.mjpg')
+@requires('hardware')
+def preview_stream():
+    return Response(preview.stream(), mimetype=f'multipart/x-mixed-replace; boundary={preview.BOUNDARY}',
+                    headers={'Cache-Control': 'no-cache, no-store', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/live')
+@requires('hardware')
+def live_stream():
+    """Server-Sent Events: tracked lesion boxes (frame pixels) for every analyzed preview frame"""
+    return Response(live.stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/health')
+def health():
+    """Readiness of each startup step with its timings; 503 until every required step is ready"""
+    info = startup.info()
+    if startup.status('hardware') == 'ready':
+        info['camera'] = {k: v for k, v in hw.camera.stats().items() if k in ('healthy', 'device', 'fps')}
+    return jsonify(info), 200 if info['ready'] else 503
+
+@app.route('/api/metrics')
+def metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics/profile', methods=['GET', 'POST'])
+@requires('models')
+def profile():
+    """POST {"runs": N} profiles the next N analyses with the ONNX Runtime profiler"""
+    if request.method == 'POST':
+        try:
+            runs = int((request.get_json(silent=True) or {}).get('runs', 10))
+        except (TypeError, ValueError):
+            runs = 0
+        if runs < 1:
+            return jsonify({'error': 'runs must be an integer >= 1'}), 400
+        try:
+            inference_engine.start_profiling(runs)
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 409
+    return jsonify(inference_engine.profiling_info())
+
+@app.route('/api/models')
+@requires('models')
+def model_versions():
+    return jsonify(models.info())
+
+@app.route('/api/models/activate', methods=['POST'])
+@requires('models')
+def activate_model():
+    """{"version": name}: load (or promote the shadow candidate) and switch to it in the background"""
+    version = (request.get_json(silent=True) or {}).get('version')
+    if not version or not models.activate(version):
+        return jsonify({'error': 'Unknown model version', 'versions': models.info()['versions']}), 404
+    return jsonify({'activating': version}), 202
 
 @app.route('/api/session/reset', methods=['POST'])
+@requires('hardware')
 def reset_session():
     hw.reset_session()
     return jsonify({'success': True})
 
 @app.route('/api/upload', methods=['POST'])
+@requires('hardware')
 def upload_image():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
@@ -62,17 +414,68 @@ def upload_image():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
         
+    if hw.get_state()['mode'] == 2 and startup.status('models') in ('pending', 'starting'):
+        return jsonify({'error': 'AI models still loading'}), 503, {'Retry-After': '1'}
+
     if file:
+        # Concurrent uploads within the same second must not overwrite each other
         ts = int(time.time())
-        filename = f"upload_{ts}.jpg"
+        filename = f"upload_{ts}_{uuid.uuid4().hex[:8]}.jpg"
         filepath = os.path.join(hw.capture_dir, filename)
-        file.save(filepath)
-        
+
         # Inject into hardware manager flow
-        # This will update state and trigger AI if in Mode 2
-        hw.inject_image(filepath)
-        
-        return jsonify({'success': True, 'path': filepath})
+        # This will update state and trigger AI if in Mode 2; inference decodes the
+        # uploaded bytes directly while the file is written in the background
+        job = hw.inject_image(filepath, data=file.read())
+        if job is None and hw.get_state()['mode'] == 2 and inference_engine:
+            return jsonify({'error': 'Analysis queue full', 'path': filepath}), 503
+
+        # A result cache hit is published right away: finished job, no id to follow
+        return jsonify({'success': True, 'path': filepath, 'jobId': job.id if job else None,
+                        'cached': job is not None and job.status == 'done'})
+
+@app.route('/api/analysis/submit/<session_id>', methods=['POST'])
+@requires('analysis', 'models')
+def submit_analysis(session_id):
+    payload = request.get_json(silent=True) or {}
+    try:
+        job_id = analysis_jobs.submit(session_id, payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if job_id is None:
+        return jsonify({'error': 'Analysis queue full'}), 503
+    return jsonify({'jobId': job_id})
+
+@app.route('/api/analysis/status/<job_id>')
+@requires('analysis')
+def analysis_status(job_id):
+    status = analysis_jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@app.route('/api/analysis/result/<job_id>')
+@requires('analysis')
+def analysis_result(job_id):
+    job = analysis_jobs.result(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'Result not ready', 'status': job['status']}), 409
+    return jsonify(job['result'])
+
+@app.route('/api/images/<image_id>/annotated')
+@requires('analysis')
+def annotated_image(image_id):
+    # Image ids come from the client and repeat across sessions: the session is part of the key
+    session_id = request.args.get('session')
+    if not session_id:
+        return jsonify({'error': 'Missing session'}), 400
+    path = analysis_jobs.annotated_path(session_id, image_id)
+    if not path or not os.path.exists(path):
+        return jsonify({'error': 'Image not found'}), 404
+    return send_file(os.path.abspath(path), mimetype='image/jpeg')
 
 if __name__ == '__main__':
+    startup.mark('http')
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,208 @@
+"""Offline batch inference over image directories.
+
+Images are decoded in a process pool and analyzed in batches (batched detector
+input where the model allows it, all crops of a batch classified together).
+One JSON record per image is appended to the output as it is produced, so an
+interrupted run resumes where it stopped. With a .parquet output the records
+are journaled to <out>.jsonl and converted when the run completes (needs pyarrow).
+
+    python batch_infer.py ../datasets/lesion_det/valid/images --out valid.jsonl
+    python batch_infer.py /mnt/archive --out archive.parquet --annotated-dir annotated/
+"""
+import argparse
+import collections
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from dataset_paths import iter_images
+
+FIELDS = ('path', 'status', 'width', 'height', 'predictions', 'error', 'model')
+
+
+def init_worker():
+    # One decode per process; OpenCV's own thread pool would just oversubscribe the cores
+    cv2.setNumThreads(1)
+
+
+def decode(path):
+    return path, cv2.imread(path)
+
+
+def read_journal(path):
+    """Records already written by an earlier run (last record per image wins)"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            done[record['path']] = record
+    return done
+
+
+def open_journal(path):
+    f = open(path, 'a+')
+    f.seek(0, os.SEEK_END)
+    if f.tell():
+        f.seek(f.tell() - 1)
+        if f.read(1) != '\n':
+            f.write('\n')
+    return f
+
+
+def write_parquet(records, out):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output needs pyarrow (pip install pyarrow); the JSONL journal is complete")
+    rows = [{k: r.get(k) for k in FIELDS} for r in records]
+    pq.write_table(pa.Table.from_pylist(rows), out)
+
+
+def annotated_path(annotated_dir, root, path):
+    rel = os.path.relpath(path, root)
+    return os.path.join(annotated_dir, os.path.splitext(rel)[0] + "_annotated.jpg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch inference over image directories")
+    parser.add_argument("inputs", nargs="+", help="image directories (searched recursively)")
+    parser.add_argument("--out", required=True, help="predictions file, .jsonl or .parquet")
+    parser.add_argument("--det", default="best_det.onnx")
+    parser.add_argument("--cls", default="best_cls.onnx")
+    parser.add_argument("--variant", default=None, help="model variant (default: session config)")
+    parser.add_argument("--annotated-dir", default=None, help="also write annotated images here")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="decode processes")
+    parser.add_argument("--batch", type=int, default=8, help="images per analysis batch")
+    parser.add_argument("--det-batch", type=int, default=4, help="images per detector run")
+    parser.add_argument("--no-resume", action="store_true", help="start over instead of skipping done images")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many new images")
+    args = parser.parse_args()
+
+    print("=== Batch Inference ===")
+    parquet = args.out.endswith(".parquet")
+    journal = args.out + ".jsonl" if parquet else args.out
+    if args.no_resume and os.path.exists(journal):
+        os.remove(journal)
+    done = read_journal(journal)
+
+    def finished(root, path):
+        record = done.get(path)
+        if record is None:
+            return False
+        # Re-run images whose annotated output went missing
+        return not args.annotated_dir or record.get('error') or \
+            os.path.exists(annotated_path(args.annotated_dir, root, path))
+
+    def pending():
+        n = 0
+        for root in args.inputs:
+            for p in iter_images(root):
+                if finished(root, str(p)):
+                    continue
+                if args.limit is not None and n >= args.limit:
+                    return
+                n += 1
+                yield root, str(p)
+
+    if done:
+        print(f"[Batch] Resuming: {len(done)} image(s) already in {journal}")
+
+    # Fork the decoders before ONNX Runtime starts its thread pools: the pool only forks on
+    # submit, so start every worker now and wait for them
+    pool = ProcessPoolExecutor(args.workers, initializer=init_worker)
+    for future in [pool.submit(init_worker) for _ in range(args.workers)]:
+        future.result()
+    from inference import ModelInference
+    engine = ModelInference(args.det, args.cls, variant=args.variant, verbose=False)
+    engine.warmup()
+    model = f"{engine.variant}:{engine.result_version()}"
+
+    counts = collections.Counter()
+    t_start = time.perf_counter()
+    t_report = t_start
+    out = open_journal(journal)
+
+    def run_batch(batch):
+        nonlocal t_report
+        images = [img for _, _, img in batch if img is not None]
+        results = iter(engine.analyze(images, det_batch=args.det_batch)) if images else iter(())
+        for root, path, img in batch:
+            record = {'path': path, 'model': model}
+            if img is None:
+                record['error'] = 'unreadable image'
+                counts['failed'] += 1
+            else:
+                preds = next(results)
+                record.update(status=engine.image_status(preds), width=img.shape[1], height=img.shape[0],
+                              predictions=preds)
+                counts['lesions'] += len(preds)
+                if args.annotated_dir:
+                    dst = annotated_path(args.annotated_dir, root, path)
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    cv2.imwrite(dst, engine.annotate(img, preds))
+            counts['images'] += 1
+            done[path] = record
+            out.write(json.dumps(record) + "\n")
+        out.flush()
+
+        now = time.perf_counter()
+        if now - t_report >= 5:
+            t_report = now
+            print(f"[Batch] {counts['images']} images, {counts['images'] / (now - t_start):.1f} images/s")
+
+    # Keep a bounded window of decodes in flight: enough to hide decode latency,
+    # without buffering the whole tree in memory
+    window = collections.deque()
+    batch = []
+    todo = pending()
+    try:
+        while True:
+            while len(window) < max(2 * args.batch, 2 * args.workers):
+                item = next(todo, None)
+                if item is None:
+                    break
+                root, path = item
+                window.append((root, pool.submit(decode, path)))
+            if not window:
+                break
+            root, future = window.popleft()
+            path, img = future.result()
+            batch.append((root, path, img))
+            if len(batch) >= args.batch:
+                run_batch(batch)
+                batch = []
+        if batch:
+            run_batch(batch)
+    except KeyboardInterrupt:
+        print("\n[Batch] Interrupted, rerun the same command to resume")
+        pool.shutdown(wait=False, cancel_futures=True)
+        return
+    finally:
+        out.close()
+    pool.shutdown()
+
+    elapsed = time.perf_counter() - t_start
+    rate = counts['images'] / elapsed if elapsed > 0 else 0.0
+    print(f"[Batch] {counts['images']} new image(s) in {elapsed:.1f} s -> {rate:.1f} images/s "
+          f"({counts['lesions']} lesions, {counts['failed']} unreadable)")
+
+    if parquet:
+        write_parquet(done.values(), args.out)
+        print(f"[Batch] Saved {args.out} ({len(done)} records)")
+    else:
+        print(f"[Batch] Saved {args.out}")
+    print("\n[Done]")
+
+
+if __name__ == "__main__":
+    main()
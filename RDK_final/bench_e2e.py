@@ -0,0 +1,286 @@
+"""End-to-end benchmark of the capture -> result pipeline, no camera or GPIO needed.
+
+Runs the real app (HardwareManager, ModelInference, Flask endpoints) with MockGPIO
+and a synthetic frame source (or --frames <image dir | video> to replay real
+captures) and measures:
+
+    cold start       import, model load, warm-up and first result, in a fresh process;
+                     and for the app itself: time until it can serve, and per startup step
+    capture latency  button press -> analysis result published (Mode 2)
+    upload           request throughput / latency at N concurrent uploads (Mode 1)
+    analysis         analyses/s and latency with N concurrent /api/analysis clients
+    memory           peak RSS of the benchmark process
+
+Run from RDK_final/ next to the models (app startup clears UI/captures):
+
+    python bench_e2e.py --out bench_results.json
+    python bench_e2e.py --baseline bench_baseline.json    # exit code 1 on regressions
+"""
+import argparse
+import base64
+import contextlib
+import io
+import json
+import logging
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from load_test_upload import make_jpeg, post_upload
+
+
+def percentiles(values_s, prefix):
+    ms = np.array(values_s) * 1000
+    return {f"{prefix}_p50_ms": float(np.percentile(ms, 50)),
+            f"{prefix}_p95_ms": float(np.percentile(ms, 95)),
+            f"{prefix}_max_ms": float(ms.max())}
+
+
+def cold_start(det, cls):
+    """Runs in a spawned process: nothing imported, nothing cached in memory"""
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        from inference import ModelInference
+        t_import = time.perf_counter()
+        engine = ModelInference(det, cls)
+        t_load = time.perf_counter()
+        engine.warmup()
+        t_warm = time.perf_counter()
+        frame = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+        engine.run_inference(frame)
+        t_first = time.perf_counter()
+    return {
+        'cold_import_s': t_import - t0,
+        'cold_model_load_s': t_load - t_import,
+        'cold_warmup_s': t_warm - t_load,
+        'cold_first_result_s': t_first - t_warm,
+        'cold_total_s': t_first - t0,
+        'cold_peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def cold_app_start(env):
+    """Runs in a spawned process: import the app, then wait for every startup step"""
+    os.environ.update(env)
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as server
+        t_import = time.perf_counter()
+        server.startup.wait(timeout=120)
+        t_ready = time.perf_counter()
+        if server.hw:
+            server.hw.stop()
+    metrics = {'cold_app_serving_s': t_import - t0, 'cold_app_ready_s': t_ready - t0}
+    for name, step in server.startup.info()['steps'].items():
+        if 'duration_ms' in step:
+            metrics[f"cold_step_{name}_s"] = step['duration_ms'] / 1000
+    return metrics
+
+
+def bench_capture(server, runs):
+    """Button press -> result published, through the button queue and the real capture path"""
+    hw = server.hw
+    latencies = []
+    for _ in range(runs):
+        version, state = hw.get_versioned_state()
+        previous = state['analysis_result']
+        press = time.perf_counter()
+        hw.buttons.emit(hw.BTN1_PIN)
+        while True:
+            version, state = hw.wait_for_change(version, timeout=30)
+            result = state['analysis_result']
+            if result is not None and result is not previous and not state['is_processing']:
+                break
+        latencies.append(time.perf_counter() - press)
+    return percentiles(latencies, 'capture')
+
+
+def bench_uploads(base, clients, requests):
+    images = [make_jpeg(seed=i) for i in range(8)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(lambda i: post_upload(base, images[i % len(images)]), range(requests)))
+    elapsed = time.perf_counter() - t0
+    ok = [lat for status, lat in results if status == 200]
+    return {f"upload_c{clients}_per_s": len(ok) / elapsed,
+            f"upload_c{clients}_errors": len(results) - len(ok),
+            **percentiles(ok or [0.0], f"upload_c{clients}")}
+
+
+def http_json(url, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as res:
+            return res.status, json.loads(res.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def bench_analysis(base, clients, jobs):
+    """Closed loop: each client submits one session, polls until done, repeats"""
+    # Distinct images (also across levels), so the result cache doesn't turn this into a cache benchmark
+    urls = [f"data:image/jpeg;base64,{base64.b64encode(make_jpeg(seed=1000 * clients + i)).decode()}"
+            for i in range(jobs)]
+    rejected = [0]
+
+    def run(i):
+        payload = {'images': {'arm': [{'id': f'bench{i}', 'url': urls[i]}]}}
+        t0 = time.perf_counter()
+        while True:
+            status, body = http_json(f"{base}/api/analysis/submit/BENCH-{i}", payload)
+            if status == 200:
+                break
+            rejected[0] += 1
+            time.sleep(0.02)
+        while http_json(f"{base}/api/analysis/status/{body['jobId']}")[1]['status'] not in ('done', 'failed'):
+            time.sleep(0.01)
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        latencies = list(pool.map(run, range(jobs)))
+    elapsed = time.perf_counter() - t0
+    return {f"analysis_c{clients}_per_s": jobs / elapsed,
+            f"analysis_c{clients}_rejected": rejected[0],
+            **percentiles(latencies, f"analysis_c{clients}")}
+
+
+def compare(metrics, baseline, tolerance, min_ms=1.0):
+    """Print metric deltas vs the baseline, return the regressed keys.
+
+    Sub-millisecond timings jitter by more than any sane tolerance, so a latency
+    must also grow by at least min_ms to count as a regression.
+    """
+    regressions = []
+    print(f"\n{'metric':>32} {'baseline':>10} {'current':>10} {'delta':>8}")
+    for key in sorted(set(metrics) & set(baseline)):
+        old, new = baseline[key], metrics[key]
+        if not old:
+            continue
+        delta = (new - old) / abs(old)
+        # Throughputs regress when they drop, everything else when it grows
+        worse = -delta if key.endswith('_per_s') else delta
+        flag = ''
+        if key.endswith('_ms'):
+            noise = abs(new - old) < min_ms
+        else:
+            noise = key.endswith('_s') and not key.endswith('_per_s') and abs(new - old) * 1000 < min_ms
+        if worse > tolerance and not noise and not key.endswith(('_errors', '_rejected')):
+            regressions.append(key)
+            flag = '  <-- regression'
+        print(f"{key:>32} {old:>10.2f} {new:>10.2f} {delta * 100:>+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument("--det", default="best_det.onnx")
+    parser.add_argument("--cls", default="best_cls.onnx")
+    parser.add_argument("--frames", default="synthetic", help="'synthetic', an image folder or a video file")
+    parser.add_argument("--runs", type=int, default=10, help="captures for the latency test")
+    parser.add_argument("--clients", default="1,4,8", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="uploads per concurrency level")
+    parser.add_argument("--jobs", type=int, default=16, help="analyses per concurrency level")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    print("=== End-to-End Benchmark ===")
+    metrics = {}
+
+    # The app is configured from the environment at import time
+    env = {
+        'RDK_MOCK_GPIO': '1',
+        'RDK_CAMERA_SOURCE': args.frames,
+        'RDK_AI_QUEUE': os.environ.get('RDK_AI_QUEUE', '4'),
+        'RDK_RESULT_CACHE_DIR': '',  # results from earlier runs must not count
+    }
+    print("[Bench] Cold start (fresh processes)...")
+    with mp.get_context("spawn").Pool(1) as pool:
+        metrics.update(pool.apply(cold_start, (args.det, args.cls)))
+    with mp.get_context("spawn").Pool(1) as pool:
+        metrics.update(pool.apply(cold_app_start, (env,)))
+
+    os.environ.update(env)
+    print("[Bench] Starting app...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as server
+        from werkzeug.serving import make_server
+        server.startup.wait(timeout=120)
+    if server.inference_engine is None:
+        raise SystemExit("Models not loaded, run from RDK_final/ next to best_det.onnx / best_cls.onnx")
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    httpd = make_server('127.0.0.1', args.port, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{args.port}"
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with server.hw.lock:
+            server.hw.state['mode'] = 2
+        bench_capture(server, 1)  # first capture pays lazy allocations
+        metrics.update(bench_capture(server, args.runs))
+
+        with server.hw.lock:
+            server.hw.state['mode'] = 1
+        for clients in (int(c) for c in args.clients.split(",")):
+            metrics.update(bench_uploads(base, clients, args.requests))
+            metrics.update(bench_analysis(base, clients, args.jobs))
+    server.hw.writer.flush()
+
+    for stage, s in server.METRICS.summary().items():
+        metrics[f"stage_{stage}_p50_ms"] = s['p50'] * 1000
+    metrics['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    import onnxruntime
+    results = {
+        'env': {
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'python': sys.version.split()[0],
+            'onnxruntime': onnxruntime.__version__,
+            'cpus': os.cpu_count(),
+            'variant': server.inference_engine.variant,
+            'frames': args.frames,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'metrics': metrics,
+    }
+
+    width = max(len(k) for k in metrics)
+    print()
+    for key, value in metrics.items():
+        print(f"{key:>{width}} {value:>10.2f}")
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n[Bench] Saved {args.out}")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['env'].get('machine') != results['env']['machine']:
+            print(f"[Bench] Note: baseline is from {baseline['env'].get('machine')}")
+        regressions = compare(metrics, baseline['metrics'], args.tolerance)
+        if regressions:
+            print(f"\n[Bench] {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            status = 1
+    print("\n[Done]")
+    httpd.shutdown()
+    server.hw.stop()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from inference import ModelInference
+from postprocess import DETECTION_DTYPE, postprocess
+from preprocess import Letterbox
+
+print("=== Inference Benchmark ===")
+
+
+def make_image(w, h, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+
+
+def make_detections(n, shape, seed=0):
+    """Random detections in image coordinates"""
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    xy = rng.uniform(0, [w - 160, h - 160], (n, 2))
+    wh = rng.uniform(40, 160, (n, 2))
+    detections = np.zeros(n, dtype=DETECTION_DTYPE)
+    detections['box'] = np.concatenate([xy, xy + wh], axis=1)
+    detections['score'] = rng.uniform(0.3, 1.0, n)
+    return detections
+
+
+def make_prediction(anchors=8400, nc=1, seed=0):
+    """Synthetic YOLOv8 (1, 4 + nc, anchors) output with clustered boxes"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(60, 580, (20, 2))
+    idx = rng.integers(0, len(centers), anchors)
+    pred = np.zeros((1, 4 + nc, anchors), dtype=np.float32)
+    pred[0, :2] = (centers[idx] + rng.normal(0, 6, (anchors, 2))).T
+    pred[0, 2:4] = rng.uniform(20, 70, (2, anchors))
+    pred[0, 4:] = rng.uniform(0, 1, (nc, anchors)) ** 12
+    return pred
+
+
+def timeit(fn, runs):
+    fn()  # warm-up
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return np.median(times) * 1000
+
+
+def legacy_preprocess(image, target_shape):
+    """Pre-Letterbox implementation, kept as the baseline for bench_preprocess"""
+    shape = image.shape[:2]
+    r = min(target_shape[0] / shape[0], target_shape[1] / shape[1])
+    new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+    dw, dh = target_shape[1] - new_unpad[0], target_shape[0] - new_unpad[1]
+    dw /= 2
+    dh /= 2
+    if shape[::-1] != new_unpad:
+        image = cv2.resize(image, new_unpad, interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    img = img.transpose((2, 0, 1))[::-1]
+    img = np.ascontiguousarray(img)
+    img = img.astype(np.float32) / 255.0
+    return img[None], (r, (dw, dh))
+
+
+def peak_alloc(fn):
+    """Peak bytes allocated by numpy/cv2 arrays during one call"""
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def bench_preprocess(counts, runs):
+    print("\n[Bench] Preprocessing: legacy copies vs Letterbox buffers")
+    print(f"{'case':>16} {'legacy ms':>10} {'new ms':>10} {'legacy MB':>10} {'new MB':>10} {'equal':>6}")
+    frame = make_image(1280, 720)
+    det = Letterbox((640, 640))
+    cls = Letterbox((224, 224))
+
+    cases = [("det 1280x720", lambda: legacy_preprocess(frame, (640, 640)), lambda: det(frame))]
+    for n in counts:
+        if n == 0:
+            continue
+        crops = [frame[i * 20:i * 20 + 60, i * 30:i * 30 + 80] for i in range(n)]
+        cases.append((
+            f"cls batch {n}",
+            lambda crops=crops: np.concatenate([legacy_preprocess(c, (224, 224))[0] for c in crops]),
+            lambda crops=crops: cls.batch(crops),
+        ))
+
+    for name, legacy, new in cases:
+        a = legacy()
+        a = a[0] if isinstance(a, tuple) else a
+        b = new()[0]
+        equal = a.shape == b.shape and np.array_equal(a, b)
+        t_legacy, t_new = timeit(legacy, runs), timeit(new, runs)
+        m_legacy, m_new = peak_alloc(legacy) / 1e6, peak_alloc(new) / 1e6
+        print(f"{name:>16} {t_legacy:>10.2f} {t_new:>10.2f} {m_legacy:>10.2f} {m_new:>10.2f} {str(equal):>6}")
+
+
+def reference_postprocess(prediction, conf, iou, ratio_pad, img_shape):
+    """Per-box reference: cv2.dnn.NMSBoxes on xywh rects and Python int() rescaling"""
+    pred = prediction[0].T
+    ratio, (dw, dh) = ratio_pad
+    img_h, img_w = img_shape
+    scores = pred[:, 4:].max(axis=1)
+    rects, kept_scores = [], []
+    for row, score in zip(pred, scores):
+        if score > conf:
+            cx, cy, w, h = row[:4]
+            rects.append([float(cx - w / 2), float(cy - h / 2), float(w), float(h)])
+            kept_scores.append(float(score))
+    if not rects:
+        return []
+    out = []
+    for i in np.array(cv2.dnn.NMSBoxes(rects, kept_scores, conf, iou)).flatten():
+        x, y, w, h = np.float32(rects[i])
+        x1 = max(0, int((x - dw) / ratio))
+        y1 = max(0, int((y - dh) / ratio))
+        x2 = min(img_w, int((x + w - dw) / ratio))
+        y2 = min(img_h, int((y + h - dh) / ratio))
+        if x2 > x1 and y2 > y1:
+            out.append((x1, y1, x2, y2))
+    return out
+
+
+def bench_postprocess(runs):
+    print("\n[Bench] Post-processing: per-box reference vs vectorized")
+    print(f"{'conf':>6} {'ref ms':>10} {'numpy ms':>10} {'kept':>6} {'match':>6}")
+    prediction = make_prediction()
+    ratio_pad = (0.5, (0.0, 140.0))
+    img_shape = (720, 1280)
+    for conf in (0.25, 0.1, 0.01):
+        ref = reference_postprocess(prediction, conf, 0.45, ratio_pad, img_shape)
+        new = postprocess(prediction, conf, 0.45, ratio_pad, img_shape)
+        # OpenCV breaks score ties differently, so compare as sets
+        match = set(ref) == set(map(tuple, new['box'].tolist()))
+        t_ref = timeit(lambda: reference_postprocess(prediction, conf, 0.45, ratio_pad, img_shape), runs)
+        t_new = timeit(lambda: postprocess(prediction, conf, 0.45, ratio_pad, img_shape), runs)
+        print(f"{conf:>6} {t_ref:>10.2f} {t_new:>10.2f} {len(new):>6} {str(match):>6}")
+
+
+def classify_per_crop(engine, crops):
+    """Reference: one session.run per crop (pre-batching behaviour)"""
+    out = []
+    for crop in crops:
+        cls_input, _ = engine.preprocess(crop, engine.cls_shape)
+        out.append(engine.cls_session.run(None, {engine.cls_input_name: cls_input})[0][0])
+    return np.array(out)
+
+
+def bench_classification(engine, counts, runs):
+    print("\n[Bench] Classification: per-crop loop vs batched")
+    print(f"{'lesions':>8} {'loop ms':>10} {'batch ms':>10} {'speedup':>8} {'max diff':>10}")
+    img = make_image(1280, 720)
+    rng = np.random.default_rng(1)
+    for n in counts:
+        crops = []
+        for _ in range(n):
+            x, y = rng.integers(0, 1180), rng.integers(0, 620)
+            s = rng.integers(20, 100)
+            crops.append(img[y:y + s, x:x + s])
+
+        ref = classify_per_crop(engine, crops)
+        out = engine.classify(crops)
+        diff = float(np.max(np.abs(ref - out))) if n else 0.0
+
+        t_loop = timeit(lambda: classify_per_crop(engine, crops), runs)
+        t_batch = timeit(lambda: engine.classify(crops), runs)
+        speedup = t_loop / t_batch if t_batch > 0 else 0
+        print(f"{n:>8} {t_loop:>10.2f} {t_batch:>10.2f} {speedup:>7.2f}x {diff:>10.2e}")
+
+
+def bench_pipeline(engine, counts, runs):
+    print("\n[Bench] Full run_inference latency per image (annotated JPEG written in both)")
+    print(f"{'lesions':>8} {'file ms':>10} {'memory ms':>10}")
+    image = make_image(1280, 720)
+
+    detect = engine.detect
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.jpg")
+        annotated_path = os.path.join(tmp, "bench_annotated.jpg")
+        cv2.imwrite(path, image)
+        try:
+            for n in counts:
+                detections = make_detections(n, (720, 1280), seed=n)
+                engine.detect = lambda image, detections=detections: detections
+                # imread vs. the in-memory capture path (frame in); same annotated write for both
+                t_file = timeit(lambda: engine.run_inference(path, annotated_path=annotated_path), runs)
+                t_mem = timeit(lambda: engine.run_inference(image, annotated_path=annotated_path), runs)
+                print(f"{n:>8} {t_file:>10.2f} {t_mem:>10.2f}")
+        finally:
+            engine.detect = detect
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ModelInference stages")
+    parser.add_argument("--det", default="best_det.onnx")
+    parser.add_argument("--cls", default="best_cls.onnx")
+    parser.add_argument("--lesions", default="0,1,5,10,20,30",
+                        help="comma separated lesion counts")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--stages", default="preprocess,postprocess,classify,pipeline",
+                        help="comma separated: preprocess, postprocess, classify, pipeline")
+    args = parser.parse_args()
+
+    counts = [int(c) for c in args.lesions.split(",")]
+    stages = args.stages.split(",")
+
+    if "preprocess" in stages:
+        bench_preprocess(counts, args.runs)
+
+    if "postprocess" in stages:
+        bench_postprocess(args.runs)
+
+    if "classify" in stages or "pipeline" in stages:
+        engine = ModelInference(args.det, args.cls)
+        print(f"\n[Bench] cls batch: {engine.cls_batch or 'dynamic'}")
+        if "classify" in stages:
+            bench_classification(engine, counts, args.runs)
+        if "pipeline" in stages:
+            bench_pipeline(engine, counts, args.runs)
+    print("\n[Done]")
+
+
+if __name__ == "__main__":
+    main()
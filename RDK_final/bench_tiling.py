@@ -0,0 +1,135 @@
+"""Recall / latency of tiled detection vs the single letterboxed pass.
+
+Runs the detector over lesion_det/<split> with every tile size / overlap given
+and matches the boxes to the YOLO labels at IoU 0.5. "small" counts only
+lesions under 32x32 px in the original image, the ones tiling is meant to find.
+Images no larger than a tile go through the single pass either way.
+
+    python bench_tiling.py --split test --tile-sizes 640,480 --overlaps 0.1,0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import cv2
+import numpy as np
+
+from dataset_paths import det_images, det_labels
+from postprocess import box_iou
+
+SMALL_AREA = 32 * 32
+
+
+def gt_boxes(path, img_shape):
+    """Labels of path as (N, 4) xyxy pixel boxes"""
+    h, w = img_shape
+    cx, cy, bw, bh = det_labels(path).T
+    return np.stack([(cx - bw / 2) * w, (cy - bh / 2) * h, (cx + bw / 2) * w, (cy + bh / 2) * h], axis=1)
+
+
+def match(gt, detections, iou=0.5):
+    """Greedy matching by descending score; returns (matched mask over gt, true positives)"""
+    matched = np.zeros(len(gt), dtype=bool)
+    tp = 0
+    for det in detections[np.argsort(-detections['score'])] if len(detections) else ():
+        free = np.flatnonzero(~matched)
+        if not free.size:
+            break
+        ious = box_iou(det['box'].astype(np.float32), gt[free].astype(np.float32))
+        best = int(np.argmax(ious))
+        if ious[best] >= iou:
+            matched[free[best]] = True
+            tp += 1
+    return matched, tp
+
+
+def run_config(engine, samples, tiled, tile_size=None, overlap=None, full_frame=True):
+    engine.tiled = tiled
+    if tiled:
+        engine.tile_size, engine.tile_overlap, engine.tile_full_frame = tile_size, overlap, full_frame
+
+    times, n_gt, n_small, hit, hit_small, n_pred, tp = [], 0, 0, 0, 0, 0, 0
+    tiled_images = 0
+    for img, gt in samples:
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dets = engine.detect_tiled(img) if tiled else engine.detect(img)
+        times.append(time.perf_counter() - t0)
+        tiled_images += tiled and max(img.shape[:2]) > tile_size
+
+        matched, n_tp = match(gt, dets)
+        small = (gt[:, 2] - gt[:, 0]) * (gt[:, 3] - gt[:, 1]) < SMALL_AREA
+        n_gt += len(gt)
+        n_small += int(small.sum())
+        hit += int(matched.sum())
+        hit_small += int(matched[small].sum())
+        n_pred += len(dets)
+        tp += n_tp
+
+    ms = np.array(times) * 1000
+    return {
+        'mode': f"tiled {tile_size}/{overlap}{'' if full_frame else ' no-full'}" if tiled else 'single',
+        'recall': hit / n_gt if n_gt else None,
+        'recall_small': hit_small / n_small if n_small else None,
+        'precision': tp / n_pred if n_pred else None,
+        'det_ms_p50': float(np.percentile(ms, 50)),
+        'det_ms_p95': float(np.percentile(ms, 95)),
+        'tiled_images': int(tiled_images),
+    }
+
+
+def fmt(v, spec):
+    return format(v, spec) if v is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall / latency of tiled vs single-pass detection")
+    parser.add_argument("--det", default="best_det.onnx")
+    parser.add_argument("--cls", default="best_cls.onnx")
+    parser.add_argument("--data-root", default="../datasets")
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--limit", type=int, default=200, help="max images")
+    parser.add_argument("--tile-sizes", default="640,480", help="comma separated tile edges in pixels")
+    parser.add_argument("--overlaps", default="0.1,0.2", help="comma separated tile overlaps")
+    parser.add_argument("--no-full-frame", action="store_true", help="tiles only, without the whole-frame pass")
+    parser.add_argument("--out", default=None, help="write the summary as JSON")
+    args = parser.parse_args()
+
+    print("=== Tiled Detection Benchmark ===")
+    from inference import ModelInference
+    engine = ModelInference(args.det, args.cls)
+    engine.warmup()
+
+    samples = []
+    for path in det_images(args.data_root, args.split)[:args.limit]:
+        img = cv2.imread(str(path))
+        if img is not None:
+            samples.append((img, gt_boxes(path, img.shape[:2])))
+    sizes = sorted({img.shape[:2] for img, _ in samples})
+    print(f"[Bench] {len(samples)} images from '{args.split}' ({len(sizes)} distinct sizes, "
+          f"largest {max(sizes, default=(0, 0))}), {sum(len(gt) for _, gt in samples)} lesions")
+
+    results = [run_config(engine, samples, tiled=False)]
+    for tile_size in (int(t) for t in args.tile_sizes.split(",")):
+        for overlap in (float(o) for o in args.overlaps.split(",")):
+            results.append(run_config(engine, samples, True, tile_size, overlap, not args.no_full_frame))
+
+    base = results[0]
+    print(f"\n{'mode':>24} {'recall':>8} {'small':>8} {'prec':>8} {'p50 ms':>8} {'p95 ms':>8} {'x time':>7} {'tiled':>6}")
+    for row in results:
+        slowdown = row['det_ms_p50'] / base['det_ms_p50'] if base['det_ms_p50'] else None
+        print(f"{row['mode']:>24} {fmt(row['recall'], '8.3f')} {fmt(row['recall_small'], '8.3f')} "
+              f"{fmt(row['precision'], '8.3f')} {row['det_ms_p50']:>8.1f} {row['det_ms_p95']:>8.1f} "
+              f"{fmt(slowdown, '7.2f')} {row['tiled_images']:>6}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[Bench] Saved {args.out}")
+    print("\n[Done]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import resource
+import time
+
+import cv2
+import numpy as np
+
+from dataset_paths import cls_images as list_cls_images, det_images as list_det_images
+from inference import MODEL_VARIANTS, variant_path
+from packed_crops import PackedCrops
+from postprocess import match_boxes
+
+# make_cls_dataset.py folder names -> classifier labels
+CLS_FOLDER_LABELS = {'cancer': 'skin_cancer', 'eczema': 'eczema', 'unknown': 'unknown'}
+
+
+def cls_batches(cls_images, batch):
+    """Crops in batches: from JPEG paths, or zero-copy from a packed split (data_root, split, limit)"""
+    if isinstance(cls_images, tuple):
+        data_root, split, limit = cls_images
+        crops = PackedCrops(data_root, split)
+        n = min(len(crops), limit)
+        for start in range(0, n, batch):
+            yield list(crops.images(start, min(start + batch, n)))
+        return
+    for start in range(0, len(cls_images), batch):
+        yield [img for img in (cv2.imread(p) for p in cls_images[start:start + batch]) if img is not None]
+
+
+def run_variant(variant, det_path, cls_path, det_images, cls_images, batch):
+    """Runs in a fresh process so ru_maxrss only covers this variant"""
+    from inference import ModelInference
+
+    engine = ModelInference(det_path, cls_path, variant=variant)
+    engine.warmup()
+
+    det_out, det_times = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in det_images:
+            img = cv2.imread(path)
+            if img is None:
+                det_out.append(np.zeros((0, 4), dtype=np.int32))
+                continue
+            t0 = time.perf_counter()
+            detections = engine.detect(img)
+            det_times.append(time.perf_counter() - t0)
+            det_out.append(detections['box'])
+
+    cls_out, cls_times = [], []
+    for crops in cls_batches(cls_images, batch):
+        t0 = time.perf_counter()
+        probs = engine.classify(crops)
+        cls_times.append((time.perf_counter() - t0) / max(len(crops), 1))
+        labels = engine.cls_labels
+        cls_out.extend(labels[i] if i < len(labels) else 'unknown' for i in np.argmax(probs, axis=1))
+
+    return {
+        'variant': engine.variant,
+        'det_ms': float(np.median(det_times) * 1000) if det_times else None,
+        'cls_ms_per_crop': float(np.median(cls_times) * 1000) if cls_times else None,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'boxes': det_out,
+        'labels': cls_out,
+    }
+
+
+def det_agreement(ref_boxes, boxes, iou=0.5):
+    """Mean per-image F1 of boxes matched to the fp32 boxes at the given IoU"""
+    scores = []
+    for ref, out in zip(ref_boxes, boxes):
+        if len(ref) == 0 and len(out) == 0:
+            scores.append(1.0)
+            continue
+        matched = len(match_boxes(ref.astype(np.float32), out.astype(np.float32), iou))
+        scores.append(2 * matched / (len(ref) + len(out)))
+    return float(np.mean(scores)) if scores else None
+
+
+def fmt(v, spec):
+    return format(v, spec) if v is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency / memory / agreement of model variants vs fp32")
+    parser.add_argument("--det", default="best_det.onnx")
+    parser.add_argument("--cls", default="best_cls.onnx")
+    parser.add_argument("--variants", default=",".join(MODEL_VARIANTS))
+    parser.add_argument("--data-root", default="../datasets")
+    parser.add_argument("--split", default="test", help="held-out split, not used for calibration")
+    parser.add_argument("--limit", type=int, default=200, help="max images per model")
+    parser.add_argument("--batch", type=int, default=16, help="classifier batch size")
+    parser.add_argument("--packed", action="store_true", help="read crops from the packed split (packed_crops.py)")
+    parser.add_argument("--out", default=None, help="write the summary as JSON")
+    args = parser.parse_args()
+
+    print("=== Model Variant Benchmark ===")
+    det_images = [str(p) for p in list_det_images(args.data_root, args.split)][:args.limit]
+    if args.packed:
+        packed = PackedCrops(args.data_root, args.split)
+        cls_images = (args.data_root, args.split, args.limit)
+        cls_folders = [packed.label_names[i] for i in packed.labels[:args.limit]]
+    else:
+        cls_paths = list_cls_images(args.data_root, args.split)[:args.limit]
+        cls_images = [str(p) for p in cls_paths]
+        cls_folders = [p.parent.name for p in cls_paths]
+    print(f"[Bench] {len(det_images)} detection images, {len(cls_folders)} crops from '{args.split}'")
+
+    variants = ['fp32'] + [v for v in args.variants.split(",") if v != 'fp32']
+    ctx = mp.get_context("spawn")
+    results = {}
+    for variant in variants:
+        built = all(os.path.exists(variant_path(p, variant)) for p in (args.det, args.cls))
+        if variant != 'fp32' and not built:
+            print(f"[Bench] {variant}: not built, skipped (see quantize_models.py)")
+            continue
+        with ctx.Pool(1) as pool:
+            res = pool.apply(run_variant, (variant, args.det, args.cls, det_images, cls_images, args.batch))
+        results[variant] = res
+
+    ref = results['fp32']
+    truth = [CLS_FOLDER_LABELS.get(name) for name in cls_folders]
+
+    summary = []
+    print(f"\n{'variant':>14} {'det ms':>8} {'cls ms':>8} {'RSS MB':>8} {'det agree':>10} {'cls agree':>10} {'cls acc':>8}")
+    for variant, res in results.items():
+        pred = res['labels']
+        row = {
+            'variant': variant,
+            'det_ms': res['det_ms'],
+            'cls_ms_per_crop': res['cls_ms_per_crop'],
+            'peak_rss_mb': res['peak_rss_mb'],
+            'det_agreement': det_agreement(ref['boxes'], res['boxes']),
+            'cls_agreement': float(np.mean(np.array(res['labels']) == np.array(ref['labels']))) if res['labels'] else None,
+            'cls_accuracy': float(np.mean([p == t for p, t in zip(pred, truth)])) if pred else None,
+        }
+        summary.append(row)
+
+        print(f"{variant:>14} {fmt(row['det_ms'], '8.1f')} {fmt(row['cls_ms_per_crop'], '8.2f')} "
+              f"{row['peak_rss_mb']:>8.0f} {fmt(row['det_agreement'], '10.3f')} "
+              f"{fmt(row['cls_agreement'], '10.3f')} {fmt(row['cls_accuracy'], '8.3f')}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\n[Bench] Saved {args.out}")
+    print("\n[Done]")
+
+
+if __name__ == "__main__":
+    main()
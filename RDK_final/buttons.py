@@ -0,0 +1,102 @@
+import collections
+import queue
+import threading
+import time
+
+
+ButtonEvent = collections.namedtuple('ButtonEvent', 'pin ts')
+
+
+class ButtonEvents:
+    """Falling-edge button presses (active low, pull-up) delivered through a small queue.
+
+    Pins are registered with GPIO.add_event_detect(..., bouncetime=...), so presses
+    arrive as interrupts instead of being polled. Where the library lacks edge
+    detection (or a pin refuses it) that pin is polled instead, with the same
+    debounce in software. Each event carries the time.monotonic() of the edge, taken
+    in the callback, so later handling doesn't add to the measured press latency.
+    """
+
+    def __init__(self, gpio, pins, bouncetime_ms=200, poll_interval=0.02, max_queue=16):
+        self.gpio = gpio
+        self.pins = tuple(pins)
+        self.bouncetime_ms = bouncetime_ms
+        self.poll_interval = poll_interval
+        self.events = queue.Queue(maxsize=max_queue)
+        self.edge_pins = []
+        self.polled_pins = []
+        self.running = False
+        self._thread = None
+        self._counts = collections.Counter()
+        self._dropped = 0
+
+    def start(self):
+        self.running = True
+        for pin in self.pins:
+            try:
+                self.gpio.add_event_detect(pin, self.gpio.FALLING, callback=self.emit,
+                                           bouncetime=self.bouncetime_ms)
+                self.edge_pins.append(pin)
+            except Exception as e:
+                # AttributeError without edge support, RuntimeError if the pin can't do it
+                print(f"[Buttons] No edge detection on pin {pin} ({e}), polling it")
+                self.polled_pins.append(pin)
+        if self.polled_pins:
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+        print(f"[Buttons] Edge: {self.edge_pins}, polled: {self.polled_pins}")
+
+    def stop(self):
+        self.running = False
+        for pin in self.edge_pins:
+            try:
+                self.gpio.remove_event_detect(pin)
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        self.edge_pins, self.polled_pins = [], []
+
+    def emit(self, pin, ts=None):
+        """Queue a press of pin; the GPIO callback, the poller and tests all come through here"""
+        event = ButtonEvent(pin, ts or time.monotonic())
+        try:
+            self.events.put_nowait(event)
+            self._counts[pin] += 1
+        except queue.Full:
+            self._dropped += 1
+
+    def get(self, timeout=None):
+        """Next ButtonEvent, or None after timeout"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _poll(self):
+        last_level = {pin: 1 for pin in self.polled_pins}
+        last_event = {pin: 0.0 for pin in self.polled_pins}
+        debounce = self.bouncetime_ms / 1000
+        while self.running:
+            for pin in self.polled_pins:
+                try:
+                    level = self.gpio.input(pin)
+                except Exception as e:
+                    print(f"[Buttons] Read error on pin {pin}: {e}")
+                    time.sleep(1)
+                    continue
+                now = time.monotonic()
+                if level == 0 and last_level[pin] != 0 and now - last_event[pin] >= debounce:
+                    last_event[pin] = now
+                    self.emit(pin, now)
+                last_level[pin] = level
+            time.sleep(self.poll_interval)
+
+    def info(self):
+        return {
+            'edge_pins': list(self.edge_pins),
+            'polled_pins': list(self.polled_pins),
+            'bouncetime_ms': self.bouncetime_ms,
+            'presses': dict(self._counts),
+            'dropped': self._dropped,
+        }
@@ -0,0 +1,258 @@
+import collections
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import METRICS
+
+
+class CameraGrabber:
+    """Keeps the V4L2 pipeline drained on a background thread.
+
+    Frames are read into a small ring of preallocated buffers, so a capture just
+    copies the newest slot instead of grabbing/flushing on the button-press path.
+    The thread also reopens the camera when it stops delivering frames.
+    """
+
+    def __init__(self, indices=(0, 1, 8, 10), width=1280, height=720, ring_size=4,
+                 stall_timeout=2.0, max_backoff=10.0, capture_factory=cv2.VideoCapture):
+        self.indices = indices
+        # Anything with the cv2.VideoCapture interface; see SyntheticCapture / ReplayCapture
+        self.capture_factory = capture_factory
+        self.width = width
+        self.height = height
+        self.ring_size = ring_size
+        self.stall_timeout = stall_timeout
+        self.max_backoff = max_backoff
+
+        self.cap = None
+        self.device = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.lock)
+        self._thread = None
+
+        self._ring = []
+        self._next = 0
+        self._latest = None  # (slot, timestamp, frame_id)
+        self._frame_id = 0
+
+        self.reconnects = 0
+        self.read_failures = 0
+        self._open_failures = 0
+        self._fps_window = collections.deque(maxlen=30)
+        self._press_latency = collections.deque(maxlen=100)
+        self._frame_age = collections.deque(maxlen=100)
+
+    def _open(self):
+        if self.cap is not None:
+            try: self.cap.release()
+            except Exception: pass
+            self.cap = None
+
+        if not self._open_failures:
+            print("[Camera] Initializing...")
+        for idx in self.indices:
+            cap = self.capture_factory(idx)
+            if cap.isOpened():
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+                # Keep the driver queue short, the ring buffer does the buffering
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                ret, frame = cap.read()
+                if ret:
+                    self.cap = cap
+                    self.device = idx
+                    with self.lock:
+                        # The old slots are gone: nothing may hand out an unfilled buffer
+                        self._ring = [np.empty_like(frame) for _ in range(self.ring_size)]
+                        self._next = 0
+                        self._latest = None
+                    print(f"[Camera] Opened device {idx}")
+                    self._open_failures = 0
+                    return True
+                cap.release()
+        if not self._open_failures:
+            print("[Camera] No working camera found, retrying in the background.")
+        self._open_failures += 1
+        return False
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, name="camera-grabber", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def _loop(self):
+        backoff = 1.0
+        last_ok = time.monotonic()
+        while self.running:
+            if self.cap is None:
+                if not self._open():
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                backoff = 1.0
+                last_ok = time.monotonic()
+
+            slot = self._next
+            t0 = time.monotonic()
+            ret, frame = self.cap.read(self._ring[slot])
+            now = time.monotonic()
+
+            if not ret or frame is None:
+                self.read_failures += 1
+                if now - last_ok > self.stall_timeout:
+                    print("[Camera] Stalled, reconnecting...")
+                    self.reconnects += 1
+                    self._open()
+                    last_ok = time.monotonic()
+                else:
+                    time.sleep(0.01)
+                continue
+
+            if frame is not self._ring[slot]:
+                # Driver changed size/format: adopt the new buffer
+                self._ring[slot] = frame
+
+            last_ok = now
+            METRICS.observe('camera_grab', now - t0)
+            with self.frame_ready:
+                self._frame_id += 1
+                self._latest = (slot, now, self._frame_id)
+                self._next = (slot + 1) % self.ring_size
+                self._fps_window.append(now)
+                self.frame_ready.notify_all()
+
+    def latest(self, wait=0.0, max_age=None):
+        """Copy of the newest frame as (frame, timestamp, frame_id), or None.
+
+        Waits up to `wait` seconds for a frame if there is none yet, or if the newest
+        one is older than `max_age` seconds (e.g. the camera is reconnecting). Returns
+        None if there is still no frame within `max_age` after the wait.
+        """
+        def fresh():
+            if self._latest is None:
+                return False
+            return max_age is None or time.monotonic() - self._latest[1] <= max_age
+
+        with self.frame_ready:
+            if wait > 0:
+                self.frame_ready.wait_for(fresh, wait)
+            if not fresh():
+                return None
+            slot, ts, frame_id = self._latest
+            # Copy under the lock so the grabber can't recycle the slot mid-copy
+            return self._ring[slot].copy(), ts, frame_id
+
+    def is_healthy(self):
+        with self.lock:
+            return self._latest is not None and time.monotonic() - self._latest[1] < self.stall_timeout
+
+    def record_press(self, press_ts, frame_ts):
+        """Instrumentation: press_ts/frame_ts are time.monotonic() values"""
+        self._press_latency.append(time.monotonic() - press_ts)
+        self._frame_age.append(press_ts - frame_ts)
+        METRICS.observe('camera_press_to_frame', self._press_latency[-1])
+
+    def stats(self):
+        with self.lock:
+            window = list(self._fps_window)
+            latest = self._latest
+        fps = (len(window) - 1) / (window[-1] - window[0]) if len(window) > 1 and window[-1] > window[0] else 0.0
+
+        def ms(values):
+            if not values:
+                return None
+            arr = np.array(values) * 1000
+            return {'last': round(float(arr[-1]), 2), 'p50': round(float(np.median(arr)), 2),
+                    'max': round(float(arr.max()), 2)}
+
+        return {
+            'device': self.device,
+            'healthy': self.is_healthy(),
+            'fps': round(fps, 1),
+            'frames': latest[2] if latest else 0,
+            'last_frame_age_ms': round((time.monotonic() - latest[1]) * 1000, 1) if latest else None,
+            'reconnects': self.reconnects,
+            'read_failures': self.read_failures,
+            'press_to_frame_ms': ms(list(self._press_latency)),
+            'frame_age_at_press_ms': ms(list(self._frame_age)),
+        }
+
+
+class SyntheticCapture:
+    """cv2.VideoCapture stand-in producing noise frames at a fixed rate (no camera needed)"""
+
+    def __init__(self, width=1280, height=720, fps=30.0, seed=0):
+        rng = np.random.default_rng(seed)
+        # A few precomputed frames so generating them doesn't dominate the CPU
+        self._frames = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+        self._interval = 1.0 / fps
+        self._next = time.monotonic()
+        self._i = 0
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return False
+
+    def _pace(self):
+        self._next = max(self._next + self._interval, time.monotonic() - self._interval)
+        time.sleep(max(0.0, self._next - time.monotonic()))
+
+    def read(self, image=None):
+        self._pace()
+        frame = self._frames[self._i % len(self._frames)]
+        self._i += 1
+        if image is not None and image.shape == frame.shape:
+            image[:] = frame
+            return True, image
+        return True, frame.copy()
+
+    def release(self):
+        pass
+
+
+class ReplayCapture(SyntheticCapture):
+    """Loops over a directory of images (or a video file) at a fixed rate"""
+
+    def __init__(self, path, fps=30.0):
+        if os.path.isdir(path):
+            names = sorted(n for n in os.listdir(path) if n.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+            frames = [cv2.imread(os.path.join(path, n)) for n in names]
+        else:
+            cap = cv2.VideoCapture(path)
+            frames = []
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                frames.append(frame)
+            cap.release()
+        self._frames = [f for f in frames if f is not None]
+        if not self._frames:
+            raise ValueError(f"No frames in {path}")
+        self._interval = 1.0 / fps
+        self._next = time.monotonic()
+        self._i = 0
+
+
+def camera_from_source(source, fps=30.0):
+    """CameraGrabber for RDK_CAMERA_SOURCE: '' = V4L2 devices, 'synthetic', or an image dir / video file"""
+    if not source:
+        return CameraGrabber()
+    if source == 'synthetic':
+        return CameraGrabber(indices=(0,), capture_factory=lambda idx: SyntheticCapture(fps=fps))
+    return CameraGrabber(indices=(0,), capture_factory=lambda idx: ReplayCapture(source, fps=fps))
@@ -0,0 +1,186 @@
+import collections
+import os
+import threading
+import time
+
+from image_writer import atomic_write
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def file_version(path):
+    """Token for a file's current contents, (mtime, size) as in the front-end's ETags.
+
+    URLs carrying it as ?v= always refer to the same bytes, so they may be cached as
+    immutable; a rewritten file gets a new token and therefore a new URL.
+    """
+    st = os.stat(path)
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+class CaptureStore:
+    """Keeps the capture folder within a byte and age budget.
+
+    Every file written through write() (or announced with track()) goes into an
+    in-memory index ordered oldest first, so nothing ever lists the directory after
+    startup. A background thread deletes the oldest files once the folder exceeds
+    max_bytes or a file is older than max_age seconds (0 = no age limit), skipping
+    anything a reference source still points to. Reference sources are callables
+    registered with add_references() that return the file names in use, e.g. the
+    current capture and its annotated result.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30, max_age=0, interval=30.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.lock = threading.Lock()
+        self._files = collections.OrderedDict()  # name -> (size, mtime), oldest first
+        self._size = 0
+        self._reference_sources = []
+        self.stats = collections.Counter()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def scan(self):
+        """Index what is already on disk (one directory pass); leftover temp files are removed.
+
+        Files tracked meanwhile (written after startup) stay indexed as the newest.
+        """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith('.tmp'):
+                    self._remove(entry.name)
+                    continue
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.name, st.st_size))
+        with self.lock:
+            tracked = self._files
+            self._files = collections.OrderedDict()
+            for mtime, name, size in sorted(entries):
+                if name not in tracked:
+                    self._files[name] = (size, mtime)
+            self._files.update(tracked)
+            self._size = sum(size for size, _ in self._files.values())
+        return len(entries)
+
+    def clear(self, before=None):
+        """Delete the files in the folder; with `before` (a timestamp) only those last modified earlier"""
+        names = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and (before is None or entry.stat().st_mtime < before):
+                    names.append(entry.name)
+        with self.lock:
+            for name in names:
+                old = self._files.pop(name, None)
+                if old:
+                    self._size -= old[0]
+        for name in names:
+            self._remove(name)
+        return len(names)
+
+    def add_references(self, source):
+        self._reference_sources.append(source)
+
+    def write(self, path, data):
+        """Atomic write (temp file + rename), then index the file"""
+        atomic_write(path, data)
+        self.track(path, memoryview(data).nbytes)
+
+    def track(self, path, size=None):
+        """Index a file that was written into the folder by someone else"""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.directory):
+            return
+        name = os.path.basename(path)
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return
+        with self.lock:
+            old = self._files.pop(name, None)
+            self._size += size - (old[0] if old else 0)
+            self._files[name] = (size, time.time())
+            over = self._size > self.max_bytes
+        if over:
+            self._wake.set()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="capture-store", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _loop(self):
+        while self._running:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._running:
+                return
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"[Store] Eviction failed: {e}")
+
+    def _referenced(self):
+        names = set()
+        for source in self._reference_sources:
+            try:
+                names.update(os.path.basename(p.split('?', 1)[0]) for p in source() if p)
+            except Exception as e:
+                print(f"[Store] Reference source failed: {e}")
+        return names
+
+    def evict(self):
+        """Delete the oldest unreferenced files until the budget holds; returns the number removed"""
+        keep = self._referenced()
+        cutoff = time.time() - self.max_age if self.max_age else None
+        victims = []
+        with self.lock:
+            size = self._size
+            for name, (file_size, mtime) in self._files.items():
+                too_old = cutoff is not None and mtime < cutoff
+                if size <= self.max_bytes and not too_old:
+                    break  # oldest first: everything after is newer and within budget
+                if name in keep:
+                    continue
+                victims.append(name)
+                size -= file_size
+            for name in victims:
+                self._size -= self._files.pop(name)[0]
+            self.stats['evicted'] += len(victims)
+        for name in victims:
+            self._remove(name)
+        if victims:
+            print(f"[Store] Evicted {len(victims)} file(s), {self._size / 1e6:.1f} MB in use")
+        return len(victims)
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def info(self):
+        with self.lock:
+            oldest = next(iter(self._files.values()), None)
+            return {
+                **self.stats,
+                'files': len(self._files),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'max_age_s': self.max_age,
+                'oldest_age_s': round(time.time() - oldest[1], 1) if oldest else None,
+            }
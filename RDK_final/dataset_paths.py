@@ -0,0 +1,42 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def list_images(root):
+    return sorted(p for p in Path(root).rglob("*") if p.suffix.lower() in IMG_EXTS)
+
+
+def iter_images(root):
+    """Like list_images, but streams the tree (sorted per directory) instead of collecting it first"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in IMG_EXTS:
+                yield Path(dirpath) / name
+
+
+def det_images(data_root, split):
+    """Full frames written by make_lesion_dataset.py (splits: train / valid / test)"""
+    return list_images(Path(data_root) / "lesion_det" / split / "images")
+
+
+def det_labels(image_path):
+    """YOLO ground truth of a lesion_det image as an (N, 4) normalized cx, cy, w, h array"""
+    image_path = Path(image_path)
+    label_path = image_path.parent.parent / "labels" / f"{image_path.stem}.txt"
+    rows = []
+    if label_path.exists():
+        for line in label_path.read_text().splitlines():
+            parts = line.split()
+            if len(parts) >= 5:
+                rows.append([float(v) for v in parts[1:5]])
+    return np.array(rows, dtype=np.float32).reshape(-1, 4)
+
+
+def cls_images(data_root, split):
+    """ROI crops written by make_cls_dataset.py (splits: train / val / test), label = parent folder"""
+    return list_images(Path(data_root) / "lesion_cls" / split)
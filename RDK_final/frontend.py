@@ -0,0 +1,294 @@
+"""Front-end worker started by serve.py.
+
+Workers share the public listening socket (inherited fd) and never load the
+models or touch the camera/GPIO. Static files under UI/ are sent with
+socket.sendfile; /api/* is proxied to the core process (app.py) over its Unix
+socket. SSE clients are fanned out from one /api/events stream per worker, so
+the core keeps a fixed number of event streams however many browsers are open.
+"""
+import argparse
+import email.utils
+import http.client
+import http.server
+import json
+import mimetypes
+import os
+import socket
+import socketserver
+import threading
+import urllib.parse
+
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+               'transfer-encoding', 'upgrade', 'server', 'date'}
+EVENT_HEARTBEAT = 15
+TYPES = {'.js': 'text/javascript', '.mjs': 'text/javascript', '.wasm': 'application/wasm', '.webp': 'image/webp'}
+IMMUTABLE = 'public, max-age=31536000, immutable'  # for ?v= URLs, see capture_store.file_version
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def sse_event(version, changes):
+    return f"id: {version}\nevent: state\ndata: {json.dumps({'version': version, 'changes': changes})}\n\n".encode()
+
+
+class EventHub:
+    """Follows the core's /api/events and keeps the merged state, for this worker's SSE clients"""
+
+    def __init__(self, core_socket):
+        self.core_socket = core_socket
+        self.cond = threading.Condition()
+        self.snapshot = {}
+        self.version = None
+        self.seq = 0      # bumped per upstream event
+        self.epoch = 0    # bumped per upstream (re)connect: clients resend the full snapshot
+        self.last = None  # the latest event as received
+        self._thread = None
+
+    def start(self):
+        with self.cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._follow, name="event-hub", daemon=True)
+                self._thread.start()
+
+    def _follow(self):
+        while True:
+            try:
+                conn = UnixHTTPConnection(self.core_socket)
+                conn.request('GET', '/api/events')
+                res = conn.getresponse()
+                first, data = True, []
+                while True:
+                    line = res.readline()
+                    if not line:
+                        break
+                    line = line.decode().rstrip('\n')
+                    if line.startswith('data: '):
+                        data.append(line[6:])
+                    elif not line and data:
+                        self._publish(json.loads("\n".join(data)), reset=first)
+                        first, data = False, []
+            except (OSError, http.client.HTTPException, ValueError):
+                pass
+            threading.Event().wait(1.0)  # core restarting: retry
+
+    def _publish(self, event, reset):
+        with self.cond:
+            if reset:
+                self.snapshot = {}
+                self.epoch += 1
+            self.snapshot.update(event['changes'])
+            self.version = event['version']
+            self.last = sse_event(event['version'], event['changes'])
+            self.seq += 1
+            self.cond.notify_all()
+
+    def stream(self, write):
+        """Serve one SSE client until it disconnects"""
+        self.start()
+        seq, epoch = None, None
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.seq != seq and self.version is not None, EVENT_HEARTBEAT)
+                if self.seq == seq or self.version is None:
+                    chunk = b": keepalive\n\n"
+                elif epoch == self.epoch and self.seq == seq + 1:
+                    chunk = self.last
+                else:
+                    # New client, missed events or a core restart: full snapshot
+                    chunk = sse_event(self.version, dict(self.snapshot))
+                seq, epoch = self.seq, self.epoch
+            write(chunk)
+
+
+class FrontendHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch(head=False)
+
+    def do_HEAD(self):
+        self._dispatch(head=True)
+
+    def do_POST(self):
+        self._proxy()
+
+    do_PUT = do_DELETE = do_OPTIONS = do_POST
+
+    def _dispatch(self, head):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == '/api/events':
+            self._events()
+        elif path.startswith('/api/'):
+            self._proxy()
+        else:
+            self._static(path, head)
+
+    # --- static files -------------------------------------------------------
+
+    def _static(self, path, head):
+        root = self.server.static_root
+        rel = urllib.parse.unquote(path).lstrip('/') or 'index.html'
+        full = os.path.realpath(os.path.join(root, rel))
+        if not full.startswith(root + os.sep) or not os.path.isfile(full):
+            self.send_error(404)
+            return
+        try:
+            f = open(full, 'rb')
+        except OSError:
+            self.send_error(404)
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            ext = os.path.splitext(full)[1].lower()
+            ctype = TYPES.get(ext) or mimetypes.guess_type(full)[0] or 'application/octet-stream'
+            not_modified = etag in (self.headers.get('If-None-Match') or '')
+
+            self.send_response(304 if not_modified else 200)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', email.utils.formatdate(st.st_mtime, usegmt=True))
+            # ?v= matching the file (capture_store.file_version, the ETag's value): cacheable for good
+            version = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).get('v', [None])[0]
+            self.send_header('Cache-Control', IMMUTABLE if version == etag.strip('"') else 'no-cache')
+            if not_modified:
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(st.st_size))
+            self.end_headers()
+            if not head:
+                # Zero-copy from the page cache to the socket
+                self.wfile.flush()
+                self.connection.sendfile(f)
+
+    # --- proxy to the core --------------------------------------------------
+
+    def _upstream(self, fresh=False):
+        local = self.server.local
+        if fresh or getattr(local, 'conn', None) is None:
+            if getattr(local, 'conn', None) is not None:
+                local.conn.close()
+            local.conn = UnixHTTPConnection(self.server.core_socket, timeout=120)
+        return local.conn
+
+    def _drop_upstream(self):
+        conn = getattr(self.server.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.server.local.conn = None
+
+    def _proxy(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+        headers['X-Forwarded-For'] = self.client_address[0] if self.client_address else ''
+
+        res = None
+        for attempt in range(2):
+            # A kept-alive upstream connection may have been closed by the core: retry once on a new one
+            conn = self._upstream(fresh=attempt > 0)
+            try:
+                conn.request(self.command, self.path, body=body, headers=headers)
+                res = conn.getresponse()
+                break
+            except (OSError, http.client.HTTPException):
+                self._drop_upstream()
+        if res is None:
+            self._send_plain(503, b'{"error": "Core not available"}', 'application/json')
+            return
+
+        self.send_response(res.status, res.reason)
+        for key, value in res.getheaders():
+            if key.lower() not in HOP_HEADERS:
+                self.send_header(key, value)
+        streaming = res.getheader('Content-Length') is None and self.command != 'HEAD' \
+            and res.status not in (204, 304)
+        if streaming:
+            # Preview / event streams: no length, the end of the connection ends the body
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+
+        try:
+            if streaming:
+                while True:
+                    chunk = res.read1(65536)
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                self._drop_upstream()
+            else:
+                data = res.read()
+                if self.command != 'HEAD':
+                    self.wfile.write(data)
+        except OSError:
+            # Client went away mid-stream; closing upstream ends the core's generator too
+            self._drop_upstream()
+            self.close_connection = True
+
+    def _events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.server.events.stream(self.wfile.write)
+        except OSError:
+            pass
+
+    def _send_plain(self, status, body, ctype):
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FrontendServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, sock, core_socket, static_root):
+        # The listening socket is bound and listening already (shared by all workers)
+        super().__init__(sock.getsockname()[:2], FrontendHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.core_socket = core_socket
+        self.static_root = os.path.realpath(static_root)
+        self.local = threading.local()
+        self.events = EventHub(core_socket)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Front-end worker (started by serve.py)")
+    parser.add_argument("--fd", type=int, required=True, help="inherited listening socket")
+    parser.add_argument("--core-socket", required=True)
+    parser.add_argument("--static", default="UI")
+    args = parser.parse_args()
+
+    sock = socket.socket(fileno=args.fd)
+    server = FrontendServer(sock, args.core_socket, args.static)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
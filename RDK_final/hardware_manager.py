@@ -1,36 +1,63 @@
 import time
 import threading
-import cv2
+import queue
 import os
 import shutil
 
-# GPIO Setup
-try:
-    import Hobot.GPIO as GPIO
-    print("[Hardware] Using Hobot.GPIO")
-except ImportError:
+from buttons import ButtonEvents
+from camera import CameraGrabber
+from capture_store import file_version
+from image_writer import ImageWriter, atomic_write
+from inference_executor import InferenceExecutor, Job
+
+class MockGPIO:
+    BCM='BCM';IN='IN';OUT='OUT';PUD_UP=22;HIGH=1;LOW=0;FALLING='FALLING'
+    def __init__(self):self._callbacks={}
+    def setmode(self,m):pass
+    def setup(self,p,m,pull_up_down=None):pass
+    def output(self,p,s):pass
+    def input(self,p):return 1 
+    def cleanup(self):pass
+    def setwarnings(self,s):pass
+    def add_event_detect(self,p,edge,callback=None,bouncetime=None):self._callbacks[p]=callback
+    def remove_event_detect(self,p):self._callbacks.pop(p,None)
+    def press(self,p):
+        """Simulate a button press, e.g. GPIO.press(17) from a test or benchmark"""
+        if self._callbacks.get(p):self._callbacks[p](p)
+
+# GPIO Setup (RDK_MOCK_GPIO=1 forces the mock, e.g. for benchmarks on the device)
+if os.environ.get('RDK_MOCK_GPIO') == '1':
+    GPIO = MockGPIO()
+    print("[Hardware] Using MockGPIO (RDK_MOCK_GPIO=1)")
+else:
     try:
-        import RPi.GPIO as GPIO
-        print("[Hardware] Using RPi.GPIO")
+        import Hobot.GPIO as GPIO
+        print("[Hardware] Using Hobot.GPIO")
     except ImportError:
-        class MockGPIO:
-            BCM='BCM';IN='IN';OUT='OUT';PUD_UP=22;HIGH=1;LOW=0
-            def setmode(self,m):pass
-            def setup(self,p,m,pull_up_down=None):pass
-            def output(self,p,s):pass
-            def input(self,p):return 1 
-            def cleanup(self):pass
-            def setwarnings(self,s):pass
-        GPIO = MockGPIO()
+        try:
+            import RPi.GPIO as GPIO
+            print("[Hardware] Using RPi.GPIO")
+        except ImportError:
+            GPIO = MockGPIO()
 
 class HardwareManager:
-    def __init__(self, inference_engine=None, capture_dir='UI/captures'):
+    def __init__(self, inference_engine=None, capture_dir='UI/captures', executor=None, writer=None,
+                 result_cache=None, camera=None, buttons=None, store=None):
         self.BTN1_PIN = 17
         self.BTN2_PIN = 27
         self.LED1_PIN = 22
         self.LED2_PIN = 23
         
         self.inference_engine = inference_engine
+        self.executor = executor or InferenceExecutor()
+        # Optional CaptureStore: keeps capture_dir within budget, never evicting the files on screen
+        self.store = store
+        if store is not None:
+            store.add_references(self._referenced_files)
+        # JPEGs for the UI are written in the background; inference uses the in-memory image
+        self.writer = writer or ImageWriter(store=store)
+        # Optional ResultCache: re-uploaded files are answered without running the models
+        self.result_cache = result_cache
         self.capture_dir = capture_dir
         if not os.path.exists(capture_dir):
             os.makedirs(capture_dir)
@@ -39,7 +66,8 @@ class HardwareManager:
         self.state = {
             'mode': 1,
             'last_image_url': None,
-            'last_image_ts': 0,
+            'last_image_ts': 0,  # wall clock, ms
+            'last_image_seq': 0,  # capture sequence of last_image_url; the UI compares this
             'analysis_result': None,
             'is_processing': False,
             'session_active': False
@@ -47,7 +75,11 @@ class HardwareManager:
         
         self.running = False
         self.lock = threading.Lock()
-        self.cap = None
+        # Bumped (under lock) on every state change; SSE streams wait on it
+        self.version = 0
+        self.state_changed = threading.Condition(self.lock)
+        # Bumped on every new image; AI results for an older image are never published
+        self._capture_seq = 0
 
         # Init GPIO
         try:
@@ -64,26 +96,12 @@ class HardwareManager:
         except Exception as e:
             print(f"[Hardware] GPIO Init Error: {e}")
 
-        self._init_camera()
-
-    def _init_camera(self):
-        if self.cap:
-            try: self.cap.release()
-            except: pass
-        
-        print("[Camera] Initializing...")
-        for idx in [0, 1, 8, 10]:
-            cap = cv2.VideoCapture(idx)
-            if cap.isOpened():
-                cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-                ret, _ = cap.read()
-                if ret:
-                    self.cap = cap
-                    print(f"[Camera] Opened device {idx}")
-                    return
-                cap.release()
-        print("[Camera] No working camera found.")
+        self.camera = camera or CameraGrabber()
+        # Presses arrive as GPIO edge events (polling where unsupported); inject with buttons.emit(pin)
+        self.buttons = buttons or ButtonEvents(GPIO, (self.BTN1_PIN, self.BTN2_PIN),
+                                               bouncetime_ms=int(os.environ.get('RDK_BUTTON_BOUNCE_MS', 200)))
+        # Captures run on their own thread so a slow grab never stalls the buttons; one may wait
+        self._captures = queue.Queue(maxsize=1)
 
     def reset_session(self):
         with self.lock:
@@ -92,43 +110,140 @@ class HardwareManager:
             self.state['analysis_result'] = None
             self.state['is_processing'] = False
             self.state['session_active'] = True
+            self._notify()
+
+    def inject_image(self, filepath, data=None):
+        """Allows external source (like file upload) to process an image.
 
-    def inject_image(self, filepath):
-        """Allows external source (like file upload) to process an image"""
+        With data (the encoded file), the file is written in the background and
+        inference decodes the bytes directly; otherwise filepath must already exist.
+        """
         print(f"[Inject] Processing external image: {filepath}")
         
         # Ensure it's in our capture dir (app.py puts it there, but relative path needed for UI)
         filename = os.path.basename(filepath)
-        
+        ts = time.time_ns() // 1_000_000
+        seq = self._new_capture()
+
+        job = self._trigger_ai_if_needed(filepath if data is None else data, filename, seq)
+        if data is None:
+            self._publish_image(filename, ts, seq)
+        else:
+            self.writer.write(filepath, data, on_done=lambda _: self._publish_image(filename, ts, seq))
+        return job
+
+    def _new_capture(self):
+        """Start a new capture: older AI results are no longer published"""
         with self.lock:
-            self.state['last_image_url'] = f"captures/{filename}"
-            self.state['last_image_ts'] = int(time.time())
+            self._capture_seq += 1
             self.state['is_processing'] = False
             self.state['analysis_result'] = None
+            self._notify()
+            return self._capture_seq
 
-        self._trigger_ai_if_needed(filepath, filename)
+    def _publish_image(self, filename, ts, seq):
+        # Runs once the JPEG is on disk, so the UI never requests a missing file
+        with self.lock:
+            if seq != self._capture_seq:
+                return
+            # Versioned: the browser may cache it for good (see file_version)
+            path = os.path.join(self.capture_dir, filename)
+            self.state['last_image_url'] = f"captures/{filename}?v={file_version(path)}"
+            self.state['last_image_ts'] = ts
+            self.state['last_image_seq'] = seq
+            self._notify()
 
-    def _trigger_ai_if_needed(self, filepath, filename):
+    def _trigger_ai_if_needed(self, image, filename, seq):
+        """Queue analysis of image (ndarray, bytes or path) in Mode 2.
+
+        Returns the executor Job, an already finished Job on a result cache hit, or
+        None if not queued.
+        """
         if self.state['mode'] == 2 and self.inference_engine:
+            # One engine for the whole job, even if a new model version is swapped in meanwhile
+            engine = self.inference_engine
+            # Camera frames never repeat, only encoded files (uploads, paths) are worth hashing.
+            # Looked up here so a hit is published at once instead of waiting behind queued jobs
+            cache_key = None
+            if self.result_cache is not None and isinstance(image, (bytes, str)):
+                if isinstance(image, str):
+                    with open(image, 'rb') as f:
+                        image = f.read()
+                cache_key = self.result_cache.key(image, engine.result_version())
+                cached = self.result_cache.get(cache_key)
+                if cached is not None:
+                    return self._publish_cached(engine, cached, filename, seq)
+
             print("[AI] Analyzing...")
-            with self.lock: self.state['is_processing'] = True
-            
-            def run_ai():
-                try:
-                    res = self.inference_engine.run_inference(filepath)
-                    if 'annotatedPath' in res:
-                        fname = os.path.basename(res['annotatedPath'])
-                        res['annotatedUrl'] = f"captures/{fname}"
-                        
-                    with self.lock:
-                        self.state['analysis_result'] = res
+            with self.lock:
+                self.state['is_processing'] = True
+                self._notify()
+
+            job = self.executor.submit(self._run_ai, engine, image, filename, cache_key, key='capture',
+                                       on_done=lambda job: self._publish_result(job, seq))
+            if job is None:
+                print("[AI] Busy, analysis rejected")
+                with self.lock:
+                    if seq == self._capture_seq:
                         self.state['is_processing'] = False
-                    print("[AI] Done.")
-                except Exception as e:
-                    print(f"[AI] Error: {e}")
-                    with self.lock: self.state['is_processing'] = False
+                        self._notify()
+            return job
+        if self.state['mode'] == 2:
+            print("[AI] Models not loaded (yet), capture not analyzed")
+        return None
+
+    def _annotated_path(self, filename):
+        stem = os.path.splitext(filename)[0]
+        return os.path.join(self.capture_dir, f"{stem}_annotated.jpg")
 
-            threading.Thread(target=run_ai).start()
+    def _publish_cached(self, engine, cached, filename, seq):
+        print("[AI] Cache hit")
+        annotated_path = self._annotated_path(filename)
+        if self.store is not None:
+            self.store.write(annotated_path, cached['annotated'])
+        else:
+            atomic_write(annotated_path, cached['annotated'])
+        res = {'status': cached['status'], 'predictions': cached['predictions'],
+               'annotatedPath': annotated_path, 'cached': True, 'modelVersion': engine.version,
+               'annotatedUrl': f"captures/{os.path.basename(annotated_path)}?v={file_version(annotated_path)}"}
+
+        job = Job(None, None, (), None, 'capture')
+        job.status, job.result, job.finished = 'done', res, time.time()
+        self._publish_result(job, seq)
+        return job
+
+    def _run_ai(self, engine, image, filename, cache_key):
+        annotated_path = self._annotated_path(filename)
+        res = engine.run_inference(image, annotated_path=annotated_path)
+        res['modelVersion'] = engine.version
+        if self.store is not None:
+            self.store.track(annotated_path)
+        if cache_key is not None:
+            with open(annotated_path, 'rb') as f:
+                self.result_cache.put(cache_key, {'status': res['status'], 'predictions': res['predictions'],
+                                                  'annotated': f.read()})
+        if res.get('annotatedPath'):
+            fname = os.path.basename(res['annotatedPath'])
+            res['annotatedUrl'] = f"captures/{fname}?v={file_version(res['annotatedPath'])}"
+        return res
+
+    def _referenced_files(self):
+        with self.lock:
+            result = self.state['analysis_result'] or {}
+            return [self.state['last_image_url'], result.get('annotatedUrl')]
+
+    def _publish_result(self, job, seq):
+        with self.lock:
+            if seq != self._capture_seq:
+                print(f"[AI] Job {job.id} is for an older image, not published")
+                return
+            if job.status == 'done':
+                self.state['analysis_result'] = job.result
+                print("[AI] Done.")
+            else:
+                print(f"[AI] Error: {job.error}")
+            self.state['is_processing'] = False
+            self._notify()
 
     def _update_leds(self):
         try:
@@ -142,78 +257,93 @@ class HardwareManager:
 
     def start(self):
         self.running = True
-        t = threading.Thread(target=self._loop)
-        t.daemon = True
-        t.start()
+        self.camera.start()
+        self.buttons.start()
+        for target in (self._loop, self._capture_loop):
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
 
     def stop(self):
         self.running = False
-        if self.cap: self.cap.release()
+        self.buttons.stop()
+        self.executor.stop()
+        self.camera.stop()
+        self.writer.flush()
+        self.writer.stop()
         try: GPIO.cleanup()
         except: pass
 
     def _loop(self):
         print("[Hardware] Loop started")
-        last_btn1 = 0; last_btn2 = 0; debounce = 1.0
-
         while self.running:
+            event = self.buttons.get(timeout=0.5)
+            if event is None:
+                continue
             try:
-                b1 = GPIO.input(self.BTN1_PIN)
-                b2 = GPIO.input(self.BTN2_PIN)
-                now = time.time()
-
-                if b1 == 0 and (now - last_btn1) > debounce:
-                    last_btn1 = now
+                if event.pin == self.BTN1_PIN:
                     print("[Hardware] Button 1 Pressed")
-                    self._handle_capture()
+                    try:
+                        self._captures.put_nowait(event.ts)
+                    except queue.Full:
+                        print("[Hardware] Capture already pending, press ignored")
 
-                if b2 == 0 and (now - last_btn2) > debounce:
-                    last_btn2 = now
+                elif event.pin == self.BTN2_PIN:
                     with self.lock:
                         self.state['mode'] = 3 - self.state['mode']
                         self._update_leds()
                         self.state['analysis_result'] = None 
+                        self._notify()
                         print(f"[Hardware] Mode -> {self.state['mode']}")
-
-                time.sleep(0.05)
             except Exception as e:
                 print(f"[Hardware] Loop Error: {e}")
-                time.sleep(1)
-
-    def _flush_buffer(self):
-        for _ in range(5):
-            self.cap.grab()
-        return self.cap.read()
 
-    def _handle_capture(self):
-        if not self.cap or not self.cap.isOpened():
-            self._init_camera()
-        
-        if not self.cap: return
+    def _capture_loop(self):
+        while self.running:
+            try:
+                press_ts = self._captures.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._handle_capture(press_ts)
+            except Exception as e:
+                print(f"[Hardware] Capture Error: {e}")
 
-        ret, frame = self._flush_buffer()
-        if not ret:
-            print("[Camera] Retry...")
-            self._init_camera()
-            if self.cap: ret, frame = self._flush_buffer()
-        
-        if not ret or frame is None:
+    def _handle_capture(self, press_ts=None):
+        press_ts = press_ts or time.monotonic()
+        # Freshest frame from the grabber; only wait if the camera is (re)connecting
+        grabbed = self.camera.latest(wait=2.0, max_age=self.camera.stall_timeout)
+        if grabbed is None:
             print("[Camera] Failed.")
             return
 
-        ts = int(time.time())
+        frame, frame_ts, _ = grabbed
+        self.camera.record_press(press_ts, frame_ts)
+
+        # Millisecond names: presses are only debounced by the bouncetime now, not a full second
+        ts = time.time_ns() // 1_000_000
         filename = f"capture_{ts}.jpg"
         filepath = os.path.join(self.capture_dir, filename)
-        cv2.imwrite(filepath, frame)
-        print(f"[Camera] Saved {filepath}")
+        seq = self._new_capture()
 
-        with self.lock:
-            self.state['last_image_url'] = f"captures/{filename}"
-            self.state['last_image_ts'] = ts
-            self.state['is_processing'] = False
-            self.state['analysis_result'] = None
+        # Inference starts on the raw frame; the JPEG for the UI is encoded in the background
+        self._trigger_ai_if_needed(frame, filename, seq)
+        self.writer.write(filepath, frame, on_done=lambda path: self._publish_image(filename, ts, seq))
+        print(f"[Camera] Captured {filepath}")
 
-        self._trigger_ai_if_needed(filepath, filename)
+    def _notify(self):
+        # Caller holds self.lock
+        self.version += 1
+        self.state_changed.notify_all()
 
     def get_state(self):
         with self.lock: return self.state.copy()
+
+    def get_versioned_state(self):
+        with self.lock: return self.version, self.state.copy()
+
+    def wait_for_change(self, since_version, timeout=None):
+        """Block until the state version differs from since_version (or timeout), returns (version, state)"""
+        with self.state_changed:
+            self.state_changed.wait_for(lambda: self.version != since_version, timeout)
+            return self.version, self.state.copy()
@@ -0,0 +1,79 @@
+import collections
+import os
+import queue
+import threading
+
+from metrics import METRICS
+
+
+def atomic_write(path, data):
+    """Write to a temp name and rename, so readers never see a half-written file"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ImageWriter:
+    """Background JPEG writer, keeps encoding and SD-card I/O off the capture path.
+
+    write() accepts a BGR ndarray (encoded here) or already encoded bytes (written
+    as-is). Files are written to a temp name and renamed, so the UI never fetches
+    a half-written image; on_done(path) runs once the file is in place. With a
+    CaptureStore, written files count against its budget.
+    """
+
+    def __init__(self, max_queue=8, quality=95, store=None):
+        self.quality = quality
+        self.store = store
+        self._queue = queue.Queue(max_queue)
+        self.stats = collections.Counter()
+        self._thread = threading.Thread(target=self._loop, name="image-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path, image, on_done=None):
+        # Blocks when the queue is full: back-pressure instead of unbounded memory
+        self._queue.put((path, image, on_done))
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            path, image, on_done = item
+            try:
+                with METRICS.time('jpeg_write'):
+                    self._write(path, image)
+                self.stats['written'] += 1
+                if on_done:
+                    on_done(path)
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"[Writer] {path} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, path, image):
+        if not isinstance(image, (bytes, bytearray, memoryview)):
+            import cv2  # imported on first use: app startup stays free of OpenCV
+            ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                raise ValueError("JPEG encoding failed")
+            image = buf
+        if self.store is not None:
+            self.store.write(path, image)
+        else:
+            atomic_write(path, image)
+        self.stats['bytes'] += memoryview(image).nbytes
+
+    def flush(self):
+        """Wait until everything queued so far is on disk"""
+        self._queue.join()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
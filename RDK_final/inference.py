@@ -1,146 +1,386 @@
 import cv2
+import hashlib
 import numpy as np
-import onnxruntime as ort
 import os
+import threading
+import time
+
+from image_writer import atomic_write
+from metrics import METRICS
+from postprocess import merge_detections, postprocess, tile_grid
+from preprocess import Letterbox
+from session_config import create_session, load_session_config
+
+# Quantized/converted variants live next to the FP32 model, e.g. best_det.int8_static.onnx
+MODEL_VARIANTS = ('fp32', 'int8_dynamic', 'int8_static', 'fp16')
+
+
+def variant_path(model_path, variant):
+    if variant == 'fp32':
+        return model_path
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext}"
+
 
 class ModelInference:
-    def __init__(self, det_model_path, cls_model_path):
-        self.det_session = ort.InferenceSession(det_model_path)
-        self.cls_session = ort.InferenceSession(cls_model_path)
+    def __init__(self, det_model_path, cls_model_path, session_config=None, variant=None, tiled=None,
+                 verbose=None):
+        self.session_config = session_config or load_session_config()
+        self.variant = variant or self.session_config['model_variant']
+        if self.variant not in MODEL_VARIANTS:
+            raise ValueError(f"Unknown model variant: {self.variant}")
+
+        det_variant = variant_path(det_model_path, self.variant)
+        cls_variant = variant_path(cls_model_path, self.variant)
+        if os.path.exists(det_variant) and os.path.exists(cls_variant):
+            det_model_path, cls_model_path = det_variant, cls_variant
+        elif self.variant != 'fp32':
+            print(f"[AI] Variant '{self.variant}' not found, falling back to fp32")
+            self.variant = 'fp32'
+
+        self.model_files = (det_model_path, cls_model_path)
+        # Identity of the files as loaded: replacing them on disk must not change result_version()
+        self._file_ids = []
+        for path in self.model_files:
+            st = os.stat(path)
+            self._file_ids.append((os.path.basename(path), st.st_size, st.st_mtime_ns))
+        self.det_session, self.det_model_path = create_session(det_model_path, self.session_config)
+        self.cls_session, self.cls_model_path = create_session(cls_model_path, self.session_config)
         
         # raw labels from model
         self.cls_labels = ['skin_cancer', 'eczema', 'unknown'] 
         
         self.det_shape = (640, 640)
         self.cls_shape = (224, 224) 
+        # Preallocated preprocessing buffers, one engine per target shape
+        self.letterboxes = {shape: Letterbox(shape) for shape in (self.det_shape, self.cls_shape)}
         
         self.conf_threshold = 0.25
         self.iou_threshold = 0.45
+        # Per-call [AI Debug] lines (max detection score, every crop's class); RDK_AI_DEBUG=1 turns them on
+        self.verbose = os.environ.get('RDK_AI_DEBUG') == '1' if verbose is None else verbose
+
+        # Sliced detection: overlapping tiles at native resolution, so small lesions keep their pixels
+        cfg = self.session_config
+        self.tiled = cfg['tiled_detection'] if tiled is None else tiled
+        self.tile_size = cfg['tile_size']
+        self.tile_overlap = cfg['tile_overlap']
+        self.tile_full_frame = cfg['tile_full_frame']
+
+        self.det_input_name = self.det_session.get_inputs()[0].name
+        self.cls_input_name = self.cls_session.get_inputs()[0].name
+
+        # Exported models may have a fixed batch dim (usually 1); dynamic dims are strings/None
+        self.det_batch = self._fixed_batch(self.det_session)
+        self.cls_batch = self._fixed_batch(self.cls_session)
+
+        # Set by ModelRegistry: the version folder name, a prefix for this engine's stage metrics
+        # (e.g. a shadow candidate's) and result_hook(images, results), called after every analyze()
+        self.version = 'default'
+        self.stage_prefix = ''
+        self.result_hook = None
+        self.loaded_at = time.time()
+        self.load_ms = None
+
+        # ONNX Runtime profiling (start_profiling): swapped-in sessions and the runs left
+        self._profile_lock = threading.Lock()
+        self._profile = None
+        self.profile_files = []
+
+    @staticmethod
+    def _fixed_batch(session):
+        batch = session.get_inputs()[0].shape[0]
+        return batch if isinstance(batch, int) and batch > 0 else None
+
+    def warmup(self, runs=None):
+        """Push dummy tensors through both sessions so the first capture doesn't pay the cold start"""
+        runs = self.session_config['warmup_runs'] if runs is None else runs
+        det_input = np.zeros((1, 3) + self.det_shape, dtype=np.float32)
+        cls_input = np.zeros((self.cls_batch or 1, 3) + self.cls_shape, dtype=np.float32)
+
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            self.det_session.run(None, {self.det_input_name: det_input})
+            self.cls_session.run(None, {self.cls_input_name: cls_input})
+        print(f"[AI] Warm-up: {runs} run(s) in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    def session_info(self):
+        cfg = self.session_config
+        return {
+            "version": self.version,
+            "variant": self.variant,
+            "det": {"model": self.det_model_path, "providers": self.det_session.get_providers()},
+            "cls": {"model": self.cls_model_path, "providers": self.cls_session.get_providers()},
+            "graph_optimization_level": cfg['graph_optimization_level'],
+            "execution_mode": cfg['execution_mode'],
+            "intra_op_num_threads": cfg['intra_op_num_threads'],
+            "inter_op_num_threads": cfg['inter_op_num_threads'],
+            "tiled_detection": self.tiled,
+            "tile_size": self.tile_size,
+            "tile_overlap": self.tile_overlap,
+        }
+
+    def start_profiling(self, runs, out_dir='profiles'):
+        """Run the next `runs` analyze() calls on sessions with the ONNX Runtime profiler enabled.
+
+        Trace files (chrome://tracing format) are written to out_dir when the runs are done
+        and listed in profiling_info(). Raises RuntimeError if a profile is already running.
+        """
+        with self._profile_lock:
+            if self._profile is not None:
+                raise RuntimeError("Profiling already running")
+            os.makedirs(out_dir, exist_ok=True)
+            det, _ = create_session(self.model_files[0], self.session_config,
+                                    profile_prefix=os.path.join(out_dir, 'det'))
+            cls, _ = create_session(self.model_files[1], self.session_config,
+                                    profile_prefix=os.path.join(out_dir, 'cls'))
+            self._profile = {'runs': runs, 'runs_left': runs, 'sessions': (self.det_session, self.cls_session)}
+            self.det_session, self.cls_session = det, cls
+        print(f"[AI] Profiling the next {runs} run(s)")
+
+    def _profile_tick(self):
+        if self._profile is None:
+            return
+        with self._profile_lock:
+            if self._profile is None:
+                return
+            self._profile['runs_left'] -= 1
+            if self._profile['runs_left'] > 0:
+                return
+            det, cls = self.det_session, self.cls_session
+            self.det_session, self.cls_session = self._profile['sessions']
+            self._profile = None
+            self.profile_files = [det.end_profiling(), cls.end_profiling()]
+        print(f"[AI] Profiles written: {', '.join(self.profile_files)}")
+
+    def profiling_info(self):
+        with self._profile_lock:
+            return {
+                'active': self._profile is not None,
+                'runs': self._profile['runs'] if self._profile else None,
+                'runs_left': self._profile['runs_left'] if self._profile else None,
+                'files': list(self.profile_files),
+            }
+
+    def result_version(self):
+        """Short hash of everything that changes results: model version and files, variant, thresholds, labels"""
+        key = (self.version, self._file_ids, self.variant, self.conf_threshold, self.iou_threshold, self.cls_labels)
+        if self.tiled:
+            key += (self.tile_size, self.tile_overlap, self.tile_full_frame)
+        return hashlib.sha1(repr(key).encode()).hexdigest()[:12]
 
     def preprocess(self, image, target_shape):
-        shape = image.shape[:2]
-        r = min(target_shape[0] / shape[0], target_shape[1] / shape[1])
-        new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
-        
-        dw, dh = target_shape[1] - new_unpad[0], target_shape[0] - new_unpad[1]
-        dw /= 2
-        dh /= 2
+        """Letterbox one image; the tensor is a reused buffer, valid until the next call"""
+        if target_shape not in self.letterboxes:
+            self.letterboxes[target_shape] = Letterbox(target_shape)
+        return self.letterboxes[target_shape](image)
 
-        if shape[::-1] != new_unpad:
-            image = cv2.resize(image, new_unpad, interpolation=cv2.INTER_LINEAR)
-        
-        top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
-        left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
-        
-        img = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
-        
-        img = img.transpose((2, 0, 1))[::-1] 
-        img = np.ascontiguousarray(img)
-        img = img.astype(np.float32) / 255.0
-        img = img[None] 
-        return img, (r, (dw, dh))
-
-    def xywh2xyxy(self, x):
-        y = np.copy(x)
-        y[..., 0] = x[..., 0] - x[..., 2] / 2
-        y[..., 1] = x[..., 1] - x[..., 3] / 2
-        y[..., 2] = x[..., 0] + x[..., 2] / 2
-        y[..., 3] = x[..., 1] + x[..., 3] / 2
-        return y
-
-    def nms(self, prediction):
-        prediction = prediction[0].transpose(1, 0)
-        boxes = prediction[:, :4]
-        scores = np.max(prediction[:, 4:], axis=1)
-        
-        print(f"[AI Debug] Max detection confidence: {np.max(scores):.4f}")
-        
-        mask = scores > self.conf_threshold
-        boxes = boxes[mask]
-        scores = scores[mask]
-        
-        if len(boxes) == 0:
-            return []
+    def detect(self, image, stage_prefix=None, verbose=None):
+        """Run the detector on a BGR image, returns a DETECTION_DTYPE array in image coords.
 
-        boxes = self.xywh2xyxy(boxes)
-        indices = cv2.dnn.NMSBoxes(boxes.tolist(), scores.tolist(), self.conf_threshold, self.iou_threshold)
-        
-        if len(indices) == 0:
-            return []
-            
-        return [boxes[i] for i in indices.flatten()]
+        stage_prefix / verbose override the engine's for this call (e.g. the live overlay's).
+        """
+        prefix = self.stage_prefix if stage_prefix is None else stage_prefix
+        with METRICS.time(prefix + 'preprocess'):
+            input_tensor, ratio_pad = self.preprocess(image, self.det_shape)
+        with METRICS.time(prefix + 'detect'):
+            det_output = self.det_session.run(None, {self.det_input_name: input_tensor})
+
+        prediction = det_output[0]
+        if self.verbose if verbose is None else verbose:
+            print(f"[AI Debug] Max detection confidence: {np.max(prediction[0, 4:]):.4f}")
+
+        with METRICS.time(prefix + 'nms'):
+            return postprocess(prediction, self.conf_threshold, self.iou_threshold,
+                               ratio_pad, image.shape[:2])
+
+    def classify(self, crops, stage_prefix=None):
+        """Classify a list of BGR crops, returns an (N, num_classes) probability array"""
+        if not crops:
+            return np.zeros((0, len(self.cls_labels)), dtype=np.float32)
+
+        prefix = self.stage_prefix if stage_prefix is None else stage_prefix
+        with METRICS.time(prefix + 'classify_preprocess'):
+            batch, _ = self.letterboxes[self.cls_shape].batch(crops)
+
+        t0 = time.perf_counter()
+        try:
+            return self._run_classifier(batch)
+        finally:
+            elapsed = time.perf_counter() - t0
+            METRICS.observe(prefix + 'classify', elapsed)
+            METRICS.observe(prefix + 'classify_per_crop', elapsed / len(crops))
+
+    def _run_classifier(self, batch):
+        if self.cls_batch is None:
+            return self.cls_session.run(None, {self.cls_input_name: batch})[0]
+
+        # Fixed batch model: run in chunks, padding the last one to the exported size
+        outputs = []
+        for start in range(0, len(batch), self.cls_batch):
+            chunk = batch[start:start + self.cls_batch]
+            n = len(chunk)
+            if n < self.cls_batch:
+                pad = np.zeros((self.cls_batch - n,) + chunk.shape[1:], dtype=chunk.dtype)
+                chunk = np.concatenate([chunk, pad], axis=0)
+            outputs.append(self.cls_session.run(None, {self.cls_input_name: chunk})[0][:n])
+        return np.concatenate(outputs, axis=0)
+
+    def detect_batch(self, images, max_batch=4):
+        """Detect on several images, batching them through the detector when its batch dim is dynamic"""
+        if self.det_batch is not None or len(images) < 2:
+            return [self.detect(image) for image in images]
+
+        detections = []
+        for start in range(0, len(images), max_batch):
+            chunk = images[start:start + max_batch]
+            with METRICS.time(self.stage_prefix + 'preprocess'):
+                tensor, ratio_pads = self.letterboxes[self.det_shape].batch(chunk)
+            with METRICS.time(self.stage_prefix + 'detect'):
+                prediction = self.det_session.run(None, {self.det_input_name: tensor})[0]
+            for i, image in enumerate(chunk):
+                if self.verbose:
+                    print(f"[AI Debug] Max detection confidence: {np.max(prediction[i, 4:]):.4f}")
+                with METRICS.time(self.stage_prefix + 'nms'):
+                    detections.append(postprocess(prediction[i:i + 1], self.conf_threshold, self.iou_threshold,
+                                                  ratio_pads[i], image.shape[:2]))
+        return detections
+
+    def detect_tiled(self, image):
+        """Detect on overlapping tile_size tiles (plus the whole frame if tile_full_frame), merged by global NMS.
+
+        All tiles go through the detector as one batch when its batch dim is dynamic.
+        Images that fit in a single tile take the plain detect() path.
+        """
+        h, w = image.shape[:2]
+        if max(h, w) <= self.tile_size:
+            return self.detect(image)
+
+        tiles = tile_grid((h, w), self.tile_size, self.tile_overlap)
+        crops = [image[y:y + th, x:x + tw] for x, y, tw, th in tiles]
+        offsets = [(x, y) for x, y, _, _ in tiles]
+        if self.tile_full_frame:
+            crops.append(image)
+            offsets.append((0, 0))
+
+        parts = self.detect_batch(crops, max_batch=len(crops))
+        with METRICS.time(self.stage_prefix + 'tile_merge'):
+            return merge_detections(parts, offsets, self.iou_threshold)
+
+    def analyze(self, images, progress=None, det_batch=4):
+        """Detect + classify a list of BGR images in one batched pass.
+
+        Returns one list of {"bbox", "class", "confidence"} dicts per image.
+        progress(step, fraction) is called between stages if given.
+        """
+        progress = progress or (lambda step, fraction: None)
+        t0 = time.perf_counter()
 
-    def run_inference(self, image_path):
-        original_img = cv2.imread(image_path)
-        if original_img is None:
-            raise ValueError(f"Could not read image: {image_path}")
-            
-        img_h, img_w = original_img.shape[:2]
-        
         # 1. Detection
-        input_tensor, (ratio, (dw, dh)) = self.preprocess(original_img, self.det_shape)
-        input_name = self.det_session.get_inputs()[0].name
-        det_output = self.det_session.run(None, {input_name: input_tensor})
-        
-        boxes = self.nms(det_output[0])
-        results = []
-        
-        annotated_img = original_img.copy()
-
-        if boxes:
-            for box in boxes:
-                x1 = int((box[0] - dw) / ratio)
-                y1 = int((box[1] - dh) / ratio)
-                x2 = int((box[2] - dw) / ratio)
-                y2 = int((box[3] - dh) / ratio)
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(img_w, x2), min(img_h, y2)
-                
-                crop = original_img[y1:y2, x1:x2]
-                if crop.size == 0: continue
-                
-                # 2. Classification
-                cls_input, _ = self.preprocess(crop, self.cls_shape)
-                cls_name = self.cls_session.get_inputs()[0].name
-                cls_output = self.cls_session.run(None, {cls_name: cls_input})
-                
-                probs = cls_output[0][0]
-                cls_idx = np.argmax(probs)
-                confidence = float(probs[cls_idx])
-                
-                label = self.cls_labels[cls_idx] if cls_idx < len(self.cls_labels) else 'unknown'
-                
+        progress("Detecting skin regions", 0.1)
+        if self.tiled:
+            detections = [self.detect_tiled(image) for image in images]
+        else:
+            detections = self.detect_batch(images, max_batch=det_batch)
+
+        owners, crops = [], []
+        for i, (image, dets) in enumerate(zip(images, detections)):
+            for x1, y1, x2, y2 in dets['box'].tolist():
+                owners.append((i, [x1, y1, x2, y2]))
+                crops.append(image[y1:y2, x1:x2])
+
+        # 2. Classification (all crops of all images in one batch)
+        progress("Analyzing visual patterns", 0.5)
+        probs_all = self.classify(crops)
+
+        results = [[] for _ in images]
+        for (i, bbox), probs in zip(owners, probs_all):
+            cls_idx = np.argmax(probs)
+            confidence = float(probs[cls_idx])
+
+            label = self.cls_labels[cls_idx] if cls_idx < len(self.cls_labels) else 'unknown'
+
+            if self.verbose:
                 print(f"[AI Debug] Class: {label}, Conf: {confidence:.4f}")
 
-                results.append({
-                    "bbox": [x1, y1, x2, y2],
-                    "class": label,
-                    "confidence": confidence
-                })
-                
-                if label == 'skin_cancer':
-                    color = (0, 0, 255) # Red
-                elif label == 'eczema':
-                    color = (0, 165, 255) # Orange
-                else:
-                    color = (0, 255, 0) # Green
-
-                cv2.rectangle(annotated_img, (x1, y1), (x2, y2), color, 2)
-                cv2.putText(annotated_img, f"{label} {confidence:.2f}", (x1, y1-10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-
-        # Status Logic
+            results[i].append({
+                "bbox": bbox,
+                "class": label,
+                "confidence": confidence
+            })
+        METRICS.observe(self.stage_prefix + 'analyze', time.perf_counter() - t0)
+        self._profile_tick()
+        if self.result_hook:
+            self.result_hook(images, results)
+        return results
+
+    def annotate(self, image, predictions):
+        with METRICS.time(self.stage_prefix + 'annotate'):
+            return self._annotate(image, predictions)
+
+    def _annotate(self, image, predictions):
+        annotated_img = image.copy()
+        for p in predictions:
+            x1, y1, x2, y2 = p['bbox']
+            label, confidence = p['class'], p['confidence']
+
+            if label == 'skin_cancer':
+                color = (0, 0, 255) # Red
+            elif label == 'eczema':
+                color = (0, 165, 255) # Orange
+            else:
+                color = (0, 255, 0) # Green
+
+            cv2.rectangle(annotated_img, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(annotated_img, f"{label} {confidence:.2f}", (x1, y1-10), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        return annotated_img
+
+    @staticmethod
+    def image_status(predictions):
         status = "normal"
-        if any(r['class'] == 'skin_cancer' for r in results):
+        if any(r['class'] == 'skin_cancer' for r in predictions):
             status = "detected"
-        elif any(r['class'] == 'eczema' for r in results):
+        elif any(r['class'] == 'eczema' for r in predictions):
             status = "detected" # Or 'warning'
+        return status
+
+    @staticmethod
+    def load_image(source):
+        """BGR ndarray from an ndarray (returned as is), encoded image bytes, or a file path"""
+        if isinstance(source, np.ndarray):
+            return source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+        return cv2.imread(os.fspath(source))
+
+    def run_inference(self, image, annotated_path=None):
+        """Analyze one image (ndarray, encoded bytes or path) and write the annotated copy.
+
+        annotated_path defaults to <image>_annotated.jpg when image is a path.
+        """
+        if isinstance(image, np.ndarray):
+            original_img = image
+        else:
+            with METRICS.time(self.stage_prefix + 'decode'):
+                original_img = self.load_image(image)
+        if original_img is None:
+            raise ValueError("Could not read image" + (f": {image}" if isinstance(image, str) else ""))
+
+        results = self.analyze([original_img])[0]
+        annotated_img = self.annotate(original_img, results)
 
-        annotated_path = image_path.replace('.jpg', '_annotated.jpg')
-        cv2.imwrite(annotated_path, annotated_img)
+        if annotated_path is None and isinstance(image, str):
+            annotated_path = image.replace('.jpg', '_annotated.jpg')
+        if annotated_path:
+            with METRICS.time(self.stage_prefix + 'jpeg_write'):
+                ok, buf = cv2.imencode('.jpg', annotated_img)
+                if not ok:
+                    raise ValueError("JPEG encoding failed")
+                atomic_write(annotated_path, buf)
         
         return {
-            "status": status,
+            "status": self.image_status(results),
             "predictions": results,
             "annotatedPath": annotated_path
         }
@@ -0,0 +1,139 @@
+import collections
+import itertools
+import threading
+import time
+
+from metrics import METRICS
+
+
+class Job:
+    def __init__(self, job_id, fn, args, on_done, key):
+        self.id = job_id
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.on_done = on_done
+        self.status = 'queued'  # queued | running | done | failed | dropped
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+
+class InferenceExecutor:
+    """Fixed pool of inference workers fed by a bounded queue.
+
+    When the queue is full, policy 'latest' drops the oldest queued job with the same
+    key to make room (only the newest frame matters), policy 'reject' refuses the new
+    job instead. on_done callbacks of jobs sharing a key run in job-id order; a job
+    that finishes after a newer one with its key was published is marked stale and its
+    callback is skipped. Jobs without a key are always published.
+    """
+
+    def __init__(self, workers=1, max_queue=2, policy='latest'):
+        if policy not in ('latest', 'reject'):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.workers = workers
+        self.max_queue = max_queue
+        self.policy = policy
+
+        self._ids = itertools.count(1)
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._publish_lock = threading.Lock()
+        self._last_published = {}
+        self._running = 0
+        self._stopped = False
+        self.stats = collections.Counter()
+
+        self._threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name=f"inference-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, fn, *args, on_done=None, key=None):
+        """Queue fn(*args). Returns the Job, or None if rejected because the queue is full"""
+        with self._cond:
+            if self._stopped:
+                return None
+            if len(self._queue) >= self.max_queue:
+                older = next((j for j in self._queue if key is not None and j.key == key), None)
+                if self.policy == 'reject' or older is None:
+                    self.stats['rejected'] += 1
+                    return None
+                self._queue.remove(older)
+                older.status = 'dropped'
+                older.finished = time.time()
+                self.stats['dropped'] += 1
+                print(f"[Executor] Dropped job {older.id} for newer frame")
+
+            job = Job(next(self._ids), fn, args, on_done, key)
+            self._queue.append(job)
+            self.stats['submitted'] += 1
+            self._cond.notify()
+            return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                job = self._queue.popleft()
+                job.status = 'running'
+                self._running += 1
+            METRICS.observe('queue_wait', time.time() - job.created)
+
+            try:
+                job.result = job.fn(*job.args)
+                job.status = 'done'
+            except Exception as e:
+                job.error = str(e)
+                job.status = 'failed'
+                print(f"[Executor] Job {job.id} failed: {e}")
+            job.finished = time.time()
+
+            with self._cond:
+                self._running -= 1
+                self.stats[job.status] += 1
+            self._publish(job)
+
+    def _publish(self, job):
+        with self._publish_lock:
+            if job.key is not None:
+                last = self._last_published.get(job.key, 0)
+                if job.id < last:
+                    self.stats['stale'] += 1
+                    print(f"[Executor] Job {job.id} finished after job {last}, result discarded")
+                    return
+                self._last_published[job.key] = job.id
+            if job.on_done:
+                try:
+                    job.on_done(job)
+                except Exception as e:
+                    print(f"[Executor] on_done for job {job.id} failed: {e}")
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def info(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'policy': self.policy,
+                'queued': len(self._queue),
+                'running': self._running,
+                **self.stats,
+            }
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            for job in self._queue:
+                job.status = 'dropped'
+            self._queue.clear()
+            self._cond.notify_all()
@@ -0,0 +1,280 @@
+import collections
+import itertools
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import METRICS
+from postprocess import match_boxes
+
+# Live model calls are timed apart from the capture path's preprocess/detect/classify stages
+STAGE_PREFIX = 'live_'
+
+
+class Track:
+    __slots__ = ('id', 'box', 'label', 'confidence', 'score', 'thumb', 'hits', 'misses', 'born')
+
+    def __init__(self, track_id, box, score):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32)  # x1, y1, x2, y2 in frame pixels
+        self.label = None  # set by the classifier
+        self.confidence = None
+        self.score = float(score)  # detector score at the last match
+        self.thumb = None  # small grayscale crop at the last classification
+        self.hits = 1
+        self.misses = 0
+        self.born = time.monotonic()
+
+
+class LiveAnalyzer:
+    """Continuous lesion tracking on the camera stream for /api/live.
+
+    The detector runs on every `detect_every`-th processed frame. In between, each
+    track follows its box with sparse optical flow (a grid of points per box, one
+    pyramidal LK call per frame on a downscaled grayscale image). Detections are
+    matched to tracks by IoU; the classifier runs only for new tracks and for tracks
+    whose crop has changed noticeably since they were last classified.
+
+    Every ONNX call (a detector pass or one classifier batch) takes a token from a
+    bucket refilled at max_calls_per_s, so the model load stays bounded whatever the
+    frame rate: when the bucket is empty a detector pass is postponed and tracking
+    carries on. No model calls are made while busy() is true (a capture is being
+    analyzed). Like the preview encoder, the thread only runs while someone listens.
+    """
+
+    def __init__(self, camera, engine=None, fps=10, detect_every=5, max_calls_per_s=4.0, max_tracks=8,
+                 max_misses=2, min_iou=0.3, reclassify_diff=20.0, track_width=320, busy=None):
+        self.camera = camera
+        self.engine = engine  # swapped by the app like HardwareManager.inference_engine
+        self.fps = fps
+        self.detect_every = detect_every
+        self.max_calls_per_s = max_calls_per_s
+        self.max_tracks = max_tracks  # highest detector scores first; bounds tracking and classifier batches
+        self.max_misses = max_misses
+        self.min_iou = min_iou
+        self.reclassify_diff = reclassify_diff  # mean abs difference of the 16x16 crop, 0-255
+        self.track_width = track_width
+        self.busy = busy or (lambda: False)
+
+        self.lock = threading.Lock()
+        self.updated = threading.Condition(self.lock)
+        self.clients = 0
+        self._thread = None
+        self._seq = 0
+        self._event = None
+        # All keys up front: info() copies the counter while the thread updates it
+        self.stats = collections.Counter(dict.fromkeys(
+            ('frames', 'detector_calls', 'classifier_calls', 'classified', 'postponed', 'paused_busy'), 0))
+        self._calls = collections.deque(maxlen=256)  # timestamps of model calls, for calls_per_s
+
+    # --- model call budget --------------------------------------------------
+
+    def _burst(self):
+        # At least one whole token fits, or a rate below 1/s could never make a call
+        return max(1.0, self.max_calls_per_s)
+
+    def _take_token(self, now):
+        self._tokens = min(self._burst(), self._tokens + (now - self._refill) * self.max_calls_per_s)
+        self._refill = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        with self.lock:
+            self._calls.append(now)
+        return True
+
+    # --- per frame ----------------------------------------------------------
+
+    def _follow(self, prev, gray, tracks, scale):
+        """Move every track by the median optical flow of a point grid inside its box"""
+        grids = []
+        for track in tracks:
+            x1, y1, x2, y2 = track.box * scale
+            xs = np.linspace(x1 + (x2 - x1) * 0.2, x2 - (x2 - x1) * 0.2, 4)
+            ys = np.linspace(y1 + (y2 - y1) * 0.2, y2 - (y2 - y1) * 0.2, 4)
+            grids.append(np.stack(np.meshgrid(xs, ys), -1).reshape(-1, 2))
+        points = np.concatenate(grids).astype(np.float32).reshape(-1, 1, 2)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(prev, gray, points, None, winSize=(15, 15), maxLevel=2)
+
+        for i, track in enumerate(tracks):
+            ok = status[i * 16:(i + 1) * 16, 0] == 1
+            if ok.sum() < 4:
+                track.misses += 1
+                continue
+            before, after = points[i * 16:(i + 1) * 16, 0][ok], moved[i * 16:(i + 1) * 16, 0][ok]
+            dx, dy = np.median(after - before, axis=0) / scale
+            # Zoom from the change in spread around the centre, clipped: flow on skin is noisy
+            spread_before = np.median(np.abs(before - before.mean(0)))
+            spread_after = np.median(np.abs(after - after.mean(0)))
+            zoom = float(np.clip(spread_after / spread_before, 0.8, 1.25)) if spread_before > 0 else 1.0
+            cx, cy = (track.box[0] + track.box[2]) / 2 + dx, (track.box[1] + track.box[3]) / 2 + dy
+            hw, hh = (track.box[2] - track.box[0]) * zoom / 2, (track.box[3] - track.box[1]) * zoom / 2
+            track.box = np.array([cx - hw, cy - hh, cx + hw, cy + hh], dtype=np.float32)
+
+    def _update_detections(self, tracks, dets):
+        dets = dets[np.argsort(-dets['score'], kind='stable')[:self.max_tracks]]
+        boxes = dets['box'].astype(np.float32)
+        pairs = match_boxes(np.array([t.box for t in tracks], np.float32).reshape(-1, 4), boxes, self.min_iou)
+        matched_tracks = {i for i, _ in pairs}
+        matched_dets = {j for _, j in pairs}
+        for i, j in pairs:
+            tracks[i].box = boxes[j]
+            tracks[i].score = float(dets['score'][j])
+            tracks[i].hits += 1
+            tracks[i].misses = 0
+        for i, track in enumerate(tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+        for j in range(len(dets)):
+            if j not in matched_dets and len(tracks) < self.max_tracks:
+                tracks.append(Track(next(self._ids), boxes[j], dets['score'][j]))
+
+    @staticmethod
+    def _crop(frame, box):
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = np.clip(np.round(box), 0, [w, h, w, h]).astype(int)
+        return frame[y1:y2, x1:x2] if x2 > x1 and y2 > y1 else None
+
+    def _classify(self, engine, frame, tracks, now, check_changed):
+        """Classify new tracks (and, on detector frames, tracks whose crop changed) in one batch"""
+        todo, crops, thumbs = [], [], []
+        for track in tracks:
+            if track.label is not None and not check_changed:
+                continue
+            crop = self._crop(frame, track.box)
+            if crop is None:
+                continue
+            thumb = cv2.resize(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), (16, 16),
+                               interpolation=cv2.INTER_AREA).astype(np.int16)
+            if track.label is None or np.abs(thumb - track.thumb).mean() > self.reclassify_diff:
+                todo.append(track)
+                crops.append(crop)
+                thumbs.append(thumb)
+        if not todo:
+            return
+        if not self._take_token(now):
+            self.stats['postponed'] += 1
+            return
+        probs = engine.classify(crops, stage_prefix=STAGE_PREFIX)
+        for track, p, thumb in zip(todo, probs, thumbs):
+            idx = int(np.argmax(p))
+            track.label = engine.cls_labels[idx] if idx < len(engine.cls_labels) else 'unknown'
+            track.confidence = float(p[idx])
+            track.thumb = thumb
+        self.stats['classifier_calls'] += 1
+        self.stats['classified'] += len(todo)
+
+    def _loop(self):
+        interval = 1.0 / self.fps
+        self._tokens, self._refill = self._burst(), time.monotonic()
+        self._ids = itertools.count(1)
+        tracks, prev, last_id, engine, frames, postponed = [], None, None, None, 0, False
+        next_ts = time.monotonic()
+        while True:
+            with self.lock:
+                if not self.clients:
+                    self._thread = None
+                    self._event = None
+                    return
+
+            grabbed = self.camera.latest(wait=1.0, max_age=self.camera.stall_timeout)
+            if grabbed is None or grabbed[2] == last_id:
+                time.sleep(interval)
+                next_ts = time.monotonic()
+                continue
+            frame, ts, last_id = grabbed
+            frames += 1
+            if self.engine is not engine:
+                engine, tracks = self.engine, []  # new model version: labels must come from it
+
+            h, w = frame.shape[:2]
+            scale = min(1.0, self.track_width / w)
+            with METRICS.time('live_track'):
+                gray = cv2.cvtColor(cv2.resize(frame, (round(w * scale), round(h * scale)),
+                                               interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+                if prev is not None and tracks:
+                    self._follow(prev, gray, tracks, scale)
+            prev = gray
+
+            now = time.monotonic()
+            detected = False
+            if engine is not None and ((frames - 1) % self.detect_every == 0 or postponed):
+                if self.busy():
+                    self.stats['paused_busy'] += 1
+                    postponed = True
+                elif self._take_token(now):
+                    dets = engine.detect(frame, stage_prefix=STAGE_PREFIX, verbose=False)
+                    self.stats['detector_calls'] += 1
+                    self._update_detections(tracks, dets)
+                    detected, postponed = True, False
+                else:
+                    self.stats['postponed'] += 1
+                    postponed = True
+            tracks = [t for t in tracks if t.misses <= self.max_misses]
+            if engine is not None and tracks and not self.busy():
+                self._classify(engine, frame, tracks, now, check_changed=detected)
+
+            self._publish(frame, ts, last_id, tracks, engine)
+            self.stats['frames'] += 1
+            next_ts = max(next_ts + interval, time.monotonic())
+            time.sleep(max(0.0, next_ts - time.monotonic()))
+
+    def _publish(self, frame, ts, frame_id, tracks, engine):
+        h, w = frame.shape[:2]
+        event = {
+            'frame': frame_id,
+            'age_ms': round((time.monotonic() - ts) * 1000, 1),
+            'width': w,
+            'height': h,
+            'modelVersion': getattr(engine, 'version', None),
+            'tracks': [{'id': t.id, 'bbox': [int(v) for v in np.round(t.box)], 'class': t.label,
+                        'confidence': round(t.confidence, 3) if t.confidence is not None else None,
+                        'score': round(t.score, 3), 'hits': t.hits} for t in tracks],
+        }
+        with self.updated:
+            self._event = json.dumps(event)
+            self._seq += 1
+            self.updated.notify_all()
+
+    # --- clients ------------------------------------------------------------
+
+    def _subscribe(self):
+        with self.lock:
+            self.clients += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="live-analyzer", daemon=True)
+                self._thread.start()
+                print("[Live] Analyzer started")
+            return self._seq
+
+    def _unsubscribe(self):
+        with self.lock:
+            self.clients -= 1
+            if not self.clients:
+                print("[Live] No listeners, analyzer stopping")
+
+    def stream(self, heartbeat=15.0):
+        """SSE generator: one `tracks` event per processed frame; stops the analyzer after the last client"""
+        seq = self._subscribe()
+        try:
+            while True:
+                with self.updated:
+                    if not self.updated.wait_for(lambda: self._seq != seq, heartbeat):
+                        event = None
+                    else:
+                        seq, event = self._seq, self._event
+                yield f"event: tracks\ndata: {event}\n\n" if event else ": keepalive\n\n"
+        finally:
+            self._unsubscribe()
+
+    def info(self):
+        now = time.monotonic()
+        with self.lock:
+            recent = [t for t in self._calls if now - t <= 10.0]
+            return {**self.stats, 'clients': self.clients, 'active': self._thread is not None, 'fps': self.fps,
+                    'detect_every': self.detect_every, 'max_calls_per_s': self.max_calls_per_s,
+                    'max_tracks': self.max_tracks,
+                    'calls_per_s': round(len(recent) / 10.0, 2)}
@@ -0,0 +1,180 @@
+"""How many concurrent UI clients can the device serve?
+
+Each simulated browser loads the page assets, keeps an /api/events stream open,
+polls /api/state (with its ETag, like the polling fallback), fetches every new
+capture once and revalidates the assets every --reload seconds. An uploader adds
+a new image every --upload-every seconds so clients have something to fetch.
+Each level runs for --duration seconds; the result is the largest client count
+whose p95 latency stays under --slo-ms.
+
+    python serve.py &                                   # or python app.py for the dev server
+    python load_test_ui.py --url http://127.0.0.1:5000 --clients 5,10,20,40
+"""
+import argparse
+import collections
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+from load_test_upload import make_jpeg, post_upload
+
+ASSETS = ('/', '/style.css', '/js/app.js', '/js/config.js', '/js/hardwareAdapter.js', '/vendor/sql-wasm.js')
+
+
+class Browser:
+    def __init__(self, host, port, stats, stop):
+        self.host, self.port = host, port
+        self.stats = stats
+        self.stop = stop
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.etags = {}
+        self.image = None
+
+    def get(self, kind, path):
+        headers = {'Accept': 'image/webp,*/*'}
+        if path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        t0 = time.perf_counter()
+        try:
+            self.conn.request('GET', path, headers=headers)
+            res = self.conn.getresponse()
+            body = res.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.stats.error(kind)
+            return None
+        self.stats.record(kind, time.perf_counter() - t0, len(body))
+        if res.status >= 400:
+            self.stats.error(kind)
+            return None
+        if res.getheader('ETag'):
+            self.etags[path] = res.getheader('ETag')
+        return body if res.status == 200 else b''
+
+    def events(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        t0 = time.perf_counter()
+        try:
+            conn.request('GET', '/api/events')
+            res = conn.getresponse()
+            res.readline()  # first event = the snapshot
+            self.stats.record('sse_first_event', time.perf_counter() - t0, 0)
+            while not self.stop.is_set():
+                if not res.readline():
+                    break
+        except (OSError, http.client.HTTPException):
+            if not self.stop.is_set():
+                self.stats.error('sse_first_event')
+        finally:
+            conn.close()
+
+    def run(self, interval, reload_every):
+        threading.Thread(target=self.events, daemon=True).start()
+        last_reload = 0.0
+        while not self.stop.is_set():
+            now = time.monotonic()
+            if now - last_reload >= reload_every:
+                last_reload = now
+                for path in ASSETS:
+                    self.get('asset', path)
+            body = self.get('state', '/api/state')
+            if body:
+                url = json.loads(body).get('last_image_url')
+                if url and url != self.image:
+                    self.image = url
+                    self.get('image', '/' + urllib.parse.quote(url))
+            self.stop.wait(interval)
+        self.conn.close()
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.bytes = 0
+
+    def record(self, kind, seconds, size):
+        with self.lock:
+            self.latency[kind].append(seconds)
+            self.bytes += size
+
+    def error(self, kind):
+        with self.lock:
+            self.errors[kind] += 1
+
+
+def run_level(args, host, port, clients):
+    stats, stop = Stats(), threading.Event()
+    browsers = [Browser(host, port, stats, stop) for _ in range(clients)]
+    threads = [threading.Thread(target=b.run, args=(args.interval, args.reload), daemon=True) for b in browsers]
+
+    def uploader():
+        i = 0
+        while not stop.wait(args.upload_every):
+            post_upload(args.url, make_jpeg(seed=i))
+            i += 1
+
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+        time.sleep(0.01)  # browsers don't all arrive in the same millisecond
+    if args.upload_every > 0:
+        threading.Thread(target=uploader, daemon=True).start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=35)
+    elapsed = time.perf_counter() - t0
+
+    all_ms = np.array([s for v in stats.latency.values() for s in v]) * 1000
+    row = {
+        'clients': clients,
+        'requests_per_s': len(all_ms) / elapsed,
+        'mb_per_s': stats.bytes / elapsed / 1e6,
+        'p50_ms': float(np.percentile(all_ms, 50)) if len(all_ms) else None,
+        'p95_ms': float(np.percentile(all_ms, 95)) if len(all_ms) else None,
+        'errors': sum(stats.errors.values()),
+        'kinds': {k: float(np.percentile(np.array(v) * 1000, 95)) for k, v in sorted(stats.latency.items())},
+    }
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent UI client load test")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", default="5,10,20,40", help="comma separated client counts")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per level")
+    parser.add_argument("--interval", type=float, default=1.0, help="state poll interval per client")
+    parser.add_argument("--reload", type=float, default=10.0, help="asset revalidation interval per client")
+    parser.add_argument("--upload-every", type=float, default=2.0, help="seconds between new images (0 = none)")
+    parser.add_argument("--slo-ms", type=float, default=300, help="p95 latency a level must stay under")
+    args = parser.parse_args()
+
+    print("=== UI Client Load Test ===")
+    parsed = urllib.parse.urlsplit(args.url)
+    host, port = parsed.hostname, parsed.port or 80
+
+    rows = []
+    for clients in (int(c) for c in args.clients.split(",")):
+        row = run_level(args, host, port, clients)
+        rows.append(row)
+        kinds = ", ".join(f"{k} {v:.0f}" for k, v in row['kinds'].items())
+        print(f"[Load] {clients:>4} clients: {row['requests_per_s']:7.1f} req/s, {row['mb_per_s']:5.2f} MB/s, "
+              f"p50 {row['p50_ms']:6.1f} ms, p95 {row['p95_ms']:6.1f} ms, {row['errors']} errors "
+              f"(p95 ms: {kinds})")
+
+    ok = [r['clients'] for r in rows if r['p95_ms'] is not None and r['p95_ms'] < args.slo_ms and not r['errors']]
+    if ok:
+        print(f"\n[Load] Up to {max(ok)} concurrent clients with p95 < {args.slo_ms:.0f} ms and no errors")
+    else:
+        print(f"\n[Load] No level met p95 < {args.slo_ms:.0f} ms without errors")
+    print("\n[Done]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Burst load test for POST /api/upload.
+
+Without --url the app is started in-process (run from RDK_final/, models next to
+it; note that app startup clears UI/captures) and switched to Mode 2 so every
+upload is analyzed. With --url it targets a running device, which must already
+be in Mode 2 (Button 2).
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+def make_jpeg(w=1280, h=720, seed=0):
+    rng = np.random.default_rng(seed)
+    ok, buf = cv2.imencode('.jpg', rng.integers(0, 255, (h, w, 3), dtype=np.uint8))
+    return buf.tobytes()
+
+
+def post_upload(base, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="load.jpg"\r\n'
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    req = urllib.request.Request(f"{base}/api/upload", data=body, method='POST',
+                                 headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=60) as res:
+            status = res.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - t0
+
+
+def get_state(base):
+    with urllib.request.urlopen(f"{base}/api/state", timeout=10) as res:
+        return json.loads(res.read())
+
+
+def start_local_server(port):
+    import app as server
+    from werkzeug.serving import make_server
+
+    server.startup.wait(timeout=120)
+    with server.hw.lock:
+        server.hw.state['mode'] = 2
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    httpd = make_server('127.0.0.1', port, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Burst load test against /api/upload")
+    parser.add_argument("--url", default=None, help="running server, e.g. http://10.42.0.1:5000")
+    parser.add_argument("--port", type=int, default=5055, help="port for the in-process server")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent uploaders")
+    parser.add_argument("--requests", type=int, default=32, help="total uploads")
+    parser.add_argument("--image", default=None, help="JPEG to upload (default: synthetic 1280x720)")
+    args = parser.parse_args()
+
+    print("=== Upload Load Test ===")
+    base = args.url or start_local_server(args.port)
+    data = open(args.image, 'rb').read() if args.image else make_jpeg()
+
+    before = get_state(base).get('executor') or {}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        results = list(pool.map(lambda _: post_upload(base, data), range(args.requests)))
+    t_burst = time.perf_counter() - t0
+
+    # Wait for the queue to drain so completed analyses can be counted
+    while True:
+        state = get_state(base)
+        ex = state.get('executor') or {}
+        if not state['is_processing'] and not ex.get('queued') and not ex.get('running'):
+            break
+        time.sleep(0.05)
+    t_total = time.perf_counter() - t0
+
+    latencies = np.array([lat for _, lat in results]) * 1000
+    codes = {}
+    for status, _ in results:
+        codes[status] = codes.get(status, 0) + 1
+
+    def delta(key):
+        return ex.get(key, 0) - before.get(key, 0)
+
+    print(f"[Load] {args.requests} uploads from {args.clients} clients in {t_burst:.2f} s "
+          f"({args.requests / t_burst:.1f} req/s)")
+    print(f"[Load] HTTP status counts: {codes}")
+    print(f"[Load] Upload latency ms: p50={np.percentile(latencies, 50):.0f} "
+          f"p95={np.percentile(latencies, 95):.0f} max={latencies.max():.0f}")
+    print(f"[Load] Analyses: done={delta('done')} failed={delta('failed')} dropped={delta('dropped')} "
+          f"rejected={delta('rejected')} stale={delta('stale')}")
+    print(f"[Load] Drained after {t_total:.2f} s -> {delta('done') / t_total:.2f} analyses/s, "
+          f"workers={ex.get('workers')} queue={ex.get('max_queue')} policy={ex.get('policy')}")
+    print(f"[Load] Final result published: {state['analysis_result'] is not None}")
+    print("\n[Done]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import collections
+import threading
+import time
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 't0')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.t0)
+
+
+class Metrics:
+    """Per-stage latency summaries for /api/metrics (Prometheus text format).
+
+    observe() is a deque append under a lock, cheap enough for the hot path; the
+    quantiles are computed over the last `window` samples only when scraped.
+    Other subsystems add gauges/counters with register(collector), where collector()
+    returns [(name, type, help, [(labels, value), ...]), ...].
+    """
+
+    def __init__(self, window=1024, prefix='rdk'):
+        self.window = window
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self._samples = {}
+        self._count = collections.Counter()
+        self._sum = collections.Counter()
+        self._collectors = []
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = collections.deque(maxlen=self.window)
+            samples.append(seconds)
+            self._count[stage] += 1
+            self._sum[stage] += seconds
+
+    def time(self, stage):
+        """with METRICS.time('detect'): ..."""
+        return _Timer(self, stage)
+
+    def register(self, collector):
+        self._collectors.append(collector)
+
+    def summary(self):
+        """{stage: {count, sum, p50, p95, p99}} in seconds"""
+        with self.lock:
+            snapshot = {stage: (np.array(s), self._count[stage], self._sum[stage])
+                        for stage, s in self._samples.items()}
+        out = {}
+        for stage, (values, count, total) in sorted(snapshot.items()):
+            qs = np.quantile(values, QUANTILES) if len(values) else [float('nan')] * len(QUANTILES)
+            out[stage] = {'count': count, 'sum': total,
+                          **{f"p{int(q * 100)}": float(v) for q, v in zip(QUANTILES, qs)}}
+        return out
+
+    def render(self):
+        p = self.prefix
+        lines = [f"# HELP {p}_stage_seconds Latency per pipeline stage (rolling window of {self.window})",
+                 f"# TYPE {p}_stage_seconds summary"]
+        for stage, s in self.summary().items():
+            for q in QUANTILES:
+                lines.append(f'{p}_stage_seconds{{stage="{stage}",quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {s["sum"]:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"[Metrics] Collector failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {p}_{name} {help_text}")
+                lines.append(f"# TYPE {p}_{name} {kind}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                    lines.append(f"{p}_{name}{{{label_str}}} {float(value):g}" if label_str
+                                 else f"{p}_{name} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry, shared by the inference engine, hardware manager and app
+METRICS = Metrics()
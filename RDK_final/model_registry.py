@@ -0,0 +1,306 @@
+import collections
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+from image_writer import atomic_write
+from inference import ModelInference
+from metrics import METRICS
+from postprocess import match_boxes
+
+DET_FILE = 'best_det.onnx'
+CLS_FILE = 'best_cls.onnx'
+DEFAULT_VERSION = 'default'
+
+
+class ModelRegistry:
+    """Model versions under model_dir, loaded and swapped without restarting the server.
+
+    A version is a folder model_dir/<version>/ holding best_det.onnx and best_cls.onnx
+    (quantized variants may sit next to them); the `default` pair of paths is version
+    'default'. The folder is polled every `interval` seconds: a version that appeared
+    or changed (and has stopped changing, so half-copied files are not loaded) is
+    loaded and warmed up on the watcher thread, then made current by swapping one
+    reference. Jobs take the engine once when they start, so they finish on the
+    version they started with; on_swap(engine) hands the new engine to its users.
+    The current version is kept in model_dir/ACTIVE across restarts.
+
+    With shadow > 0 a new version becomes the candidate instead: that fraction of
+    analyses is run again on it, on a separate thread once the primary result is out,
+    and latency and agreement with the primary are collected until it is activated.
+    """
+
+    def __init__(self, model_dir, default, on_swap=None, shadow=0.0, interval=5.0, shadow_queue=2):
+        self.model_dir = model_dir
+        self.default = default
+        self.on_swap = on_swap or (lambda engine: None)
+        self.shadow_fraction = shadow
+        self.interval = interval
+
+        self.current = None
+        self.candidate = None
+        self.loading = None
+        self.last_error = None
+        self.stats = collections.Counter()
+        self._shadow_stats = collections.Counter()
+        self._handled = {}  # version -> signature already loaded (or failed)
+        self._last_scan = {}
+        self._pending = None
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+        self._shadow_queue = queue.Queue(shadow_queue)
+        self._shadow_thread = None
+
+    # --- versions on disk ---------------------------------------------------
+
+    def scan(self):
+        """{version: (det_path, cls_path, signature)} for every complete version"""
+        candidates = [(DEFAULT_VERSION, *self.default)]
+        if os.path.isdir(self.model_dir):
+            with os.scandir(self.model_dir) as it:
+                for entry in it:
+                    if entry.is_dir() and not entry.name.startswith('.'):
+                        candidates.append((entry.name, os.path.join(entry.path, DET_FILE),
+                                           os.path.join(entry.path, CLS_FILE)))
+        found = {}
+        for name, det, cls in candidates:
+            try:
+                det_st, cls_st = os.stat(det), os.stat(cls)
+            except OSError:
+                continue
+            found[name] = (det, cls, (det_st.st_size, det_st.st_mtime_ns, cls_st.st_size, cls_st.st_mtime_ns))
+        return found
+
+    @staticmethod
+    def _newest(found, names):
+        return max(names, key=lambda n: max(found[n][2][1], found[n][2][3]))
+
+    def _active_path(self):
+        return os.path.join(self.model_dir, 'ACTIVE')
+
+    def _load(self, name, found, warmup=True):
+        det, cls, signature = found[name]
+        self.loading = name
+        t0 = time.perf_counter()
+        try:
+            engine = ModelInference(det, cls)
+            engine.version = name
+            if warmup:
+                engine.warmup()
+        finally:
+            self.loading = None
+            self._handled[name] = signature
+        engine.loaded_at = time.time()
+        engine.load_ms = round((time.perf_counter() - t0) * 1000, 1)
+        print(f"[Models] Loaded {name} ({engine.variant}) in {engine.load_ms:.0f} ms")
+        return engine
+
+    # --- switching ----------------------------------------------------------
+
+    def load_initial(self, warmup=True):
+        """Load the version named in ACTIVE, else the newest one; raises if none can be loaded"""
+        found = self.scan()
+        self._last_scan = {name: v[2] for name, v in found.items()}
+        self._handled = dict(self._last_scan)  # what exists now is not "new"
+        if not found:
+            raise FileNotFoundError(f"No models: {' / '.join(self.default)} or {self.model_dir}/<version>/")
+        try:
+            with open(self._active_path()) as f:
+                preferred = f.read().strip()
+        except OSError:
+            preferred = None
+        order = [preferred] if preferred in found else []
+        order += sorted((n for n in found if n != preferred), key=lambda n: max(found[n][2][1], found[n][2][3]),
+                        reverse=True)
+        for name in order:
+            try:
+                self._swap(self._load(name, found, warmup))
+                return self.current
+            except Exception as e:
+                self.last_error = f"{name}: {e}"
+                print(f"[Models] Could not load {name}: {e}")
+        raise RuntimeError(f"No loadable model version ({self.last_error})")
+
+    def _swap(self, engine):
+        engine.stage_prefix = ''
+        engine.result_hook = self._sample
+        old, self.current = self.current, engine
+        if old is not None:
+            old.result_hook = None
+            self.stats['swaps'] += 1
+        self.on_swap(engine)
+        try:
+            os.makedirs(self.model_dir, exist_ok=True)
+            atomic_write(self._active_path(), engine.version.encode())
+        except OSError as e:
+            print(f"[Models] Could not record the active version: {e}")
+        print(f"[Models] Now serving {engine.version}" + (f" (was {old.version})" if old else ""))
+
+    def _set_candidate(self, engine):
+        if engine is not None:
+            engine.stage_prefix = 'shadow_'  # its stages show up next to the primary's in /api/metrics
+            engine.result_hook = None
+        self.candidate = engine
+        self._shadow_stats = collections.Counter()
+
+    def activate(self, name):
+        """Ask the watcher to load (if needed) and switch to `name`; False if no such version"""
+        if name not in self.scan():
+            return False
+        self._pending = name
+        self._wake.set()
+        return True
+
+    def _activate(self, name):
+        if self.candidate is not None and self.candidate.version == name:
+            engine = self.candidate
+            self._set_candidate(None)
+        elif self.current is not None and self.current.version == name and name in self._handled:
+            return
+        else:
+            engine = self._load(name, self.scan())
+        self._swap(engine)
+
+    # --- watcher ------------------------------------------------------------
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="model-registry", daemon=True)
+        self._thread.start()
+        self._shadow_thread = threading.Thread(target=self._shadow_loop, name="model-shadow", daemon=True)
+        self._shadow_thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        try:
+            self._shadow_queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _loop(self):
+        while self._running:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._running:
+                return
+            pending, self._pending = self._pending, None
+            try:
+                if pending:
+                    self._activate(pending)
+                else:
+                    self._poll()
+            except Exception as e:
+                self.last_error = str(e)
+                self.stats['failed_loads'] += 1
+                print(f"[Models] {e}")
+
+    def _poll(self):
+        found = self.scan()
+        scan = {name: v[2] for name, v in found.items()}
+        # New or changed, and unchanged since the previous poll (not being copied any more)
+        ready = [name for name, sig in scan.items()
+                 if self._handled.get(name) != sig and self._last_scan.get(name) == sig]
+        self._last_scan = scan
+        if not ready:
+            return
+        name = self._newest(found, ready)
+        for other in ready:
+            if other != name:
+                self._handled[other] = scan[other]
+        current = self.current.version if self.current else None
+        if self.shadow_fraction > 0 and name != current:
+            print(f"[Models] New version {name}, loading as shadow candidate")
+            self._set_candidate(self._load(name, found))
+        else:
+            print(f"[Models] New version {name}, loading")
+            self._swap(self._load(name, found))
+
+    # --- shadow runs --------------------------------------------------------
+
+    def _sample(self, images, results):
+        """result_hook of the current engine: queue a sample for the candidate, never blocks"""
+        if self.candidate is None or random.random() >= self.shadow_fraction:
+            return
+        try:
+            self._shadow_queue.put_nowait((self.candidate, self.current, images, results))
+        except queue.Full:
+            self._shadow_stats['dropped'] += 1
+
+    def _shadow_loop(self):
+        while True:
+            item = self._shadow_queue.get()
+            if item is None:
+                return
+            candidate, primary, images, results = item
+            try:
+                shadow_results = candidate.analyze(images)
+            except Exception as e:
+                self._shadow_stats['failed'] += 1
+                print(f"[Models] Shadow run failed: {e}")
+                continue
+            if candidate is not self.candidate:
+                continue  # replaced or promoted meanwhile
+            stats = self._shadow_stats
+            for ref, out in zip(results, shadow_results):
+                pairs = match_boxes(np.array([p['bbox'] for p in ref], np.float32).reshape(-1, 4),
+                                    np.array([p['bbox'] for p in out], np.float32).reshape(-1, 4))
+                stats['images'] += 1
+                stats['f1_sum'] += 2 * len(pairs) / (len(ref) + len(out)) if ref or out else 1.0
+                stats['matched'] += len(pairs)
+                stats['same_class'] += sum(ref[i]['class'] == out[j]['class'] for i, j in pairs)
+                stats['same_status'] += primary.image_status(ref) == candidate.image_status(out)
+            stats['runs'] += 1
+
+    # --- reporting ----------------------------------------------------------
+
+    @staticmethod
+    def _engine_info(engine):
+        if engine is None:
+            return None
+        return {'version': engine.version, 'variant': engine.variant, 'load_ms': engine.load_ms,
+                'loaded_at': engine.loaded_at, 'result_version': engine.result_version()}
+
+    def shadow_info(self):
+        if self.candidate is None:
+            return None
+        s = self._shadow_stats
+        images = s['images']
+        summary = METRICS.summary()
+
+        def ms(stage, q):
+            return round(summary[stage][q] * 1000, 1) if stage in summary else None
+
+        return {
+            'sample': self.shadow_fraction,
+            'runs': s['runs'],
+            'images': images,
+            'dropped': s['dropped'],
+            'failed': s['failed'],
+            # Boxes matched at IoU 0.5 (F1 per image), matched boxes with the same class, same image status
+            'detection_f1': round(s['f1_sum'] / images, 4) if images else None,
+            'class_agreement': round(s['same_class'] / s['matched'], 4) if s['matched'] else None,
+            'status_agreement': round(s['same_status'] / images, 4) if images else None,
+            'primary_p50_ms': ms('analyze', 'p50'),
+            'primary_p95_ms': ms('analyze', 'p95'),
+            'candidate_p50_ms': ms('shadow_analyze', 'p50'),
+            'candidate_p95_ms': ms('shadow_analyze', 'p95'),
+        }
+
+    def info(self):
+        return {
+            'model_dir': self.model_dir,
+            'versions': sorted(self.scan()),
+            'current': self._engine_info(self.current),
+            'candidate': self._engine_info(self.candidate),
+            'loading': self.loading,
+            'swaps': self.stats['swaps'],
+            'failed_loads': self.stats['failed_loads'],
+            'last_error': self.last_error,
+            'shadow': self.shadow_info(),
+        }
@@ -0,0 +1,121 @@
+"""Packed classifier crops: one memory-mappable shard per split.
+
+    lesion_cls/packed/<split>.crops.npy   uint8 (N, H, W, 3) BGR, letterboxed to the classifier input
+    lesion_cls/packed/<split>.index.npy   structured (row, label) per crop
+    lesion_cls/packed/<split>.json        label names, crop size and the source file of every crop
+
+Crops are letterboxed exactly like preprocess.Letterbox does at inference time,
+so feeding a packed crop to ModelInference.classify gives the same result as
+the JPEG it came from, minus the file open and decode.
+
+    python packed_crops.py --data-root ../datasets          # pack train / val / test
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from dataset_paths import cls_images
+from preprocess import Letterbox
+
+FORMAT_VERSION = 1
+INDEX_DTYPE = np.dtype([('row', '<i8'), ('label', '<i2')])
+SPLITS = ('train', 'val', 'test')
+
+
+def packed_paths(data_root, split):
+    base = Path(data_root) / "lesion_cls" / "packed"
+    return base / f"{split}.crops.npy", base / f"{split}.index.npy", base / f"{split}.json"
+
+
+def pack_split(data_root, split, size=(224, 224)):
+    """Pack lesion_cls/<split>/<label>/*.jpg into one shard, returns the number of crops"""
+    paths = cls_images(data_root, split)
+    crops_path, index_path, meta_path = packed_paths(data_root, split)
+    crops_path.parent.mkdir(parents=True, exist_ok=True)
+
+    labels = sorted({p.parent.name for p in paths})
+    letterbox = Letterbox(size)
+    tmp = crops_path.with_suffix(".tmp.npy")
+    crops = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=(len(paths),) + tuple(size) + (3,))
+    index, sources = [], []
+    for row, path in enumerate(paths):
+        img = cv2.imread(str(path))
+        if img is None:
+            print(f"[Pack] Could not read {path}")
+            continue  # the row stays unused, only indexed rows are crops
+        letterbox.fill_image(img, crops[row])
+        index.append((row, labels.index(path.parent.name)))
+        sources.append(str(path.relative_to(Path(data_root) / "lesion_cls")))
+    crops.flush()
+    del crops
+
+    np.save(index_path, np.array(index, dtype=INDEX_DTYPE))
+    os.replace(tmp, crops_path)
+    meta = {'version': FORMAT_VERSION, 'size': list(size), 'labels': labels, 'sources': sources,
+            'pad_value': letterbox.pad_value}
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    return len(index)
+
+
+class PackedCrops:
+    """Read-only view of a packed split; images are zero-copy slices of the memmap"""
+
+    def __init__(self, data_root, split):
+        crops_path, index_path, meta_path = packed_paths(data_root, split)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError(f"{meta_path}: format {meta['version']}, expected {FORMAT_VERSION}")
+        self.label_names = meta['labels']
+        self.sources = meta['sources']
+        self.size = tuple(meta['size'])
+        self.crops = np.load(crops_path, mmap_mode='r')
+        self.index = np.load(index_path)
+        # Rows are contiguous unless some sources were unreadable; then slices need the index
+        self._contiguous = bool(np.array_equal(self.index['row'], np.arange(len(self.index))))
+
+    @staticmethod
+    def exists(data_root, split):
+        return all(p.exists() for p in packed_paths(data_root, split))
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def labels(self):
+        """Label index per crop (into label_names)"""
+        return self.index['label']
+
+    def image(self, i):
+        return self.crops[self.index['row'][i]]
+
+    def images(self, start, stop):
+        """(n, H, W, 3) uint8 crops start..stop; a view when the shard has no gaps"""
+        if self._contiguous:
+            return self.crops[start:stop]
+        return self.crops[self.index['row'][start:stop]]
+
+    def __getitem__(self, i):
+        return self.image(i), self.label_names[self.labels[i]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack lesion_cls crops into memory-mappable shards")
+    parser.add_argument("--data-root", default="../datasets")
+    parser.add_argument("--splits", default=",".join(SPLITS))
+    parser.add_argument("--size", type=int, default=224, help="classifier input size")
+    args = parser.parse_args()
+
+    for split in args.splits.split(","):
+        n = pack_split(args.data_root, split, (args.size, args.size))
+        crops_path = packed_paths(args.data_root, split)[0]
+        print(f"[Pack] {split}: {n} crops -> {crops_path} ({crops_path.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
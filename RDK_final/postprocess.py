@@ -0,0 +1,152 @@
+import numpy as np
+
+# One row per detection, boxes are xyxy pixel coords in the original image
+DETECTION_DTYPE = np.dtype([
+    ('box', np.int32, (4,)),
+    ('score', np.float32),
+    ('class_id', np.int32),
+])
+
+
+def empty_detections():
+    return np.zeros(0, dtype=DETECTION_DTYPE)
+
+
+def xywh2xyxy(x):
+    y = np.empty_like(x)
+    half_w = x[..., 2] / 2
+    half_h = x[..., 3] / 2
+    y[..., 0] = x[..., 0] - half_w
+    y[..., 1] = x[..., 1] - half_h
+    y[..., 2] = x[..., 0] + half_w
+    y[..., 3] = x[..., 1] + half_h
+    return y
+
+
+def box_area(boxes):
+    return np.clip(boxes[..., 2] - boxes[..., 0], 0, None) * np.clip(boxes[..., 3] - boxes[..., 1], 0, None)
+
+
+def box_iou(box, boxes):
+    """IoU of one xyxy box against an (N, 4) array"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = box_area(box) + box_area(boxes) - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def match_boxes(ref, boxes, iou=0.5):
+    """Greedy one-to-one matching of (N, 4) xyxy ref boxes to boxes; returns [(ref index, box index)]"""
+    pairs, unused = [], list(range(len(boxes)))
+    for i, box in enumerate(ref):
+        if not unused:
+            break
+        ious = box_iou(box, boxes[unused])
+        best = int(np.argmax(ious))
+        if ious[best] >= iou:
+            pairs.append((i, unused.pop(best)))
+    return pairs
+
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy class-agnostic NMS on xyxy boxes, returns kept indices by descending score"""
+    order = np.argsort(-scores, kind='stable')
+    # Sort once into flat coordinate arrays so each round only gathers 1-D columns
+    x1, y1, x2, y2 = (np.ascontiguousarray(c) for c in boxes[order].T)
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    idx = np.arange(len(order))
+    keep = []
+    while idx.size:
+        i = idx[0]
+        keep.append(i)
+        rest = idx[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        union = areas[i] + areas[rest] - inter
+        iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+        idx = rest[iou <= iou_threshold]
+    return order[np.array(keep, dtype=np.int64)]
+
+
+def scale_boxes(boxes, ratio, pad, img_shape):
+    """Map xyxy boxes from letterboxed input back to image pixels, truncated and clipped"""
+    dw, dh = pad
+    img_h, img_w = img_shape
+    out = np.empty_like(boxes)
+    out[:, [0, 2]] = (boxes[:, [0, 2]] - dw) / ratio
+    out[:, [1, 3]] = (boxes[:, [1, 3]] - dh) / ratio
+    out = np.trunc(out)
+    out[:, [0, 2]] = np.clip(out[:, [0, 2]], 0, img_w)
+    out[:, [1, 3]] = np.clip(out[:, [1, 3]], 0, img_h)
+    return out.astype(np.int32)
+
+
+def postprocess(prediction, conf_threshold, iou_threshold, ratio_pad, img_shape, max_candidates=3000):
+    """Decode a YOLOv8 (1, 4 + nc, anchors) output into a DETECTION_DTYPE array in image coords"""
+    pred = prediction[0]
+    class_scores = pred[4:]
+    class_ids = np.argmax(class_scores, axis=0)
+    scores = np.take_along_axis(class_scores, class_ids[None], axis=0)[0]
+
+    mask = scores > conf_threshold
+    if not mask.any():
+        return empty_detections()
+
+    boxes = pred[:4, mask].T
+    scores = scores[mask]
+    class_ids = class_ids[mask]
+
+    if len(scores) > max_candidates:
+        top = np.argpartition(-scores, max_candidates)[:max_candidates]
+        boxes, scores, class_ids = boxes[top], scores[top], class_ids[top]
+
+    boxes = xywh2xyxy(boxes)
+    keep = nms(boxes, scores, iou_threshold)
+
+    ratio, pad = ratio_pad
+    img_boxes = scale_boxes(boxes[keep], ratio, pad, img_shape)
+
+    # Boxes that fall entirely in the padding collapse to zero area after clipping
+    valid = (img_boxes[:, 2] > img_boxes[:, 0]) & (img_boxes[:, 3] > img_boxes[:, 1])
+
+    detections = np.zeros(int(valid.sum()), dtype=DETECTION_DTYPE)
+    detections['box'] = img_boxes[valid]
+    detections['score'] = scores[keep][valid]
+    detections['class_id'] = class_ids[keep][valid]
+    return detections
+
+
+def tile_origins(length, tile, overlap):
+    """Start offsets of the fewest tiles covering [0, length) with at least `overlap`, evenly spread"""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    n = -(-(length - tile) // stride) + 1
+    return [round(i * (length - tile) / (n - 1)) for i in range(n)]
+
+
+def tile_grid(img_shape, tile, overlap):
+    """(x, y, w, h) of overlapping tiles covering an (h, w) image, row major"""
+    h, w = img_shape
+    return [(x, y, min(tile, w), min(tile, h))
+            for y in tile_origins(h, tile, overlap) for x in tile_origins(w, tile, overlap)]
+
+
+def merge_detections(parts, offsets, iou_threshold):
+    """Shift per-tile detections by their (x, y) offsets into image coords, then one global NMS"""
+    shifted = []
+    for dets, (x, y) in zip(parts, offsets):
+        if len(dets):
+            dets = dets.copy()
+            dets['box'] += np.array([x, y, x, y], dtype=np.int32)
+            shifted.append(dets)
+    if not shifted:
+        return empty_detections()
+    merged = np.concatenate(shifted)
+    keep = nms(merged['box'].astype(np.float32), merged['score'], iou_threshold)
+    return merged[keep]
@@ -0,0 +1,93 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class Letterbox:
+    """Letterbox resize + BGR->RGB + HWC->CHW + /255 into reusable float32 buffers.
+
+    Tensors returned by __call__ and batch() are views into per-thread buffers that
+    are overwritten by the next call on the same thread, so feed them to the session
+    (or copy them) before preprocessing the next image.
+    """
+
+    def __init__(self, target_shape, pad_value=114):
+        self.target_shape = target_shape
+        self.pad_value = pad_value
+        self._local = threading.local()
+
+    def _buffers(self):
+        local = self._local
+        if not hasattr(local, 'canvas'):
+            h, w = self.target_shape
+            local.canvas = np.full((h, w, 3), self.pad_value, dtype=np.uint8)
+            local.layout = None
+            local.tensor = np.empty((0, 3, h, w), dtype=np.float32)
+        return local
+
+    def params(self, shape):
+        """Same geometry as the original letterbox: (ratio, (dw, dh), new_unpad, (top, left))"""
+        r = min(self.target_shape[0] / shape[0], self.target_shape[1] / shape[1])
+        new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+
+        dw, dh = self.target_shape[1] - new_unpad[0], self.target_shape[0] - new_unpad[1]
+        dw /= 2
+        dh /= 2
+
+        top, left = int(round(dh - 0.1)), int(round(dw - 0.1))
+        return r, (dw, dh), new_unpad, (top, left)
+
+    def _tensor(self, n):
+        local = self._buffers()
+        if local.tensor.shape[0] < n:
+            local.tensor = np.empty((n, 3) + tuple(self.target_shape), dtype=np.float32)
+        return local.tensor[:n]
+
+    def fill(self, image, out):
+        """Letterbox one BGR uint8 image into out (3, H, W) float32, returns (r, (dw, dh))"""
+        local = self._buffers()
+        canvas = local.canvas
+        r, pad, new_unpad, (top, left) = self.params(image.shape[:2])
+        nw, nh = new_unpad
+
+        layout = (top, left, nw, nh)
+        if layout != local.layout:
+            canvas[:] = self.pad_value
+            local.layout = layout
+
+        region = canvas[top:top + nh, left:left + nw]
+        if image.shape[:2] == (nh, nw):
+            region[:] = image
+        else:
+            cv2.resize(image, new_unpad, dst=region, interpolation=cv2.INTER_LINEAR)
+
+        # BGR->RGB and HWC->CHW are views; the divide does the only copy, with the cast fused in
+        np.divide(canvas[:, :, ::-1].transpose(2, 0, 1), np.float32(255.0), out=out)
+        return r, pad
+
+    def fill_image(self, image, out):
+        """Letterbox one BGR uint8 image into out (H, W, 3) uint8 without normalizing, returns (r, (dw, dh)).
+
+        fill() on the result is a plain copy + normalize, i.e. gives the same tensor as on image.
+        """
+        r, pad, new_unpad, (top, left) = self.params(image.shape[:2])
+        nw, nh = new_unpad
+        out[:] = self.pad_value
+        region = out[top:top + nh, left:left + nw]
+        if image.shape[:2] == (nh, nw):
+            region[:] = image
+        else:
+            cv2.resize(image, new_unpad, dst=region, interpolation=cv2.INTER_LINEAR)
+        return r, pad
+
+    def __call__(self, image):
+        tensor = self._tensor(1)
+        ratio_pad = self.fill(image, tensor[0])
+        return tensor, ratio_pad
+
+    def batch(self, images):
+        """Letterbox a list of images into one (N, 3, H, W) tensor, returns (tensor, [(r, (dw, dh))])"""
+        tensor = self._tensor(len(images))
+        ratio_pads = [self.fill(image, tensor[i]) for i, image in enumerate(images)]
+        return tensor, ratio_pads
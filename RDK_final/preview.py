@@ -0,0 +1,104 @@
+import threading
+import time
+
+import cv2
+
+from metrics import METRICS
+
+
+class PreviewStreamer:
+    """Shared MJPEG encoder for /api/preview.mjpg.
+
+    One thread downscales and JPEG-encodes the newest camera frame at most `fps`
+    times per second; every connected client gets the same encoded bytes. The
+    thread only runs while at least one client is subscribed.
+    """
+
+    BOUNDARY = 'frame'
+
+    def __init__(self, camera, width=640, fps=10, quality=70):
+        self.camera = camera
+        self.width = width
+        self.fps = fps
+        self.quality = quality
+
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+        self.clients = 0
+        self._thread = None
+        self._jpeg = None
+        self._seq = 0
+        self.encoded = 0
+
+    def _encode(self, frame):
+        h, w = frame.shape[:2]
+        if self.width and w > self.width:
+            size = (self.width, round(h * self.width / w))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buf.tobytes() if ok else None
+
+    def _loop(self):
+        interval = 1.0 / self.fps
+        last_id = None
+        next_ts = time.monotonic()
+        while True:
+            with self.lock:
+                if not self.clients:
+                    self._thread = None
+                    self._jpeg = None
+                    return
+
+            grabbed = self.camera.latest(wait=1.0, max_age=self.camera.stall_timeout)
+            if grabbed is not None and grabbed[2] != last_id:
+                frame, _, last_id = grabbed
+                with METRICS.time('preview_encode'):
+                    jpeg = self._encode(frame)
+                if jpeg is not None:
+                    with self.new_frame:
+                        self._jpeg = jpeg
+                        self._seq += 1
+                        self.encoded += 1
+                        self.new_frame.notify_all()
+
+            next_ts = max(next_ts + interval, time.monotonic())
+            time.sleep(max(0.0, next_ts - time.monotonic()))
+
+    def _subscribe(self):
+        with self.lock:
+            self.clients += 1
+            seq = self._seq
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="preview-encoder", daemon=True)
+                self._thread.start()
+                print("[Preview] Encoder started")
+            return seq
+
+    def _unsubscribe(self):
+        with self.lock:
+            self.clients -= 1
+            if not self.clients:
+                print("[Preview] No viewers, encoder stopping")
+
+    def stream(self, timeout=5.0):
+        """Generator of multipart/x-mixed-replace parts; stops the encoder when the last client leaves"""
+        # Start from the current sequence: the first part is a freshly encoded frame
+        seq = self._subscribe()
+        try:
+            while True:
+                with self.new_frame:
+                    self.new_frame.wait_for(lambda: self._seq != seq, timeout)
+                    jpeg = self._jpeg
+                    if jpeg is None:
+                        continue  # camera offline and nothing encoded yet
+                    # On timeout the last frame is resent, so dead clients get noticed
+                    seq = self._seq
+                yield (f"--{self.BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                       f"Content-Length: {len(jpeg)}\r\n\r\n").encode() + jpeg + b"\r\n"
+        finally:
+            self._unsubscribe()
+
+    def info(self):
+        with self.lock:
+            return {'clients': self.clients, 'active': self._thread is not None, 'encoded': self.encoded,
+                    'width': self.width, 'fps': self.fps, 'quality': self.quality}
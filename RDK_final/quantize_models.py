@@ -0,0 +1,137 @@
+"""Build quantized variants of best_det.onnx / best_cls.onnx.
+
+Needs the `onnx` package on top of requirements.txt (and `onnxconverter-common`
+for fp16). Run it from RDK_final/ on a PC, then copy the *.int8_*.onnx files to
+the device and select one with "model_variant" in session_config.json.
+
+    python quantize_models.py --variant int8_dynamic
+    python quantize_models.py --variant int8_static --calib-images 200
+"""
+import argparse
+import os
+import random
+
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                      QuantType, quant_pre_process)
+from onnxruntime.quantization import quantize_dynamic as ort_quantize_dynamic
+from onnxruntime.quantization import quantize_static as ort_quantize_static
+
+from dataset_paths import cls_images, det_images
+from inference import MODEL_VARIANTS, variant_path
+from packed_crops import PackedCrops
+from preprocess import Letterbox
+
+class LetterboxDataReader(CalibrationDataReader):
+    """Calibration feeds from image paths, or from already decoded images (packed crops)"""
+
+    def __init__(self, input_name, paths, target_shape):
+        self.input_name = input_name
+        self.paths = iter(paths)
+        self.letterbox = Letterbox(target_shape)
+
+    def get_next(self):
+        for path in self.paths:
+            img = path if isinstance(path, np.ndarray) else cv2.imread(str(path))
+            if img is None:
+                continue
+            tensor, _ = self.letterbox(img)
+            # Letterbox reuses its buffer, calibration may keep the feed around
+            return {self.input_name: tensor.copy()}
+        return None
+
+
+def input_name(model_path):
+    model = onnx.load(model_path, load_external_data=False)
+    initializers = {i.name for i in model.graph.initializer}
+    return next(i.name for i in model.graph.input if i.name not in initializers)
+
+
+def quantize_dynamic(src, dst):
+    ort_quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+
+
+def quantize_static(src, dst, paths, target_shape, per_channel):
+    if not paths:
+        raise SystemExit(f"No calibration images for {src}, build the datasets first")
+
+    prepped = dst + ".prep.onnx"
+    try:
+        quant_pre_process(src, prepped)
+    except Exception as e:
+        print(f"[Quant] Pre-processing skipped for {src}: {e}")
+        prepped = src
+
+    reader = LetterboxDataReader(input_name(src), paths, target_shape)
+    try:
+        ort_quantize_static(
+            prepped, dst, reader,
+            quant_format=QuantFormat.QDQ,
+            per_channel=per_channel,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    finally:
+        if prepped != src and os.path.exists(prepped):
+            os.remove(prepped)
+
+
+def convert_fp16(src, dst):
+    try:
+        from onnxconverter_common import float16
+    except ImportError:
+        raise SystemExit("fp16 needs `pip install onnxconverter-common`")
+    model = float16.convert_float_to_float16(onnx.load(src), keep_io_types=True)
+    onnx.save(model, dst)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create quantized model variants")
+    parser.add_argument("--det", default="best_det.onnx")
+    parser.add_argument("--cls", default="best_cls.onnx")
+    parser.add_argument("--variant", required=True, choices=[v for v in MODEL_VARIANTS if v != "fp32"])
+    parser.add_argument("--data-root", default="../datasets",
+                        help="folder containing lesion_det/ and lesion_cls/")
+    parser.add_argument("--calib-split", default="train")
+    parser.add_argument("--calib-images", type=int, default=100,
+                        help="max calibration images per model")
+    parser.add_argument("--packed", action="store_true",
+                        help="calibrate the classifier on packed crops (packed_crops.py) instead of JPEGs")
+    parser.add_argument("--per-channel", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    def sample(paths):
+        paths = list(paths)
+        random.shuffle(paths)
+        return paths[:args.calib_images]
+
+    def packed_crops():
+        crops = PackedCrops(args.data_root, args.calib_split)
+        return [crops.image(i) for i in range(len(crops))]
+
+    jobs = [
+        (args.det, (640, 640), lambda: det_images(args.data_root, args.calib_split)),
+        (args.cls, (224, 224), packed_crops if args.packed else lambda: cls_images(args.data_root, args.calib_split)),
+    ]
+    for src, shape, calib in jobs:
+        dst = variant_path(src, args.variant)
+        print(f"[Quant] {src} -> {dst}")
+        if args.variant == "int8_dynamic":
+            quantize_dynamic(src, dst)
+        elif args.variant == "int8_static":
+            quantize_static(src, dst, sample(calib()), shape, args.per_channel)
+        elif args.variant == "fp16":
+            convert_fp16(src, dst)
+        print(f"[Quant] {os.path.getsize(src) / 1e6:.1f} MB -> {os.path.getsize(dst) / 1e6:.1f} MB")
+
+    print("[Done]")
+
+
+if __name__ == "__main__":
+    main()
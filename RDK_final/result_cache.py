@@ -0,0 +1,155 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+
+
+def image_digest(data):
+    """Content hash of encoded image bytes"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Content-addressed cache of analysis results: predictions plus the annotated JPEG.
+
+    Keys are the image hash combined with the engine's result_version(), so a model
+    swap or threshold change never serves old results. Entries live in an LRU memory
+    tier bounded by count and bytes; with disk_dir set they are also kept on disk
+    (bounded by disk_bytes, least recently used removed first) and survive restarts.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 << 20, disk_dir=None, disk_bytes=200 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+
+        self.lock = threading.Lock()
+        self._memory = collections.OrderedDict()  # key -> (entry, size)
+        self._memory_size = 0
+        self._disk = collections.OrderedDict()  # key -> size, least recently used first
+        self._disk_size = 0
+        self.stats = collections.Counter()
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def key(data, version):
+        return f"{image_digest(data)}-{version}"
+
+    def _scan_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-5]
+            try:
+                paths = self._disk_paths(key)
+                size = sum(os.path.getsize(p) for p in paths)
+                entries.append((os.path.getmtime(paths[0]), key, size))
+            except OSError:
+                continue
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+
+    def _disk_paths(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json"), os.path.join(self.disk_dir, f"{key}.jpg")
+
+    def get(self, key):
+        """Cached {'status', 'predictions', 'annotated'} for key, or None"""
+        with self.lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._memory[key][0]
+            on_disk = key in self._disk
+
+        entry = self._read_disk(key) if on_disk else None
+        with self.lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self.stats['disk_hits'] += 1
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._remember(key, entry)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self._remember(key, entry)
+        if self.disk_dir:
+            self._write_disk(key, entry)
+
+    def _remember(self, key, entry):
+        # Caller holds self.lock
+        size = len(entry['annotated']) + 256 * (len(entry['predictions']) + 1)
+        if key in self._memory:
+            self._memory_size -= self._memory.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._memory[key] = (entry, size)
+        self._memory_size += size
+        while len(self._memory) > self.max_entries or self._memory_size > self.max_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_size -= evicted
+            self.stats['evictions'] += 1
+
+    def _read_disk(self, key):
+        meta_path, jpg_path = self._disk_paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(jpg_path, 'rb') as f:
+                annotated = f.read()
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            with self.lock:
+                self._disk_size -= self._disk.pop(key, 0)
+            return None
+        return {'status': meta['status'], 'predictions': meta['predictions'], 'annotated': annotated}
+
+    def _write_disk(self, key, entry):
+        meta_path, jpg_path = self._disk_paths(key)
+        try:
+            # Image first, metadata last: a .json on disk always has its .jpg
+            for path, data in ((jpg_path, entry['annotated']),
+                               (meta_path, json.dumps({'status': entry['status'],
+                                                       'predictions': entry['predictions']}).encode())):
+                with open(f"{path}.tmp", 'wb') as f:
+                    f.write(data)
+                os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            print(f"[Cache] Could not write {key}: {e}")
+            return
+
+        size = os.path.getsize(meta_path) + len(entry['annotated'])
+        with self.lock:
+            self._disk_size += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            evict = []
+            while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+                old, old_size = self._disk.popitem(last=False)
+                self._disk_size -= old_size
+                evict.append(old)
+        for old in evict:
+            for path in self._disk_paths(old):
+                try: os.remove(path)
+                except OSError: pass
+
+    def info(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else None,
+                'entries': len(self._memory),
+                'memory_bytes': self._memory_size,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_size,
+            }
@@ -0,0 +1,118 @@
+"""Production entry point.
+
+This process is the core: it imports app.py, so it alone owns the camera, GPIO
+and ONNX sessions, and serves the Flask app on a Unix socket. --workers front-end
+processes (frontend.py) share the public port: they send static files with
+sendfile and proxy /api/* to the core. With --workers 0 the core serves the
+public port itself on a threaded server.
+
+    python serve.py                   # core + 2 front-end workers on :5000
+    python serve.py --workers 0       # single process
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class Workers:
+    """Front-end worker processes, restarted if they die"""
+
+    def __init__(self, count, fd, core_socket, static_dir):
+        self.cmd = [sys.executable, os.path.join(HERE, 'frontend.py'), '--fd', str(fd),
+                    '--core-socket', core_socket, '--static', static_dir]
+        self.fd = fd
+        self.count = count
+        self.procs = []
+        self.running = True
+
+    def start(self):
+        # Started before the core loads anything, but exec'd either way: no inherited threads or sessions
+        self.procs = [self._spawn() for _ in range(self.count)]
+        threading.Thread(target=self._watch, name="worker-watch", daemon=True).start()
+
+    def _spawn(self):
+        return subprocess.Popen(self.cmd, pass_fds=(self.fd,), cwd=HERE)
+
+    def _watch(self):
+        while self.running:
+            time.sleep(1.0)
+            for i, proc in enumerate(self.procs):
+                if proc.poll() is not None and self.running:
+                    print(f"[Serve] Worker {proc.pid} exited ({proc.returncode}), restarting")
+                    self.procs[i] = self._spawn()
+
+    def stop(self):
+        self.running = False
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Production server: one core process + front-end workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get('RDK_WORKERS', 2)),
+                        help="front-end processes (0 = the core serves everything)")
+    parser.add_argument("--core-socket", default=os.environ.get('RDK_CORE_SOCKET', '/tmp/rdk_core.sock'))
+    args = parser.parse_args()
+
+    os.chdir(HERE)
+    listener = socket.create_server((args.host, args.port), backlog=256)
+    listener.set_inheritable(True)
+
+    workers = None
+    if args.workers:
+        if os.path.exists(args.core_socket):
+            os.remove(args.core_socket)
+        workers = Workers(args.workers, listener.fileno(), args.core_socket, 'UI')
+        workers.start()
+        print(f"[Serve] {args.workers} front-end worker(s) on {args.host}:{args.port}")
+
+    # Only now start loading the models and opening the hardware (in the background), in this process only
+    import app as core
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    if workers:
+        httpd = make_server(f"unix://{args.core_socket}", 0, core.app, threaded=True)
+        print(f"[Serve] Core on {args.core_socket}")
+    else:
+        httpd = make_server(args.host, args.port, core.app, threaded=True, fd=listener.fileno())
+        print(f"[Serve] Core on {args.host}:{args.port}")
+    core.startup.mark('http')
+
+    def shutdown(signum, frame):
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    try:
+        httpd.serve_forever()
+    finally:
+        print("[Serve] Shutting down")
+        if workers:
+            workers.stop()
+        if core.hw:
+            core.hw.stop()
+        if core.models:
+            core.models.stop()
+        core.store.stop()
+        if workers and os.path.exists(args.core_socket):
+            os.remove(args.core_socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import json
+import os
+
+import onnxruntime as ort
+
+# Values here can be overridden by session_config.json (or the file named in
+# RDK_SESSION_CONFIG) and then by RDK_ORT_<KEY> environment variables.
+DEFAULTS = {
+    'providers': ['CPUExecutionProvider'],
+    'graph_optimization_level': 'all',   # disable | basic | extended | all
+    'execution_mode': 'sequential',      # sequential | parallel
+    'intra_op_num_threads': 0,           # 0 = let ONNX Runtime decide
+    'inter_op_num_threads': 0,
+    'enable_cpu_mem_arena': True,
+    'enable_mem_pattern': True,
+    'optimized_model_dir': 'optimized',  # '' disables the optimized graph cache
+    'warmup_runs': 1,
+    'model_variant': 'fp32',             # fp32 | int8_dynamic | int8_static | fp16 (see quantize_models.py)
+    'tiled_detection': False,            # detect on overlapping tiles (small lesions), see bench_tiling.py
+    'tile_size': 640,                    # tile edge in image pixels
+    'tile_overlap': 0.2,                 # fraction of a tile shared with its neighbour
+    'tile_full_frame': True,             # also run the whole frame, for lesions larger than a tile
+}
+
+OPT_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXEC_MODES = {
+    'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def _parse_env(value, default):
+    if isinstance(default, bool):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    if isinstance(default, list):
+        return [v.strip() for v in value.split(',') if v.strip()]
+    return value
+
+
+def load_session_config(path=None):
+    config = dict(DEFAULTS)
+
+    path = path or os.environ.get('RDK_SESSION_CONFIG', 'session_config.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            config.update(json.load(f))
+        print(f"[AI] Session config loaded from {path}")
+
+    for key, default in DEFAULTS.items():
+        env = os.environ.get(f"RDK_ORT_{key.upper()}")
+        if env is not None:
+            config[key] = _parse_env(env, default)
+
+    if config['graph_optimization_level'] not in OPT_LEVELS:
+        raise ValueError(f"Unknown graph_optimization_level: {config['graph_optimization_level']}")
+    if config['execution_mode'] not in EXEC_MODES:
+        raise ValueError(f"Unknown execution_mode: {config['execution_mode']}")
+    if not 0 <= config['tile_overlap'] < 1:
+        raise ValueError(f"tile_overlap must be in [0, 1): {config['tile_overlap']}")
+    return config
+
+
+def select_providers(config):
+    available = ort.get_available_providers()
+    providers = [p for p in config['providers'] if p in available]
+    missing = [p for p in config['providers'] if p not in available]
+    if missing:
+        print(f"[AI] Providers not available, skipped: {missing}")
+    return providers or ['CPUExecutionProvider']
+
+
+def build_session_options(config, level=None):
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = OPT_LEVELS[level or config['graph_optimization_level']]
+    opts.execution_mode = EXEC_MODES[config['execution_mode']]
+    opts.intra_op_num_threads = config['intra_op_num_threads']
+    opts.inter_op_num_threads = config['inter_op_num_threads']
+    opts.enable_cpu_mem_arena = config['enable_cpu_mem_arena']
+    opts.enable_mem_pattern = config['enable_mem_pattern']
+    return opts
+
+
+def _optimized_prefix(model_path, config):
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    # Model versions share file names (models/<version>/best_det.onnx): keep their graphs apart
+    folder = os.path.basename(os.path.dirname(model_path))
+    if folder:
+        stem = f"{folder}.{stem}"
+    return f"{stem}.{config['graph_optimization_level']}."
+
+
+def optimized_model_path(model_path, config):
+    """Cache file for model_path's optimized graph, named after the source's (size, mtime_ns).
+
+    A replaced model gets a new name even if its mtime is older than the cache's
+    (cp -p, rsync -a), so stale graphs are never loaded for new weights.
+    """
+    if not config['optimized_model_dir']:
+        return None
+    st = os.stat(model_path)
+    name = f"{_optimized_prefix(model_path, config)}{st.st_size:x}-{st.st_mtime_ns:x}.opt.onnx"
+    return os.path.join(config['optimized_model_dir'], name)
+
+
+def remove_stale_optimized(model_path, config, keep):
+    """Delete optimized graphs of earlier versions of model_path (other source identities)"""
+    directory = config['optimized_model_dir']
+    prefix = _optimized_prefix(model_path, config)
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.startswith(prefix) and name.endswith('.opt.onnx') and path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def create_session(model_path, config, profile_prefix=None):
+    """Create an InferenceSession, reusing (or writing) the optimized graph on disk.
+
+    Returns (session, loaded_path) so callers can report which file is actually running.
+    With profile_prefix, ONNX Runtime's profiler writes <prefix>_<timestamp>.json
+    (see InferenceSession.end_profiling).
+    """
+    providers = select_providers(config)
+    cached = optimized_model_path(model_path, config)
+
+    if cached and os.path.exists(cached):
+        try:
+            # Already optimized: only run the cheap basic passes on load
+            opts = build_session_options(config, level='basic')
+            if profile_prefix:
+                opts.enable_profiling = True
+                opts.profile_file_prefix = profile_prefix
+            return ort.InferenceSession(cached, sess_options=opts, providers=providers), cached
+        except Exception as e:
+            print(f"[AI] Optimized model {cached} unusable, rebuilding: {e}")
+
+    opts = build_session_options(config)
+    if profile_prefix:
+        opts.enable_profiling = True
+        opts.profile_file_prefix = profile_prefix
+    elif cached:
+        os.makedirs(os.path.dirname(cached) or '.', exist_ok=True)
+        remove_stale_optimized(model_path, config, keep=cached)
+        opts.optimized_model_filepath = cached
+    return ort.InferenceSession(model_path, sess_options=opts, providers=providers), model_path
@@ -0,0 +1,82 @@
+import threading
+import time
+
+
+class Startup:
+    """Runs the slow parts of startup on background threads and tracks their readiness.
+
+    Each step is a function started by run(); steps listed in `after` must be ready
+    before it begins, otherwise independent steps run in parallel. A step is pending,
+    starting, ready or failed; info() reports that together with when it started and
+    how long it took (ms since this object was created), for /api/health. Steps that
+    are not run here (e.g. the HTTP server) can be reported with mark(). Startup is
+    ready once every required step is; optional steps that are not ready are listed
+    as degraded.
+    """
+
+    def __init__(self):
+        self.t0 = time.monotonic()
+        self.cond = threading.Condition()
+        self._steps = {}
+
+    def _ms(self):
+        return round((time.monotonic() - self.t0) * 1000, 1)
+
+    def _update(self, name, **fields):
+        with self.cond:
+            self._steps.setdefault(name, {'status': 'pending'}).update(fields)
+            self.cond.notify_all()
+
+    def run(self, name, fn, after=(), required=True):
+        self._update(name, status='pending', after=list(after), required=required)
+        threading.Thread(target=self._run, args=(name, fn, after), name=f"startup-{name}", daemon=True).start()
+
+    def _run(self, name, fn, after):
+        if after and not self.wait(*after):
+            failed = [step for step in after if self.status(step) != 'ready']
+            self._update(name, status='failed', error=f"needs {', '.join(failed)}")
+            return
+        started = self._ms()
+        self._update(name, status='starting', started_ms=started)
+        try:
+            fn()
+        except Exception as e:
+            print(f"[Startup] {name} failed: {e}")
+            self._update(name, status='failed', error=str(e), duration_ms=round(self._ms() - started, 1))
+            return
+        done = self._ms()
+        self._update(name, status='ready', ready_ms=done, duration_ms=round(done - started, 1))
+        print(f"[Startup] {name} ready after {done:.0f} ms")
+
+    def mark(self, name, status='ready', error=None):
+        fields = {'status': status, f"{status}_ms": self._ms()}
+        if error:
+            fields['error'] = error
+        self._update(name, **fields)
+        if not error:
+            with self.cond:
+                self._steps[name].pop('error', None)  # e.g. a failed optional step that recovered
+
+    def status(self, name):
+        with self.cond:
+            step = self._steps.get(name)
+            return step['status'] if step else None
+
+    def wait(self, *names, timeout=None):
+        """Block until the named steps (default: all) are ready or failed; True if all are ready"""
+        with self.cond:
+            names = names or tuple(self._steps)
+            self.cond.wait_for(
+                lambda: all(self._steps.get(n, {}).get('status') in ('ready', 'failed') for n in names), timeout)
+            return all(self._steps.get(n, {}).get('status') == 'ready' for n in names)
+
+    def info(self):
+        with self.cond:
+            steps = {name: dict(step) for name, step in self._steps.items()}
+        return {
+            'ready': all(step['status'] == 'ready' for step in steps.values() if step.get('required', True)),
+            'degraded': sorted(name for name, step in steps.items()
+                               if not step.get('required', True) and step['status'] != 'ready'),
+            'uptime_s': round(time.monotonic() - self.t0, 1),
+            'steps': steps,
+        }
@@ -0,0 +1,28 @@
+"""Check the model call budget of LiveAnalyzer (no camera or models needed).
+
+    python test_live_analysis.py      (or: python -m pytest test_live_analysis.py)
+"""
+from live_analysis import LiveAnalyzer
+
+
+def _calls(rate, seconds, step=0.05):
+    """Model calls LiveAnalyzer allows when asked every `step` seconds for `seconds`"""
+    live = LiveAnalyzer(camera=None, max_calls_per_s=rate)
+    live._tokens, live._refill = live._burst(), 0.0
+    return sum(live._take_token(i * step) for i in range(round(seconds / step)))
+
+
+def test_rate_below_one():
+    # One call from the full bucket, then one every 2 s
+    assert _calls(0.5, 10.0) == 5
+
+
+def test_rate_above_one():
+    # A burst of 4, then 4 per second
+    assert 36 <= _calls(4.0, 9.0) <= 4 + 4 * 9
+
+
+if __name__ == '__main__':
+    test_rate_below_one()
+    test_rate_above_one()
+    print("OK: live model calls stay within max_calls_per_s")
@@ -0,0 +1,104 @@
+"""Check that a model replaced in place is really reloaded by ModelRegistry.
+
+A retrained best_det.onnx copied over an existing version keeps its old mtime with
+cp -p / rsync -a. The registry must load the new weights (not the cached optimized
+graph of the old ones) and report a new result_version, or the result cache would
+store the old model's answers under the new key.
+
+    python test_model_reload.py      (or: python -m pytest test_model_reload.py)
+
+Builds two tiny detector graphs in a temporary folder; needs the onnx package.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+
+def _save_det(path, anchors, score):
+    """Detector whose output ignores the image: one box with `score`, padded with zero-score anchors"""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    boxes = np.zeros((1, 5, anchors), np.float32)
+    boxes[0, :4, 0] = (320, 320, 100, 100)  # cx, cy, w, h in letterbox pixels
+    boxes[0, 4, 0] = score
+    graph = helper.make_graph(
+        [helper.make_node('ReduceMean', ['images'], ['m'], axes=[1, 2, 3], keepdims=1),
+         helper.make_node('Reshape', ['m', 'shape'], ['m2']),
+         helper.make_node('Mul', ['m2', 'zero'], ['m3']),
+         helper.make_node('Add', ['m3', 'boxes'], ['output0'])],
+        'det', [helper.make_tensor_value_info('images', TensorProto.FLOAT, ['N', 3, 640, 640])],
+        [helper.make_tensor_value_info('output0', TensorProto.FLOAT, ['N', 5, anchors])],
+        [numpy_helper.from_array(boxes, 'boxes'), numpy_helper.from_array(np.zeros(1, np.float32), 'zero'),
+         numpy_helper.from_array(np.array([-1, 1, 1], np.int64), 'shape')])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+def _save_cls(path):
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    graph = helper.make_graph(
+        [helper.make_node('GlobalAveragePool', ['images'], ['p']),
+         helper.make_node('Flatten', ['p'], ['f']),
+         helper.make_node('MatMul', ['f', 'w'], ['l']),
+         helper.make_node('Softmax', ['l'], ['output0'], axis=1)],
+        'cls', [helper.make_tensor_value_info('images', TensorProto.FLOAT, ['N', 3, 224, 224])],
+        [helper.make_tensor_value_info('output0', TensorProto.FLOAT, ['N', 3])],
+        [numpy_helper.from_array(np.eye(3, dtype=np.float32), 'w')])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+def test_replaced_model_keeps_mtime():
+    saved = os.environ.get('RDK_ORT_OPTIMIZED_MODEL_DIR')
+    with tempfile.TemporaryDirectory() as tmp:
+        # Optimized graphs in the temp folder too, with the default level (the one that caches)
+        os.environ['RDK_ORT_OPTIMIZED_MODEL_DIR'] = os.path.join(tmp, 'optimized')
+        try:
+            _check_reload(tmp)
+        finally:
+            if saved is None:
+                os.environ.pop('RDK_ORT_OPTIMIZED_MODEL_DIR', None)
+            else:
+                os.environ['RDK_ORT_OPTIMIZED_MODEL_DIR'] = saved
+
+
+def _check_reload(tmp):
+    from model_registry import ModelRegistry
+
+    version_dir = os.path.join(tmp, 'models', 'v1')
+    os.makedirs(version_dir)
+    det, cls = os.path.join(version_dir, 'best_det.onnx'), os.path.join(version_dir, 'best_cls.onnx')
+    _save_det(det, anchors=64, score=0.9)
+    _save_cls(cls)
+    registry = ModelRegistry(os.path.join(tmp, 'models'),
+                             default=(os.path.join(tmp, 'none_det.onnx'), os.path.join(tmp, 'none_cls.onnx')))
+    engine = registry.load_initial()
+    image = np.zeros((640, 640, 3), np.uint8)
+    assert len(engine.detect(image)) == 1, "v1 should find its one box"
+    old_result_version = engine.result_version()
+    old_mtime = os.stat(det).st_mtime_ns
+
+    # Retrained weights (no box any more), copied in with the old timestamp preserved
+    _save_det(det, anchors=96, score=0.0)
+    os.utime(det, ns=(old_mtime, old_mtime))
+    assert engine.result_version() == old_result_version, "the running engine still has the old weights"
+
+    registry._poll()  # sees the change
+    registry._poll()  # unchanged since: loads it
+    engine = registry.current
+    assert registry.stats['swaps'] == 1, "the replaced version should have been reloaded"
+    assert len(engine.detect(image)) == 0, "the reloaded version still runs the old graph"
+    assert engine.result_version() != old_result_version
+    cached = [n for n in os.listdir(os.environ['RDK_ORT_OPTIMIZED_MODEL_DIR']) if n.startswith('v1.best_det.')]
+    assert len(cached) == 1, f"stale optimized graphs left behind: {cached}"
+
+
+if __name__ == '__main__':
+    test_replaced_model_keeps_mtime()
+    print("OK: replaced model reloaded with its new weights")
@@ -0,0 +1,161 @@
+import collections
+import hashlib
+import os
+import threading
+
+import cv2
+
+from capture_store import file_version
+from metrics import METRICS
+
+# Requested widths are rounded up to one of these, so the cache holds a few sizes per image
+WIDTHS = (160, 320, 640, 1280)
+FORMATS = {'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+           'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY)}
+
+
+class ThumbnailCache:
+    """Resized WebP/JPEG derivatives of the images under root, generated on demand.
+
+    A derivative is named by a hash of the source path, its (mtime, size), the width,
+    format and quality, so a name never refers to different bytes: it doubles as a
+    strong ETag, and URLs carrying it (?v=) can be cached as immutable. So can URLs
+    carrying the source's own file_version, which clients get with the capture URL.
+    Files live in cache_dir, bounded by max_bytes with the least recently used removed first.
+    """
+
+    def __init__(self, root, cache_dir, max_bytes=64 << 20, quality=80):
+        self.root = os.path.abspath(root)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.webp = cv2.haveImageWriter('x.webp')
+
+        self.lock = threading.Lock()
+        self._files = collections.OrderedDict()  # name -> size, least recently used first
+        self._size = 0
+        self._building = {}  # name -> Lock, one encode per derivative however many requests
+        self.stats = collections.Counter()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._size += size
+
+    def source_path(self, rel_path):
+        """Absolute path of rel_path under root, or None if it escapes root or doesn't exist"""
+        path = os.path.abspath(os.path.join(self.root, rel_path))
+        if not path.startswith(self.root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    @staticmethod
+    def bucket(width):
+        return next((w for w in WIDTHS if w >= width), WIDTHS[-1])
+
+    def pick_format(self, fmt=None, accept=''):
+        """Explicit fmt if given, else WebP when the client accepts it (and OpenCV can write it)"""
+        if fmt in FORMATS and (fmt != 'webp' or self.webp):
+            return fmt
+        return 'webp' if self.webp and 'image/webp' in accept else 'jpeg'
+
+    def source_version(self, rel_path):
+        """file_version of the source, or None if it is missing"""
+        path = self.source_path(rel_path)
+        return file_version(path) if path else None
+
+    def version(self, rel_path, width, fmt):
+        """Derivative file name for the current source, or None if the source is missing"""
+        path = self.source_path(rel_path)
+        if path is None:
+            return None
+        st = os.stat(path)
+        key = f"{rel_path}|{st.st_mtime_ns}|{st.st_size}|{width}|{fmt}|{self.quality}"
+        return hashlib.blake2b(key.encode(), digest_size=12).hexdigest() + FORMATS[fmt][0]
+
+    def get(self, rel_path, width, fmt):
+        """(file path, name, mimetype) of the derivative, generated if needed; None if no source"""
+        name = self.version(rel_path, width, fmt)
+        if name is None:
+            return None
+        path = os.path.join(self.cache_dir, name)
+        mimetype = FORMATS[fmt][1]
+
+        with self.lock:
+            hit = name in self._files
+            if hit:
+                self._files.move_to_end(name)
+                self.stats['hits'] += 1
+            else:
+                build = self._building.setdefault(name, threading.Lock())
+        if hit:
+            try:
+                os.utime(path)  # recency survives restarts
+                return path, name, mimetype
+            except OSError:
+                # Evicted in between; build it again
+                with self.lock:
+                    self._size -= self._files.pop(name, 0)
+                    build = self._building.setdefault(name, threading.Lock())
+
+        try:
+            with build:
+                with self.lock:
+                    done = name in self._files
+                if not done and not self._build(rel_path, width, fmt, path):
+                    return None
+        finally:
+            with self.lock:
+                self._building.pop(name, None)
+        return path, name, mimetype
+
+    def _build(self, rel_path, width, fmt, path):
+        img = cv2.imread(self.source_path(rel_path) or '')
+        if img is None:
+            return False
+        with METRICS.time('thumbnail'):
+            h, w = img.shape[:2]
+            if w > width:
+                img = cv2.resize(img, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+            ext, _, quality_flag = FORMATS[fmt]
+            ok, buf = cv2.imencode(ext, img, [quality_flag, self.quality])
+        if not ok:
+            return False
+
+        try:
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(buf)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            print(f"[Thumbs] Could not write {path}: {e}")
+            return False
+
+        name = os.path.basename(path)
+        with self.lock:
+            self.stats['generated'] += 1
+            self._size += len(buf) - self._files.pop(name, 0)
+            self._files[name] = len(buf)
+            evict = []
+            while self._size > self.max_bytes and len(self._files) > 1:
+                old, old_size = self._files.popitem(last=False)
+                self._size -= old_size
+                evict.append(old)
+                self.stats['evictions'] += 1
+        for old in evict:
+            try: os.remove(os.path.join(self.cache_dir, old))
+            except OSError: pass
+        return True
+
+    def info(self):
+        with self.lock:
+            return {**self.stats, 'files': len(self._files), 'bytes': self._size, 'webp': self.webp}
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def file_digest(paths):
+    """sha1 over the contents of the given files (missing files hash as empty)"""
+    h = hashlib.sha1()
+    for p in paths:
+        if Path(p).exists():
+            h.update(Path(p).read_bytes())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def file_signature(paths):
+    sig = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            sig.append([st.st_mtime_ns, st.st_size])
+        except FileNotFoundError:
+            sig.append(None)
+    return sig
+
+
+class BuildManifest:
+    """Records which source files produced which outputs, so dataset builders only redo changed work.
+
+    An entry is up to date when its outputs exist and the sources' (mtime, size) are
+    unchanged; if only the mtime moved (copy, touch), the content hash decides. Changing
+    the builder params invalidates every entry. `fresh` is true when no usable manifest
+    was found, i.e. files already in the output tree are not accounted for.
+    """
+
+    def __init__(self, path: Path, params: dict):
+        self.path = Path(path)
+        # Compare in JSON form, tuples and lists must not count as a change
+        self.params = json.loads(json.dumps(params))
+        self.entries = {}
+        self.fresh = True
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text())
+            except ValueError:
+                print(f"[manifest] {self.path} unreadable, rebuilding")
+                return
+            if data.get("params") == self.params:
+                self.entries = data.get("entries", {})
+                self.fresh = False
+            else:
+                print(f"[manifest] params changed, rebuilding everything in {self.path.parent}")
+                remove_outputs(o for e in data.get("entries", {}).values() for o in e["outputs"])
+
+    def up_to_date(self, key, sources):
+        entry = self.entries.get(key)
+        if entry is None or not all(Path(o).exists() for o in entry["outputs"]):
+            return False
+        sig = file_signature(sources)
+        if sig == entry["sig"]:
+            return True
+        sizes_match = all(a and b and a[1] == b[1] for a, b in zip(sig, entry["sig"]))
+        if sizes_match and len(sig) == len(entry["sig"]) and file_digest(sources) == entry["digest"]:
+            entry["sig"] = sig
+            return True
+        return False
+
+    def record(self, key, sources, digest, outputs):
+        """Store the new outputs of key; returns previous outputs that are no longer produced"""
+        old = self.entries.get(key, {}).get("outputs", [])
+        outputs = [str(o) for o in outputs]
+        self.entries[key] = {"sig": file_signature(sources), "digest": digest, "outputs": outputs}
+        return [o for o in old if o not in outputs]
+
+    def prune(self, keep):
+        """Forget entries not in keep (their sources were removed); returns their outputs"""
+        removed = []
+        for key in [k for k in self.entries if k not in keep]:
+            removed.extend(self.entries.pop(key)["outputs"])
+        return removed
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"params": self.params, "entries": self.entries}))
+        os.replace(tmp, self.path)
+
+
+def unlisted_files(dirs, keep):
+    """Files under dirs that are not in keep, e.g. left over from an older naming scheme"""
+    keep = {os.path.normpath(str(k)) for k in keep}
+    return [str(p) for d in dirs if Path(d).is_dir() for p in Path(d).iterdir()
+            if p.is_file() and os.path.normpath(str(p)) not in keep]
+
+
+def remove_outputs(paths):
+    for p in paths:
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
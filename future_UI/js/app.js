@@ -1,4 +1,4 @@
-import { hardwareAdapter } from './hardwareAdapter.js';
+import { hardwareAdapter, thumbnailUrl } from './hardwareAdapter.js';
 import { sessionStore } from './sessionStore.js';
 import { analysisAdapter, buildAnalysisPayload } from './analysisAdapter.js';
 import { ANALYSIS_POLL_INTERVAL } from './config.js';
@@ -504,7 +504,7 @@ const renderCapture = (session) => {
                     <div class="counter">${imgs.length} images captured</div>
                     ${appState.warnAdvance ? renderWarningBanner(imgs.length === 0) : ''}
                     <div class="thumbs">
-                        ${imgs.map((img) => `<div class="thumb"><img src="${img.url}" alt="${area}" style="width:100%;height:100%;object-fit:cover;border-radius: var(--r-2);"></div>`).join('') || '<div class="thumb">No images yet</div>'}
+                        ${imgs.map((img) => `<div class="thumb"><img src="${thumbnailUrl(img.url)}" alt="${area}" loading="lazy" style="width:100%;height:100%;object-fit:cover;border-radius: var(--r-2);"></div>`).join('') || '<div class="thumb">No images yet</div>'}
                     </div>
                     ${renderProgress(session)}
                 </div>
@@ -536,7 +536,7 @@ const renderImagesGroup = (area, items) => {
                 <button class="btn secondary right" data-action="retake-${area}">Retake ${capitalize(area)}</button>
             </div>
             <div class="thumbs">
-                ${items.length ? items.map((img) => `<div class="thumb"><img src="${img.url}" alt="${area}" style="width:100%;height:100%;object-fit:cover;border-radius: var(--r-2);"></div>`).join('') : '<div class="thumb">No images</div>'}
+                ${items.length ? items.map((img) => `<div class="thumb"><img src="${thumbnailUrl(img.url)}" alt="${area}" loading="lazy" style="width:100%;height:100%;object-fit:cover;border-radius: var(--r-2);"></div>`).join('') : '<div class="thumb">No images</div>'}
             </div>
         </div>
     `;
@@ -691,7 +691,7 @@ const renderResults = (session, options = {}) => {
         }
         return filteredPredictions.map((p) => `
             <tr>
-                <td><button class="thumb tiny btn-reset" data-action="view-annotated" data-image-id="${p.imageId}">${p.imageUrl ? `<img src="${p.imageUrl}" alt="${p.area}" style="width:100%;height:100%;object-fit:cover;border-radius: var(--r-1);">` : '—'}</button></td>
+                <td><button class="thumb tiny btn-reset" data-action="view-annotated" data-image-id="${p.imageId}">${p.imageUrl ? `<img src="${thumbnailUrl(p.imageUrl, 160)}" alt="${p.area}" loading="lazy" style="width:100%;height:100%;object-fit:cover;border-radius: var(--r-1);">` : '—'}</button></td>
                 <td>${capitalize(p.area)}</td>
                 <td><span class="pill subtle">${classLabels[p.predictedClass] || p.predictedClass}</span></td>
                 <td>${formatPercent((p.confidence ?? 0) * 100, 0)}</td>
@@ -1145,7 +1145,7 @@ const bindEvents = () => {
             case 'view-annotated':
                 const imgId = el.getAttribute('data-image-id');
                 if (imgId) {
-                    const url = analysisAdapter.getAnnotatedImageUrl(imgId);
+                    const url = analysisAdapter.getAnnotatedImageUrl(imgId, appState.viewingSessionId || sessionStore.getState().sessionId);
                     appState.modalImage = url;
                     
                     // Update DB with this annotated URL
@@ -1,3 +1,5 @@
+import { RDK_API_BASE } from './config.js';
+
 const listeners = new Set();
 
 const randomColor = () => {
@@ -23,6 +25,16 @@ const makePlaceholder = (label) => {
     return canvas.toDataURL('image/png');
 };
 
+// List views load a server-side thumbnail instead of the full capture; other URLs (data:, blob:) pass through.
+// The capture's ?v= (its content version from the server) is kept, so the thumbnail is cached as immutable.
+export const thumbnailUrl = (url, width = 320) => {
+    const prefix = `${RDK_API_BASE}/captures/`;
+    if (!url || !url.startsWith(prefix)) return url;
+    const [path, query = ''] = url.slice(prefix.length).split('?');
+    const v = new URLSearchParams(query).get('v');
+    return `${RDK_API_BASE}/api/thumb/captures/${path}?w=${width}${v ? `&v=${encodeURIComponent(v)}` : ''}`;
+};
+
 const notify = (btn) => {
     listeners.forEach((handler) => {
         try {
@@ -1,8 +1,16 @@
+from collections import Counter
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import cv2
 import random
 
+from build_manifest import BuildManifest, file_digest, remove_outputs
+
 IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+PAD_RATIO = 0.15
+MIN_SIZE = 20
 
 def clamp(v, lo, hi):
     return max(lo, min(hi, v))
@@ -41,15 +49,42 @@ def save_crop(img, xyxy, out_path, pad_ratio=0.15, min_size=20):
     cv2.imwrite(str(out_path), roi)
     return True
 
-def export_rois(
+def init_worker():
+    cv2.setNumThreads(1)
+
+def export_image(task):
+    """Decode one source image once and write its crops for every wanted class.
+
+    Returns (key, sources, digest, [(label, out_path), ...]).
+    """
+    key, img_path, lab_path, out_dir, labels = task
+    sources = [img_path, lab_path]
+    digest = file_digest(sources)
+
+    saved = []
+    img = cv2.imread(str(img_path))
+    if img is not None:
+        h, w = img.shape[:2]
+        lines = [ln for ln in lab_path.read_text().splitlines() if ln.strip()]
+        for i, ln in enumerate(lines):
+            cls, x1, y1, x2, y2 = yolo_line_to_xyxy(ln, w, h)
+            if cls not in labels:
+                continue
+
+            out_path = out_dir / labels[cls] / f"{img_path.stem}_{i}.jpg"
+            if save_crop(img, (x1, y1, x2, y2), out_path, PAD_RATIO, MIN_SIZE):
+                saved.append((labels[cls], out_path))
+    return key, sources, digest, saved
+
+def roi_tasks(
     yolo_root: Path,
     split: str,              # "train" or "valid"
-    out_root: Path,          # "cls_dataset"
+    out_root: Path,          # "lesion_cls"
     out_split: str,          # "train" or "val"
-    keep_classes: set,       # e.g. {1}
-    target_label: str,       # "cancer"/"eczema"/"unknown"
+    labels: dict,            # class id -> target label, e.g. {1: "cancer", 0: "unknown"}
     limit_images: int | None = None,
 ):
+    """One task per labelled image; all target labels of an image are exported from a single decode"""
     img_dir = yolo_root / split / "images"
     lab_dir = yolo_root / split / "labels"
 
@@ -58,52 +93,91 @@ def export_rois(
     if limit_images:
         images = images[:limit_images]
 
-    saved = 0
+    tasks = []
     for img_path in images:
         lab_path = lab_dir / (img_path.stem + ".txt")
         if not lab_path.exists():
             continue
-
-        img = cv2.imread(str(img_path))
-        if img is None:
-            continue
-        h, w = img.shape[:2]
-
-        lines = [ln for ln in lab_path.read_text().splitlines() if ln.strip()]
-        for i, ln in enumerate(lines):
-            cls, x1, y1, x2, y2 = yolo_line_to_xyxy(ln, w, h)
-            if cls not in keep_classes:
-                continue
-
-            out_path = out_root / out_split / target_label / f"{img_path.stem}_{i}.jpg"
-            if save_crop(img, (x1, y1, x2, y2), out_path):
-                saved += 1
-
-    print(f"[{yolo_root.name}/{split}] -> {out_root}/{out_split}/{target_label}: saved {saved} crops")
+        key = f"{yolo_root.name}/{split}/{img_path.name}"
+        tasks.append((key, img_path, lab_path, out_root / out_split, labels))
+    return tasks
+
+def export_rois(jobs, out_root: Path, workers: int | None = None):
+    """Run all (yolo_root, split, out_split, labels) jobs on a process pool, skipping unchanged images.
+
+    Returns the number of changed sources + removed crops (0 = dataset unchanged).
+    """
+    params = {"pad_ratio": PAD_RATIO, "min_size": MIN_SIZE,
+              "jobs": [[str(root), split, out_split, sorted(labels.items())]
+                       for root, split, out_split, labels in jobs]}
+    manifest = BuildManifest(out_root / ".manifest.json", params)
+
+    tasks, seen, skipped = [], set(), 0
+    for yolo_root, split, out_split, labels in jobs:
+        for task in roi_tasks(yolo_root, split, out_root, out_split, labels):
+            key, img_path, lab_path = task[:3]
+            seen.add(key)
+            if manifest.up_to_date(key, [img_path, lab_path]):
+                skipped += 1
+            else:
+                tasks.append(task)
+
+    saved = Counter()
+    removed = []
+    with ProcessPoolExecutor(workers, initializer=init_worker) as pool:
+        for key, sources, digest, crops in pool.map(export_image, tasks, chunksize=16):
+            for label, out_path in crops:
+                saved[f"{key.rsplit('/', 1)[0]} -> {label}"] += 1
+            removed += manifest.record(key, sources, digest, [p for _, p in crops])
+
+    removed += manifest.prune(seen)
+    remove_outputs(removed)
+    manifest.save()
+
+    for name, n in sorted(saved.items()):
+        print(f"[{name}] saved {n} crops")
+    print(f"Rebuilt {len(tasks)} image(s), {skipped} up to date, removed {len(removed)} stale crop(s)")
+    return len(tasks) + len(removed)
+
+def pack_splits(data_root: Path, splits):
+    """可选：每个 split 打包成一个可 np.memmap 的 shard（见 RDK_final/packed_crops.py）"""
+    sys.path.insert(0, str(Path(__file__).resolve().parent / "RDK_final"))
+    from packed_crops import pack_split, packed_paths
+
+    for split in splits:
+        n = pack_split(data_root, split)
+        print(f"[packed] {split}: {n} crops -> {packed_paths(data_root, split)[0]}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Export lesion ROIs as classification crops")
+    parser.add_argument("--packed", action="store_true",
+                        help="also write each split as one packed, memory-mappable shard")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
     project_root = Path(".")
     # 使用 raw 数据根，包含原始标注
     skin = project_root / "datasets" / "raw" / "skin_cancer"
     eczema = project_root / "datasets" / "raw" / "eczema"
     out_root = project_root / "datasets" / "lesion_cls"
 
-    # 1) cancer: skin_cancer class=1
-    export_rois(skin, "train", out_root, "train", keep_classes={1}, target_label="cancer")
-    export_rois(skin, "valid", out_root, "val",   keep_classes={1}, target_label="cancer")
-    export_rois(skin, "test",  out_root, "test",  keep_classes={1}, target_label="cancer")
-
-    # 2) unknown: 先用 skin_cancer 的 benign class=0 当 unknown（先跑通）
-    export_rois(skin, "train", out_root, "train", keep_classes={0}, target_label="unknown")
-    export_rois(skin, "valid", out_root, "val",   keep_classes={0}, target_label="unknown")
-    export_rois(skin, "test",  out_root, "test",  keep_classes={0}, target_label="unknown")
-
-    # 3) eczema: eczema 数据集只有 class=0
-    export_rois(eczema, "train", out_root, "train", keep_classes={0}, target_label="eczema")
-    export_rois(eczema, "valid", out_root, "val",   keep_classes={0}, target_label="eczema")
-    export_rois(eczema, "test",  out_root, "test",  keep_classes={0}, target_label="eczema")
-
-    print("Done. Check cls_dataset/")
+    jobs = []
+    for split, out_split in [("train", "train"), ("valid", "val"), ("test", "test")]:
+        # 1) cancer: skin_cancer class=1
+        # 2) unknown: 先用 skin_cancer 的 benign class=0 当 unknown（先跑通）
+        jobs.append((skin, split, out_split, {1: "cancer", 0: "unknown"}))
+        # 3) eczema: eczema 数据集只有 class=0
+        jobs.append((eczema, split, out_split, {0: "eczema"}))
+
+    changed = export_rois(jobs, out_root, args.workers)
+    if args.packed:
+        from_scratch = not all((out_root / "packed" / f"{s}.json").exists() for s in ["train", "val", "test"])
+        if changed or from_scratch:
+            pack_splits(out_root.parent, ["train", "val", "test"])
+        else:
+            print("[packed] crops unchanged, shards up to date")
+
+    print("Done. Check datasets/lesion_cls/")
 
 if __name__ == "__main__":
     main()
@@ -1,59 +1,103 @@
 # scripts/make_lesion_dataset.py
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import random
+import hashlib
 import shutil
-from typing import Iterable
 
 from PIL import Image
 
+from build_manifest import BuildManifest, file_digest, remove_outputs, unlisted_files
+
 IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".heic", ".heif"}
 
 
+def is_plain_jpeg(src_path: Path) -> bool:
+    """JPEG that copy_to_jpg would only re-encode: RGB/gray, no EXIF rotation"""
+    try:
+        with Image.open(src_path) as im:
+            return (im.format == "JPEG" and im.mode in ("RGB", "L")
+                    and im.getexif().get(0x0112, 1) == 1)
+    except Exception:  # noqa: BLE001
+        return False
+
+
 def copy_to_jpg(src_path: Path, dst_path: Path):
-    """转换为 JPG 保存，避免 HEIC/WebP 兼容性问题"""
+    """转换为 JPG 保存，避免 HEIC/WebP 兼容性问题；普通 JPEG 直接无损复制"""
     try:
+        dst_path.parent.mkdir(parents=True, exist_ok=True)
+        if is_plain_jpeg(src_path):
+            shutil.copyfile(src_path, dst_path)
+            return True
         with Image.open(src_path) as im:
             rgb = im.convert("RGB")
-            dst_path.parent.mkdir(parents=True, exist_ok=True)
             rgb.save(dst_path, format="JPEG", quality=95)
+        return True
     except Exception as e:  # noqa: BLE001
         print(f"[warn] skip {src_path}: {e}")
+        return False
+
+
+def rewrite_label(lab_path: Path, new_lab_path: Path):
+    """所有类重写为 0（单类 lesion）；没有标签文件时写空文件"""
+    if not lab_path.exists():
+        # 有些图可能没框：写空文件也可以
+        new_lab_path.write_text("")
+        return
+
+    new_lines = []
+    for line in lab_path.read_text().splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        parts = line.split()
+        parts[0] = "0"  # YOLO: class cx cy w h
+        new_lines.append(" ".join(parts))
+    new_lab_path.write_text("\n".join(new_lines))
+
+
+def build_item(task):
+    """One output image + label; runs in a worker process"""
+    key, img_path, lab_path, new_img_path, new_lab_path = task
+    sources = [img_path] + ([lab_path] if lab_path else [])
+    digest = file_digest(sources)
+    outputs = []
+    if copy_to_jpg(img_path, new_img_path):
+        new_lab_path.parent.mkdir(parents=True, exist_ok=True)
+        if lab_path:
+            rewrite_label(lab_path, new_lab_path)
+        else:
+            new_lab_path.write_text("")
+        outputs = [new_img_path, new_lab_path]
+    return key, sources, digest, outputs
 
 
 def copy_split(src_root: Path, split: str, out_root: Path, prefix: str):
-    """把带框的数据集复制过来，并把所有类重写为 0（单类 lesion）"""
+    """把带框的数据集复制过来，并把所有类重写为 0（单类 lesion）；返回任务列表"""
     src_img = src_root / split / "images"
     src_lbl = src_root / split / "labels"
     out_img = out_root / split / "images"
     out_lbl = out_root / split / "labels"
-    out_img.mkdir(parents=True, exist_ok=True)
-    out_lbl.mkdir(parents=True, exist_ok=True)
 
-    for img_path in src_img.iterdir():
+    tasks = []
+    for img_path in sorted(src_img.iterdir()):
         if img_path.suffix.lower() not in IMG_EXTS:
             continue
 
-        new_img_name = f"{prefix}_{img_path.stem}.jpg"
-        new_img_path = out_img / new_img_name
-        copy_to_jpg(img_path, new_img_path)
-
-        lab_path = src_lbl / f"{img_path.stem}.txt"
+        new_img_path = out_img / f"{prefix}_{img_path.stem}.jpg"
         new_lab_path = out_lbl / f"{prefix}_{img_path.stem}.txt"
+        lab_path = src_lbl / f"{img_path.stem}.txt"
+        tasks.append((str(new_img_path), img_path, lab_path, new_img_path, new_lab_path))
+    return tasks
 
-        if not lab_path.exists():
-            # 有些图可能没框：写空文件也可以
-            new_lab_path.write_text("")
-            continue
 
-        new_lines = []
-        for line in lab_path.read_text().splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            parts = line.split()
-            parts[0] = "0"  # YOLO: class cx cy w h
-            new_lines.append(" ".join(parts))
-        new_lab_path.write_text("\n".join(new_lines))
+def healthy_split(name: str, ratios, seed: int) -> str:
+    """按文件名哈希稳定分配 train/val/test：新增图片不会让已有图片换组"""
+    u = int(hashlib.sha1(f"{seed}:{name}".encode()).hexdigest()[:8], 16) / 0x100000000
+    if u < ratios[0]:
+        return "train"
+    if u < ratios[0] + ratios[1]:
+        return "valid"
+    return "test"
 
 
 def split_healthy(
@@ -62,35 +106,43 @@ def split_healthy(
     ratios=(0.8, 0.1, 0.1),
     seed: int = 42,
 ):
-    """把无标签的健康胳膊图像划分为 train/val/test，并写空标签"""
+    """把无标签的健康胳膊图像划分为 train/val/test，并写空标签；返回任务列表"""
     assert abs(sum(ratios) - 1.0) < 1e-6, "ratios must sum to 1"
-    imgs = [p for p in healthy_dir.iterdir() if p.suffix.lower() in IMG_EXTS]
-    random.seed(seed)
-    random.shuffle(imgs)
-    n = len(imgs)
-    n_train = int(n * ratios[0])
-    n_val = int(n * ratios[1])
-
-    split_map = {
-        "train": imgs[:n_train],
-        "valid": imgs[n_train:n_train + n_val],
-        "test": imgs[n_train + n_val:],
-    }
-
-    for split, paths in split_map.items():
-        out_img = out_root / split / "images"
-        out_lbl = out_root / split / "labels"
-        out_img.mkdir(parents=True, exist_ok=True)
-        out_lbl.mkdir(parents=True, exist_ok=True)
-
-        for i, img_path in enumerate(paths):
-            new_img_name = f"healthy_{img_path.stem}_{i}.jpg"
-            new_img_path = out_img / new_img_name
-            copy_to_jpg(img_path, new_img_path)
-            (out_lbl / f"healthy_{img_path.stem}_{i}.txt").write_text("")
-
-    print(f"[healthy] total={n}, train={len(split_map['train'])}, "
-          f"val={len(split_map['valid'])}, test={len(split_map['test'])}")
+    imgs = sorted(p for p in healthy_dir.iterdir() if p.suffix.lower() in IMG_EXTS)
+
+    counts = {"train": 0, "valid": 0, "test": 0}
+    tasks = []
+    for img_path in imgs:
+        split = healthy_split(img_path.name, ratios, seed)
+        counts[split] += 1
+        new_img_path = out_root / split / "images" / f"healthy_{img_path.stem}.jpg"
+        new_lab_path = out_root / split / "labels" / f"healthy_{img_path.stem}.txt"
+        tasks.append((str(new_img_path), img_path, None, new_img_path, new_lab_path))
+
+    print(f"[healthy] total={len(imgs)}, train={counts['train']}, "
+          f"val={counts['valid']}, test={counts['test']}")
+    return tasks
+
+
+def build(tasks, out_root: Path, params: dict, workers: int | None = None):
+    """在进程池里处理所有任务，跳过 manifest 中未变化的图片，并删除已失效的输出"""
+    manifest = BuildManifest(out_root / ".manifest.json", params)
+    todo = [t for t in tasks if not manifest.up_to_date(t[0], [t[1]] + ([t[2]] if t[2] else []))]
+
+    removed = []
+    with ProcessPoolExecutor(workers) as pool:
+        for key, sources, digest, outputs in pool.map(build_item, todo, chunksize=16):
+            removed += manifest.record(key, sources, digest, outputs)
+    removed += manifest.prune({t[0] for t in tasks})
+    if manifest.fresh:
+        # No manifest yet: earlier builds (e.g. healthy_<stem>_<i>.jpg, split by shuffle) left files
+        # that no entry owns; the same image could otherwise sit in train and test under two names
+        dirs = [out_root / split / sub for split in ("train", "valid", "test") for sub in ("images", "labels")]
+        removed += unlisted_files(dirs, [o for t in tasks for o in (t[3], t[4])])
+    remove_outputs(removed)
+    manifest.save()
+    print(f"Rebuilt {len(todo)} image(s), {len(tasks) - len(todo)} up to date, "
+          f"removed {len(removed)} stale file(s)")
 
 
 def main():
@@ -100,11 +152,13 @@ def main():
     healthy = project_root / "datasets" / "raw" / "healthy_arm" / "images"
     out = project_root / "datasets" / "lesion_det"
 
+    tasks = []
     for split in ["train", "valid", "test"]:
-        copy_split(skin, split, out, prefix="skin")
-        copy_split(eczema, split, out, prefix="eczema")
+        tasks += copy_split(skin, split, out, prefix="skin")
+        tasks += copy_split(eczema, split, out, prefix="eczema")
 
-    split_healthy(healthy, out, ratios=(0.8, 0.1, 0.1), seed=42)
+    tasks += split_healthy(healthy, out, ratios=(0.8, 0.1, 0.1), seed=42)
+    build(tasks, out, params={"healthy_ratios": [0.8, 0.1, 0.1], "seed": 42})
 
     (out / "data.yaml").write_text(
         "train: train/images\n"